@@ -0,0 +1,504 @@
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+
+from audio_cache import PCMStream, decoded_pcm
+from devices import DEFAULT_DEVICE, get_device_profile
+from features import FeatureGraph, RunningRange, RunningTempo, normalize
+from patterns import *
+from profiling import span
+
+# ---- Brain entrainment patterns ----
+BRAIN_PATTERNS = [
+    pattern_brain_entrainment,
+    pattern_tempo_sync_pulse,
+    pattern_mood_amplitude_wave,
+    pattern_photic_stimulation,
+    pattern_theta_flow,
+    pattern_alpha_relaxation,
+    pattern_beta_focus,
+    pattern_wave_vertical,
+    pattern_zigzag,
+    pattern_gradient_rainbow,
+    pattern_fading_left_to_right,
+    pattern_fading_right_to_left,
+    pattern_alternating_rows,
+    pattern_checkerboard,
+    pattern_snake,
+    pattern_cylon,
+    pattern_diagonal_wave,
+]
+
+DEFAULT_TEMPO = 120.0
+
+# Analysis settings per quality tier. "draft" is an instant preview (the
+# editor's progressive frames and feature_summary): reduced sample rate
+# with a fast resampler, a coarse STFT and a short tempo window. "final"
+# is the full native-rate analysis.
+QUALITY_TIERS = {
+    "draft": {"sr": 11025, "res_type": "soxr_lq", "n_fft": 512, "hop_length": 512, "tempo_window": 4.0},
+    "final": {"sr": None, "res_type": "soxr_hq", "n_fft": 1024, "hop_length": 512, "tempo_window": 8.0},
+}
+
+PROGRESSIVE_CHUNK_S = 5.0  # Audio analyzed per chunk by iter_trip_chunks
+TRIP_CACHE_SIZE = 16  # generated trips kept in memory, per file, tier and device
+SUMMARY_CURVES = ("rms", "centroid", "mood_intensity")
+SUMMARY_MAX_POINTS = 512  # Curve resolution cap for feature_summary
+SUMMARY_MAX_CHARS = 12000  # feature_summary JSON budget, about 4k tokens of model context
+
+_trip_cache = OrderedDict()
+_trip_cache_lock = threading.Lock()
+
+
+def load_audio(file_path, sr=None, res_type="soxr_hq"):
+    """Mono samples of an audio file (native sample rate by default), memory-mapped from the PCM cache"""
+    print(f"Loading audio file: {file_path}")
+    with span("decode"):
+        return decoded_pcm(file_path, sr=sr, res_type=res_type)
+
+
+def render_pattern(pattern_func, step, brightness, frequency_type, mood, tempo):
+    """Apply a pattern function with the parameters it understands"""
+    if pattern_func == pattern_brain_entrainment:
+        return pattern_func(step, brightness, frequency_type, tempo)
+    elif pattern_func == pattern_tempo_sync_pulse:
+        return pattern_func(step, brightness, tempo)
+    elif pattern_func == pattern_mood_amplitude_wave:
+        return pattern_func(step, brightness, mood, tempo)
+    elif pattern_func == pattern_photic_stimulation:
+        # Use tempo to determine flash frequency
+        flash_freq = max(5.0, min(20.0, tempo / 6.0))  # 5-20 Hz range
+        return pattern_func(step, brightness, flash_freq)
+    elif pattern_func in (pattern_theta_flow, pattern_alpha_relaxation, pattern_beta_focus):
+        return pattern_func(step, brightness, tempo)
+    else:
+        # Original patterns
+        return pattern_func(step, brightness)
+
+
+def calculate_arduino_mode(frame_leds, frame_index, mood_intensity, tempo):
+    """Calculate Arduino mode (1-8) based on audio analysis and LED pattern"""
+    if not frame_leds:
+        return 1, 50, 100  # Default mode, interval, brightness
+
+    # Analyze LED activity
+    total_leds = 0
+    active_leds = 0
+    brightness_sum = 0
+    edge_leds = 0
+
+    for row_idx, row in enumerate(frame_leds):
+        for col_idx, led in enumerate(row):
+            total_leds += 1
+            if led["a"] > 0:
+                active_leds += 1
+                brightness_sum += led["a"]
+                # Check if it's an edge LED
+                if col_idx == 0 or col_idx == 15:
+                    edge_leds += 1
+
+    activity_ratio = active_leds / total_leds if total_leds > 0 else 0
+    avg_brightness = brightness_sum / active_leds if active_leds > 0 else 0
+    edge_ratio = edge_leds / max(1, active_leds)
+
+    # Calculate blink interval based on tempo and mood
+    base_interval = max(20, min(50, int(60000 / tempo)))  # BPM to ms, max 100ms
+    mood_factor = 0.5 + mood_intensity * 1.5  # 0.5x to 2.0x
+    blink_interval = int(base_interval * mood_factor)
+    blink_interval = min(50, blink_interval)  # Ensure maximum 100ms
+
+    # Calculate brightness (0-20 for safer brain entrainment)
+    brightness = int(min(20, avg_brightness * 20 / 30))
+
+    # Determine mode based on pattern characteristics
+    if activity_ratio > 0.8:
+        # High activity - use mode 1 (full strip flash) or mode 2 (color transition)
+        mode = 1 if mood_intensity < 0.5 else 2
+    elif edge_ratio > 0.3:
+        # Edge-focused pattern - use mode 3 (edge only)
+        mode = 3
+    elif activity_ratio > 0.5:
+        # Moderate activity - use mode 4 (expanding) or mode 5 (center out)
+        mode = 4 if frame_index % 2 == 0 else 5
+    elif activity_ratio > 0.2:
+        # Low activity - use mode 6 (moving dot) or mode 7 (row toggle)
+        mode = 6 if mood_intensity > 0.5 else 7
+    else:
+        # Very low activity - use mode 8 (snake)
+        mode = 8
+
+    return mode, blink_interval, brightness
+
+
+def bucket_starts(times_ms, frame_ms, frame_count):
+    """Index of the feature frame covering the start of every output frame"""
+    edges = np.arange(frame_count) * frame_ms
+    return np.clip(np.searchsorted(times_ms, edges, side="right") - 1, 0, len(times_ms) - 1)
+
+
+def aggregate(values, starts, how="mean"):
+    """
+    Reduce feature frames into output buckets with max or mean.
+
+    An empty bucket (output rate above the feature rate) repeats the
+    feature frame covering it.
+    """
+    if how == "max":
+        return np.maximum.reduceat(values, starts)
+    counts = np.maximum(np.diff(np.append(starts, len(values))), 1)
+    return np.add.reduceat(values, starts) / counts
+
+
+def frame_levels(S_db, mood_intensity, times_ms, frame_ms, frame_count):
+    """Brightness (0.1-1, from band energy peaks) and mean mood intensity per output frame"""
+    with span("aggregate"):
+        # Average energy across the row bands, per STFT frame
+        bands_per_row = S_db.shape[0] // LED_ROWS
+        band_energies = S_db[:bands_per_row * LED_ROWS].reshape(LED_ROWS, bands_per_row, -1).mean(axis=1)
+        avg_energy_db = band_energies.mean(axis=0)
+
+        starts = bucket_starts(times_ms, frame_ms, frame_count)
+
+        # Peaks drive the brightness so short hits are not averaged away
+        frame_brightness = np.clip((aggregate(avg_energy_db, starts, "max") + 80) / 80, 0.1, 1.0)
+        frame_mood = aggregate(mood_intensity, starts, "mean")
+    return frame_brightness, frame_mood
+
+
+class FrameSynthesizer:
+    """
+    Picks patterns and renders Arduino mode frames from per-frame brightness
+    and mood. The pattern state carries over between extend() calls, so a
+    track can be synthesized chunk by chunk.
+    """
+
+    def __init__(self, output_fps):
+        self.frame_ms = 1000 / output_fps
+        self.pattern_change_interval = max(1, round(0.6 * output_fps))  # Change pattern every 0.6s
+        self.mood_window = max(1, round(0.12 * output_fps))  # Mood averaged over ~120ms for the brain frequency
+        self.current_pattern_func = random.choice(BRAIN_PATTERNS)
+        self.current_frequency_type = 'alpha'  # Default brain frequency
+        self.frame_index = 0
+        self.recent_moods = np.zeros(0)  # Tail of the previous chunk inside the mood window
+
+    def extend(self, frame_brightness, frame_mood, tempo):
+        """Render the next len(frame_brightness) frames; returns (frames, frame_moods)"""
+        frames = []
+        frame_moods = []  # Store mood data for each frame
+        history = np.concatenate([self.recent_moods, frame_mood])
+        offset = len(self.recent_moods)
+
+        with span("patterns"):
+            for i in range(len(frame_brightness)):
+                t_idx = self.frame_index + i
+
+                # Every N frames, pick a new pattern
+                if t_idx % self.pattern_change_interval == 0:
+                    self.current_pattern_func = random.choice(BRAIN_PATTERNS)
+
+                    # Select brain frequency based on mood
+                    avg_mood = np.mean(history[max(0, offset + i + 1 - self.mood_window):offset + i + 1])
+                    if avg_mood < 0.3:
+                        self.current_frequency_type = 'theta'  # Calm -> theta for meditation
+                    elif avg_mood < 0.6:
+                        self.current_frequency_type = 'alpha'  # Moderate -> alpha for relaxation
+                    else:
+                        self.current_frequency_type = 'beta'   # Energetic -> beta for focus
+
+                brightness = frame_brightness[i]
+
+                # Get current mood intensity
+                current_mood = frame_mood[i]
+                frame_moods.append(current_mood)  # Store mood for this frame
+
+                step = t_idx % 16  # Pattern animation steps
+
+                # Apply the pattern function with enhanced parameters
+                with span("synthesis"):
+                    frame_leds = render_pattern(
+                        self.current_pattern_func, step, brightness, self.current_frequency_type, current_mood, tempo
+                    )
+
+                # Calculate Arduino mode for this frame
+                with span("mode"):
+                    mode, blink_interval, brightness = calculate_arduino_mode(frame_leds, t_idx, current_mood, tempo)
+
+                # Store simplified frame data with only mode information
+                frames.append({
+                    "time": int(t_idx * self.frame_ms),
+                    "mode": mode,
+                    "blink_interval": blink_interval,
+                    "brightness": brightness
+                })
+
+        self.frame_index += len(frames)
+        self.recent_moods = history[len(history) - (self.mood_window - 1):] if self.mood_window > 1 else np.zeros(0)
+        return frames, frame_moods
+
+
+def generate_beat_frames(y, sr, hop_length=512, n_fft=1024, features=None, device=None, output_fps=None):
+    """
+    Headless brain entrainment pipeline behind LEDVisualizer.generate_led_frames_at_beats.
+
+    Frames are synthesized at the output rate of the device profile (or
+    output_fps) rather than once per STFT hop: features are aggregated into
+    one bucket per output frame, so frame timing no longer depends on the
+    input file's sample rate.
+
+    Returns a dict with the Arduino mode frames, per-frame mood intensity,
+    the detected tempo and the total duration. Features come from a lazy
+    FeatureGraph (pass one in to share it), and every stage runs in a
+    profiling span, see profiling.PROFILER.
+    """
+    if features is None:
+        features = FeatureGraph(y, sr, hop_length=hop_length, n_fft=n_fft)
+    output_fps = output_fps or get_device_profile(device)["max_fps"]
+    frame_ms = 1000 / output_fps
+
+    print("Detecting tempo...")
+    tempo = features["tempo"]
+    print(f"Estimated BPM: {tempo:.2f}")
+    if tempo <= 0:
+        # Beatless audio (drones, sweeps); the patterns divide by the tempo
+        print(f"No beat found, using {DEFAULT_TEMPO:.0f} BPM")
+        tempo = DEFAULT_TEMPO
+
+    # ---- Enhanced audio analysis ----
+    S_db = features["stft_db"]
+    mood_intensity = features["mood_intensity"]  # 0-1 scale
+    times_ms = features["times_ms"]
+
+    duration_ms = len(y) / sr * 1000
+    frame_count = max(1, int(duration_ms // frame_ms))
+    frame_brightness, frame_mood = frame_levels(S_db, mood_intensity, times_ms, frame_ms, frame_count)
+
+    frames, frame_moods = FrameSynthesizer(output_fps).extend(frame_brightness, frame_mood, tempo)
+
+    print(f"Generated {len(frames)} frames at {output_fps} fps with brain entrainment patterns")
+    print(f"Average mood intensity: {np.mean(mood_intensity):.2f}")
+
+    return {
+        "frames": frames,
+        "frame_moods": frame_moods,
+        "tempo": tempo,
+        "output_fps": output_fps,
+        "total_duration_ms": frames[-1]["time"],
+    }
+
+
+def _trip_cache_key(file_path, quality, device):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, quality, device or DEFAULT_DEVICE)
+
+
+def cached_trip(file_path, quality="final", device=None):
+    """The cached trip for this file and tier, or None"""
+    key = _trip_cache_key(file_path, quality, device)
+    with _trip_cache_lock:
+        if key in _trip_cache:
+            _trip_cache.move_to_end(key)
+            return _trip_cache[key]
+    return None
+
+
+def generate_trip(file_path, quality="final", device=None):
+    """
+    Decode and analyze a file at one quality tier (see QUALITY_TIERS).
+
+    Both tiers return the same result dict as generate_beat_frames, plus
+    "quality", and are cached independently.
+    """
+    trip = cached_trip(file_path, quality, device)
+    if trip is not None:
+        return trip
+
+    tier = QUALITY_TIERS[quality]
+    with span(quality):
+        y, sr = load_audio(file_path, sr=tier["sr"], res_type=tier["res_type"])
+        features = FeatureGraph(
+            y, sr, hop_length=tier["hop_length"], n_fft=tier["n_fft"], tempo_window=tier["tempo_window"]
+        )
+        trip = generate_beat_frames(y, sr, features=features, device=device)
+    trip["quality"] = quality
+    _cache_trip(file_path, quality, device, trip)
+    return trip
+
+
+def _cache_trip(file_path, quality, device, trip):
+    with _trip_cache_lock:
+        _trip_cache[_trip_cache_key(file_path, quality, device)] = trip
+        while len(_trip_cache) > TRIP_CACHE_SIZE:
+            _trip_cache.popitem(last=False)
+
+
+def progressive_tier(quality):
+    """Cache name of a trip generated by iter_trip_chunks at a tier"""
+    return f"{quality}-progressive"
+
+
+def iter_trip_chunks(file_path, quality="final", device=None, chunk_s=PROGRESSIVE_CHUNK_S):
+    """
+    Analyze a file progressively, yielding every chunk of frames as soon as it is ready.
+
+    The audio is decoded and analyzed chunk_s at a time, so the first chunk
+    arrives after a few seconds instead of after the whole track. Each chunk
+    is a dict with the new "frames" and "frame_moods", the tempo estimated so
+    far, "generated_ms" (end of the generated part), the whole track's
+    "total_frames" and "total_duration_ms", and "complete".
+
+    Tempo and normalization ranges are refined as more of the track is seen,
+    so frames can differ slightly from generate_trip. The whole trip is
+    cached before the last chunk is yielded, under its own tier name
+    (progressive_tier(quality)) so it never stands in for generate_trip's.
+    """
+    tier = QUALITY_TIERS[quality]
+    output_fps = get_device_profile(device)["max_fps"]
+    frame_ms = 1000 / output_fps
+
+    print(f"Loading audio file: {file_path}")
+    stream = PCMStream(file_path)
+    sr = tier["sr"] or stream.sr
+    total_frames = max(1, int(stream.length / stream.sr * 1000 // frame_ms))
+    chunk_frames = max(1, round(chunk_s * output_fps))
+
+    synthesizer = FrameSynthesizer(output_fps)
+    running_tempo = RunningTempo(sr, hop_length=tier["hop_length"], tempo_window=tier["tempo_window"])
+    ranges = {name: RunningRange() for name in ("rms", "centroid", "rolloff")}
+    loudest = 0.0
+    tempo = DEFAULT_TEMPO
+    frames = []
+    frame_moods = []
+
+    blocks = stream.blocks(round(chunk_frames * stream.sr / output_fps))
+    pending = []
+    pending_samples = 0
+    consumed = 0  # Native samples handed to earlier chunks
+    first = 0
+    while first < total_frames:
+        last = min(first + chunk_frames, total_frames)
+        # Chunks end on output frame boundaries; the last one takes the rest of the track
+        final = last == total_frames
+        needed = round(last * stream.sr / output_fps) - consumed
+        while pending_samples < needed or final:
+            block = next(blocks, None)
+            if block is None:
+                break
+            pending.append(block)
+            pending_samples += len(block)
+        samples = np.concatenate(pending) if pending else np.zeros(0, dtype=np.float32)
+        y = samples if final else samples[:needed]
+        pending = [samples[len(y):]]
+        pending_samples = len(pending[0])
+        consumed += len(y)
+
+        with span(quality):
+            if sr != stream.sr:
+                with span("resample"):
+                    y = librosa.resample(y, orig_sr=stream.sr, target_sr=sr, res_type=tier["res_type"])
+            if len(y) < tier["n_fft"]:
+                y = np.pad(y, (0, tier["n_fft"] - len(y)))
+            features = FeatureGraph(
+                y, sr, hop_length=tier["hop_length"], n_fft=tier["n_fft"], tempo_window=tier["tempo_window"]
+            )
+
+            with span("tempo"):
+                estimate = running_tempo.update(features["onset"])
+            if estimate > 0:
+                tempo = estimate  # Until the first beat, patterns run at DEFAULT_TEMPO
+
+            # Relative to the loudest and quietest parts heard so far
+            S = features["stft"]
+            loudest = max(loudest, float(S.max()))
+            S_db = librosa.amplitude_to_db(S, ref=loudest or 1.0)
+            mood_intensity = sum(ranges[name].normalize(features[name]) for name in ranges) / 3
+
+            frame_brightness, frame_mood = frame_levels(
+                S_db, mood_intensity, features["times_ms"], frame_ms, last - first
+            )
+            new_frames, new_moods = synthesizer.extend(frame_brightness, frame_mood, tempo)
+
+        frames.extend(new_frames)
+        frame_moods.extend(new_moods)
+        first = last
+
+        if final:
+            print(f"Generated {len(frames)} frames at {output_fps} fps, BPM {tempo:.2f}")
+            _cache_trip(file_path, progressive_tier(quality), device, {
+                "frames": frames,
+                "frame_moods": frame_moods,
+                "tempo": tempo,
+                "output_fps": output_fps,
+                "total_duration_ms": frames[-1]["time"],
+                "quality": progressive_tier(quality),
+            })
+
+        yield {
+            "frames": new_frames,
+            "frame_moods": new_moods,
+            "tempo": tempo,
+            "output_fps": output_fps,
+            "quality": progressive_tier(quality),
+            "generated_ms": int(first * frame_ms),
+            "total_frames": total_frames,
+            "total_duration_ms": int((total_frames - 1) * frame_ms),
+            "complete": final,
+        }
+
+
+def downsample_curve(values, points):
+    """Mean of values over `points` equal spans, scaled to integers 0-100"""
+    values = np.asarray(values, dtype=np.float64)
+    points = max(1, min(points, len(values)))
+    starts = np.linspace(0, len(values), points, endpoint=False).astype(int)
+    return [int(v) for v in np.rint(normalize(aggregate(values, starts)) * 100)]
+
+
+def feature_summary(file_path, quality="draft", max_chars=SUMMARY_MAX_CHARS):
+    """
+    Compact description of a track for the frame generation models.
+
+    Tempo, the beat grid and RMS, spectral centroid and mood intensity curves
+    downsampled to integers 0-100, instead of the audio itself. The curve
+    resolution is halved (and the individual beats dropped in favor of the
+    grid) until the JSON fits in max_chars, so long tracks still fit in the
+    model's context.
+    """
+    tier = QUALITY_TIERS[quality]
+    with span("summary"):
+        y, sr = load_audio(file_path, sr=tier["sr"], res_type=tier["res_type"])
+        features = FeatureGraph(
+            y, sr, hop_length=tier["hop_length"], n_fft=tier["n_fft"], tempo_window=tier["tempo_window"]
+        )
+        beats_ms = (librosa.frames_to_time(features["beats"], sr=sr, hop_length=tier["hop_length"]) * 1000)
+        beats_ms = [int(t) for t in beats_ms]
+        curves = {name: features[name] for name in SUMMARY_CURVES}
+
+    tempo = features["tempo"]
+    summary = {
+        "duration_ms": int(len(y) / sr * 1000),
+        "tempo_bpm": round(tempo, 1),
+        "beat_grid": {
+            "first_ms": beats_ms[0] if beats_ms else 0,
+            "period_ms": int(np.median(np.diff(beats_ms))) if len(beats_ms) > 1 else 0,
+            "count": len(beats_ms),
+        },
+        "beats_ms": beats_ms,
+        "curves": {},
+    }
+
+    points = SUMMARY_MAX_POINTS
+    while True:
+        summary["curves"] = {name: downsample_curve(values, points) for name, values in curves.items()}
+        summary["curve_step_ms"] = summary["duration_ms"] // max(1, len(summary["curves"]["rms"]))
+        encoded = json.dumps(summary, separators=(",", ":"))
+        if len(encoded) <= max_chars or points <= 16:
+            return summary
+        if "beats_ms" in summary:
+            del summary["beats_ms"]  # The grid alone still gives the model the pulse
+        else:
+            points //= 2
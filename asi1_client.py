@@ -0,0 +1,168 @@
+"""
+Async client for the ASI1 chat completions API, for serving many booth
+visitors at once.
+
+One aiohttp session per client keeps a pool of keep-alive connections,
+every request has a timeout, and at most max_concurrency requests are in
+flight; the rest wait their turn without blocking the event loop. Timeouts,
+connection errors, 429 and 5xx responses are retried with exponential
+backoff (honoring Retry-After), other errors raise APIError.
+
+    async with ASI1Client(api_key) as client:
+        results = await asyncio.gather(*(client.choose_trip(text) for text in sentences))
+
+choose_trip() is the whole mood flow: the local classifier, then the
+response cache, then the model with the choose_trip tool.
+"""
+import asyncio
+import json
+import os
+import random
+
+import aiohttp
+
+from llm_cache import ResponseCache
+from mood_classifier import MIN_CONFIDENCE, MOODS, classify_mood, tool_call_message
+
+BASE_URL = os.environ.get("ASI1_BASE_URL", "https://api.asi1.ai/v1")
+MODEL = "asi1-mini"
+
+MAX_CONCURRENCY = 8  # Requests in flight per client
+POOL_SIZE = 16  # Connections kept open per client
+CONNECT_TIMEOUT_S = 10
+TOTAL_TIMEOUT_S = 60
+MAX_RETRIES = 3
+BACKOFF_S = 0.5  # First retry delay, doubled on every attempt, plus jitter
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+CHOOSE_TRIP_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "choose_trip",
+        "description": "Selects a trip based on the user's mood.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "mood": {
+                    "type": "string",
+                    "enum": MOODS
+                }
+            },
+            "required": ["mood"]
+        }
+    }
+}
+
+SYSTEM_PROMPT = (
+    "You are a wellness assistant in LED sunglasses. "
+    "When a user describes how they feel, you detect their mood and call choose_trip with it."
+)
+
+
+class APIError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def mood_from_message(message):
+    """The mood of the first choose_trip tool call in an assistant message, or None"""
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        if function.get("name") != "choose_trip":
+            continue
+        try:
+            mood = json.loads(function.get("arguments") or "{}").get("mood")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        if mood in MOODS:
+            return mood
+    return None
+
+
+class ASI1Client:
+    def __init__(self, api_key=None, base_url=BASE_URL, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES,
+                 cache=None):
+        self.api_key = api_key or os.environ.get("ASI1_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.cache = cache  # ResponseCache for choose_trip; a default one is opened on first use
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=TOTAL_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._session
+
+    async def chat(self, payload):
+        """POST payload to /chat/completions and return the decoded response"""
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    async with self._get_session().post(url, json=payload) as response:
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        text = await response.text()
+                        if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                            raise APIError(f"API call failed ({response.status}): {text[:200]}", response.status)
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise APIError(f"API call failed: {e!r}") from e
+
+            delay = BACKOFF_S * 2 ** attempt * (1 + random.random() * 0.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def choose_trip(self, text, system_prompt=SYSTEM_PROMPT):
+        """
+        Mood for a visitor's sentence.
+
+        Returns a dict with "mood" (None if the model did not call choose_trip),
+        "source" ("local", "cache" or "api") and the assistant "message".
+        """
+        mood, confidence = classify_mood(text)
+        if confidence >= MIN_CONFIDENCE:
+            return {"mood": mood, "source": "local", "message": tool_call_message(mood)}
+
+        payload = {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text},
+            ],
+            "tools": [CHOOSE_TRIP_TOOL],
+            "temperature": 0.7,
+            "max_tokens": 1024
+        }
+        if self.cache is None:
+            self.cache = ResponseCache()
+        message = self.cache.get(payload)
+        if message is not None:
+            return {"mood": mood_from_message(message), "source": "cache", "message": message}
+
+        response = await self.chat(payload)
+        message = response["choices"][0]["message"]
+        self.cache.put(payload, message)
+        return {"mood": mood_from_message(message), "source": "api", "message": message}
@@ -0,0 +1,220 @@
+"""
+On-disk cache of decoded audio, shared by analysis and playback.
+
+Decoded mono float32 PCM is stored as .npy files named after the SHA-1 of
+the audio file's contents, so a renamed or re-downloaded copy of a track
+still hits. Files are opened with np.load(mmap_mode="r"): reopening a long
+track skips the MP3 decode and only pages in the samples that are read.
+
+    y, sr = decoded_pcm("song.mp3")              # native rate, memory-mapped
+    y, sr = decoded_pcm("song.mp3", sr=11025)    # resampled from the cached copy
+
+    stream = PCMStream("song.mp3")               # native rate, block by block
+    for block in stream.blocks(stream.sr * 10):
+        ...
+
+The least recently used files are evicted once the cache grows past
+MAX_CACHE_BYTES. Tracks that would take more than MAX_ENTRY_BYTES decoded
+are not cached at all (one long file would evict everything else); they
+are decoded straight to the requested rate every time.
+"""
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+from profiling import span
+
+CACHE_DIR = os.environ.get(
+    "CHROMAMIND_PCM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "chromamind", "pcm")
+)
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+MAX_ENTRY_BYTES = MAX_CACHE_BYTES // 4  # About 48 minutes at 44.1 kHz
+COMPRESSED_EXPANSION = 12  # Decoded float32 bytes per file byte, for formats soundfile can't size (128 kbps MP3)
+HASH_CHUNK_BYTES = 1024 * 1024
+MAX_HASHES = 256
+
+_hashes = OrderedDict()  # (abspath, mtime_ns, size) -> sha1, so unchanged files are hashed once
+_hashes_lock = threading.Lock()
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def content_hash(file_path):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _hashes_lock:
+        if key in _hashes:
+            _hashes.move_to_end(key)
+            return _hashes[key]
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    with _hashes_lock:
+        _hashes[key] = digest.hexdigest()
+        while len(_hashes) > MAX_HASHES:
+            _hashes.popitem(last=False)
+    return _hashes[key]
+
+
+def decoded_bytes(file_path):
+    """Estimated size of the track's native-rate mono float32 PCM"""
+    try:
+        return sf.info(file_path).frames * 4
+    except (sf.LibsndfileError, RuntimeError):
+        return os.path.getsize(file_path) * COMPRESSED_EXPANSION
+
+
+def cacheable(file_path):
+    return decoded_bytes(file_path) <= MAX_ENTRY_BYTES
+
+
+def _lock(name):
+    """One lock per cache entry, so concurrent loads of a track decode it once"""
+    with _locks_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def _open(path):
+    os.utime(path)  # mtime doubles as the LRU timestamp
+    return np.load(path, mmap_mode="r")
+
+
+def _store(path, y):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(y, dtype=np.float32))
+    os.replace(tmp_path, path)
+    evict()
+    return _open(path)
+
+
+def _native(file_path, digest):
+    """Native-rate PCM, decoded on a miss; named <hash>-native-<sr>.npy"""
+    with _lock(digest):
+        found = glob.glob(os.path.join(CACHE_DIR, f"{digest}-native-*.npy"))
+        if found:
+            sr = int(found[0].rsplit("-", 1)[1][:-len(".npy")])
+            return _open(found[0]), sr
+
+        import librosa  # Here rather than at the top, so content_hash() users don't load it
+
+        with span("file"):
+            y, sr = librosa.load(file_path, sr=None)
+        return _store(os.path.join(CACHE_DIR, f"{digest}-native-{sr}.npy"), y), sr
+
+
+def decoded_pcm(file_path, sr=None, res_type="soxr_hq"):
+    """Mono float32 samples of file_path as a read-only memmap, and their sample rate"""
+    import librosa
+
+    if not cacheable(file_path):
+        with span("file"):
+            return librosa.load(file_path, sr=sr, res_type=res_type)
+    digest = content_hash(file_path)
+    y, native_sr = _native(file_path, digest)
+    if sr is None or sr == native_sr:
+        return y, native_sr
+
+    path = os.path.join(CACHE_DIR, f"{digest}-{sr}-{res_type}.npy")
+    with _lock(path):
+        if os.path.exists(path):
+            return _open(path), sr
+        with span("resample"):
+            resampled = librosa.resample(np.asarray(y), orig_sr=native_sr, target_sr=sr, res_type=res_type)
+        return _store(path, resampled), sr
+
+
+def cache_size():
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(CACHE_DIR, "*.npy")))
+
+
+def evict(max_bytes=None):
+    """Delete least recently used files until the cache fits in max_bytes"""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.npy")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            # Open memmaps keep their pages; on Windows the delete fails and the file stays
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class PCMStream:
+    """
+    Native-rate mono PCM of a track, block by block.
+
+    A cached track is sliced from its memmap. Otherwise the file is decoded
+    incrementally with soundfile, so the first block is ready long before the
+    whole track is, and the track is stored in the cache once the last block
+    was read (unless it is too long to cache). Formats soundfile can't read
+    fall back to a full decode.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.digest = content_hash(file_path)
+        self.cacheable = cacheable(file_path)
+        self._pcm = None
+        self._file = None
+
+        found = glob.glob(os.path.join(CACHE_DIR, f"{self.digest}-native-*.npy"))
+        if found:
+            self._pcm, self.sr = decoded_pcm(file_path)
+        else:
+            try:
+                self._file = sf.SoundFile(file_path)
+                self.sr = self._file.samplerate
+            except (sf.LibsndfileError, RuntimeError):
+                self._pcm, self.sr = decoded_pcm(file_path)
+        self.length = len(self._pcm) if self._pcm is not None else self._file.frames
+
+    def blocks(self, block_samples):
+        """Yield float32 mono blocks of block_samples (the last one may be shorter)"""
+        if self._pcm is not None:
+            for start in range(0, len(self._pcm), block_samples):
+                yield self._pcm[start:start + block_samples]
+            return
+
+        decoded = []
+        try:
+            while True:
+                with span("decode"):
+                    block = self._file.read(block_samples, dtype="float32", always_2d=True)
+                block = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+                if self.cacheable:
+                    decoded.append(block)
+                if len(block) < block_samples:
+                    # Store before the last block goes out; the caller may stop right after it
+                    if self.cacheable:
+                        self._store(np.concatenate(decoded))
+                    if len(block):
+                        yield block
+                    return
+                yield block
+        finally:
+            self._file.close()
+
+    def _store(self, y):
+        path = os.path.join(CACHE_DIR, f"{self.digest}-native-{self.sr}.npy")
+        with _lock(self.digest):
+            if not os.path.exists(path):
+                _store(path, y)
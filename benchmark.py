@@ -0,0 +1,296 @@
+"""
+End-to-end benchmark for the brain entrainment pipeline.
+
+Synthesizes deterministic audio offline (click tracks at known BPMs, sine
+sweeps, noise bursts), writes it to a temporary WAV and runs decode plus
+generate_beat_frames headlessly. Every case runs in a fresh process so the
+reported peak RSS belongs to that case alone.
+
+    python benchmark.py
+    python benchmark.py --durations 30 120 600 --json results.json
+    python benchmark.py --baseline results.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+from profiling import format_report
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_DURATIONS = [30, 120, 600, 1800, 7200]
+DEFAULT_KINDS = ["click:120", "click:90", "click:150", "sweep", "noise"]
+CHUNK_SECONDS = 10
+TEMPO_TOLERANCE = 0.03  # 3% of the ground truth BPM
+NONLINEAR_FACTOR = 1.25  # per-minute cost growth that counts as non-linear
+
+
+# ---- Synthetic audio ----
+
+def synth_click(start, count, sr, bpm):
+    """Decaying 1 kHz clicks on every beat, accented on the downbeat"""
+    t = (start + np.arange(count)) / sr
+    beat_period = 60.0 / bpm
+    beat_index = np.floor(t / beat_period)
+    since_beat = t - beat_index * beat_period
+    envelope = np.exp(-since_beat * 200.0) * (since_beat < 0.03)
+    accent = np.where(beat_index % 4 == 0, 1.0, 0.6)
+    return 0.8 * accent * envelope * np.sin(2 * np.pi * 1000.0 * since_beat)
+
+
+def synth_sweep(start, count, sr, period=30.0, f0=40.0, f1=8000.0):
+    """Repeating logarithmic sine sweep from f0 to f1 every period seconds"""
+    t = ((start + np.arange(count)) / sr) % period
+    k = math.log(f1 / f0) / period
+    phase = 2 * np.pi * f0 * (np.exp(k * t) - 1) / k
+    return 0.5 * np.sin(phase)
+
+
+def synth_noise(start, count, sr, seed=1234):
+    """Seeded white noise bursts of 200 ms with per-second random gain"""
+    # Seed per chunk so the signal does not depend on the chunk size
+    chunk = start // (sr * CHUNK_SECONDS)
+    rng = np.random.default_rng([seed, chunk + 1])
+    t = (start + np.arange(count)) / sr
+    seconds = np.floor(t).astype(np.int64)
+    gains = np.random.default_rng([seed, 0]).uniform(0.2, 0.9, size=int(seconds[-1]) + 1)
+    gate = (t - seconds) < 0.2
+    return gains[seconds] * gate * rng.uniform(-1.0, 1.0, size=count)
+
+
+def parse_kind(kind):
+    """'click:120' -> (synth function, ground truth BPM)"""
+    name, _, arg = kind.partition(":")
+    if name == "click":
+        bpm = float(arg or 120)
+        return (lambda start, count, sr: synth_click(start, count, sr, bpm)), bpm
+    if name == "sweep":
+        return synth_sweep, None
+    if name == "noise":
+        return synth_noise, None
+    raise ValueError(f"Unknown signal kind: {kind}")
+
+
+def write_synthetic_wav(path, kind, duration_s, sr):
+    """Stream the signal to a 16-bit mono WAV in chunks, in constant memory"""
+    synth, _ = parse_kind(kind)
+    total = int(duration_s * sr)
+    chunk = CHUNK_SECONDS * sr
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        for start in range(0, total, chunk):
+            count = min(chunk, total - start)
+            samples = np.clip(synth(start, count, sr), -1.0, 1.0)
+            wav.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+# ---- Benchmark cases ----
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def check_tempo(detected, expected):
+    if expected is None:
+        return "n/a"
+    if abs(detected - expected) <= expected * TEMPO_TOLERANCE:
+        return "ok"
+    for factor in (0.5, 2.0):
+        if abs(detected - expected * factor) <= expected * factor * TEMPO_TOLERANCE:
+            return "octave"
+    return "FAIL"
+
+
+def run_case(kind, duration_s, sr, trace_memory=False):
+    """Run one case end to end; meant to be called in a fresh process"""
+    import audio_cache
+    from analysis import generate_beat_frames, iter_trip_chunks, load_audio
+    from profiling import PROFILER
+
+    PROFILER.trace_memory(trace_memory)
+
+    _, expected_bpm = parse_kind(kind)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.wav")
+        audio_cache.CACHE_DIR = os.path.join(tmp, "pcm")  # Always measure a cold decode
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            # Untimed warm-up so lazy imports and numba JIT don't count as pipeline cost
+            write_synthetic_wav(path, "click:120", 2, sr)
+            generate_beat_frames(*load_audio(path))
+
+            write_synthetic_wav(path, kind, duration_s, sr)
+            random.seed(0)
+            PROFILER.reset()
+            start = time.perf_counter()
+            result = generate_beat_frames(*load_audio(path))
+            wall = time.perf_counter() - start
+            # Top-level stages only; nested spans are in PROFILER.report()
+            stages = {path: wall_s for path, wall_s in PROFILER.stage_times().items() if "/" not in path}
+            spans = PROFILER.results()
+
+            # Time to first light: first chunk of progressive analysis, again from a cold decode
+            audio_cache.CACHE_DIR = os.path.join(tmp, "pcm-progressive")
+            start = time.perf_counter()
+            chunks = iter_trip_chunks(path)
+            next(chunks)
+            first_chunk = time.perf_counter() - start
+            chunks.close()
+
+    return {
+        "name": f"{kind}@{duration_s}s",
+        "kind": kind,
+        "duration_s": duration_s,
+        "wall_s": wall,
+        "first_chunk_s": first_chunk,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+        "spans": spans,
+        "frames": len(result["frames"]),
+        "tempo": result["tempo"],
+        "expected_tempo": expected_bpm,
+        "tempo_check": check_tempo(result["tempo"], expected_bpm),
+    }
+
+
+def run_isolated(kind, duration_s, sr, trace_memory=False):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, kind, duration_s, sr, trace_memory).result()
+
+
+# ---- Reporting ----
+
+def print_report(results):
+    stage_names = []
+    for result in results:
+        for name in result["stages"]:
+            if name not in stage_names:
+                stage_names.append(name)
+
+    header = f"{'case':<20}{'wall s':>9}{'1st chunk':>11}{'s/min':>8}{'RSS MB':>9}{'frames':>10}{'BPM':>8}  tempo"
+    widths = [max(11, len(name) + 2) for name in stage_names]
+    print(header + "".join(f"{name:>{width}}" for name, width in zip(stage_names, widths)))
+    for result in results:
+        per_min = result["wall_s"] / (result["duration_s"] / 60)
+        rss = result["peak_rss_mb"]
+        line = (
+            f"{result['name']:<20}{result['wall_s']:>9.2f}{result.get('first_chunk_s', 0.0):>11.2f}{per_min:>8.2f}"
+            f"{(f'{rss:.0f}' if rss is not None else '-'):>9}{result['frames']:>10}"
+            f"{result['tempo']:>8.1f}  {result['tempo_check']:<5}"
+        )
+        print(line + "".join(f"{result['stages'].get(name, 0.0):>{width}.2f}" for name, width in zip(stage_names, widths)))
+
+
+def print_scaling(series):
+    """Flag the first track length where cost per audio minute stops being flat"""
+    if len(series) < 2:
+        return
+    base = series[0]["wall_s"] / series[0]["duration_s"]
+    print("\nScaling (cost per audio second relative to shortest track):")
+    for result in series:
+        ratio = (result["wall_s"] / result["duration_s"]) / base
+        flag = "  <-- non-linear" if ratio > NONLINEAR_FACTOR else ""
+        print(f"  {result['duration_s']:>6}s  x{ratio:.2f}{flag}")
+
+
+def compare_baseline(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous is None:
+            continue
+        if result["wall_s"] > previous["wall_s"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: {previous['wall_s']:.2f}s -> {result['wall_s']:.2f}s")
+        if result["tempo_check"] != previous["tempo_check"]:
+            regressions.append(f"{result['name']}: tempo {previous['tempo_check']} -> {result['tempo_check']}")
+
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LED frame pipeline on synthetic audio")
+    parser.add_argument("--durations", type=int, nargs="+", default=DEFAULT_DURATIONS,
+                        help="track lengths in seconds for the scaling series")
+    parser.add_argument("--max-duration", type=int, default=None,
+                        help="skip scaling cases longer than this many seconds")
+    parser.add_argument("--kinds", nargs="+", default=DEFAULT_KINDS,
+                        help="signals run at the shortest duration, e.g. click:120 sweep noise")
+    parser.add_argument("--sr", type=int, default=44100, help="sample rate of the synthetic WAVs")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the nested profiling spans of every case")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record tracemalloc peaks per span (slows the pipeline down)")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed wall time growth over the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    durations = sorted(d for d in args.durations if args.max_duration is None or d <= args.max_duration)
+    if not durations:
+        parser.error("no durations left to run")
+
+    results = []
+    for kind in args.kinds:
+        print(f"Running {kind} @ {durations[0]}s...", flush=True)
+        results.append(run_isolated(kind, durations[0], args.sr, args.trace_memory))
+
+    series = [results[0]]
+    for duration in durations[1:]:
+        print(f"Running {args.kinds[0]} @ {duration}s...", flush=True)
+        result = run_isolated(args.kinds[0], duration, args.sr, args.trace_memory)
+        results.append(result)
+        series.append(result)
+
+    if args.profile:
+        for result in results:
+            print(f"\n{result['name']}")
+            print(format_report(result["spans"]))
+
+    print()
+    print_report(results)
+    print_scaling(series)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"sr": args.sr, "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.json_path}")
+
+    failed = [r["name"] for r in results if r["tempo_check"] == "FAIL"]
+    if failed:
+        print(f"\nTempo mismatch: {', '.join(failed)}")
+
+    regressions = compare_baseline(results, args.baseline, args.tolerance) if args.baseline else []
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Output device profiles.
+
+Each profile describes the LED geometry of a device and the fastest rate it
+can physically take updates at. Frame generation targets max_fps, so no work
+is spent on frames the device would drop.
+"""
+
+DEVICE_PROFILES = {
+    # ESP8266/ESP32 glasses over WebSocket; the editor sends at most
+    # max_fps mode changes per second
+    "glasses": {"rows": 2, "cols": 16, "max_fps": 10},
+}
+
+DEFAULT_DEVICE = "glasses"
+
+
+def get_device_profile(name=None):
+    name = name or DEFAULT_DEVICE
+    if name not in DEVICE_PROFILES:
+        raise ValueError(f"Unknown device profile: {name}")
+    return DEVICE_PROFILES[name]
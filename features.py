@@ -0,0 +1,190 @@
+"""
+Lazy, memoized audio feature graph.
+
+Each feature is a node that declares the nodes it is computed from:
+
+    stft -> stft_db, rms, centroid, rolloff -> mood_intensity
+    onset -> tempo -> beats
+
+A FeatureGraph is created per track and computes a node only the first time
+a generator asks for it, so a generator that only needs the tempo never pays
+for the STFT, and a new pattern input never slows down unrelated generators.
+
+    features = FeatureGraph(y, sr)
+    tempo = features["tempo"]
+
+RunningTempo and RunningRange refine the tempo and the normalization range
+chunk by chunk, for analysis that publishes frames before it has seen the
+whole track.
+"""
+import librosa
+import numpy as np
+
+from profiling import span
+
+# name -> (dependency names, compute function)
+FEATURES = {}
+
+
+def feature(*dependencies):
+    """Register a node; the function gets the graph and its dependency values"""
+    def register(func):
+        FEATURES[func.__name__] = (dependencies, func)
+        return func
+    return register
+
+
+def normalize(values):
+    return (values - values.min()) / (values.max() - values.min() + 1e-6)
+
+
+class FeatureGraph:
+    def __init__(self, y, sr, hop_length=512, n_fft=1024, tempo_window=8.0):
+        self.y = y
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.tempo_window = tempo_window  # seconds of onset autocorrelation
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            if name not in FEATURES:
+                raise KeyError(f"Unknown feature: {name}")
+            dependencies, func = FEATURES[name]
+            inputs = [self[dependency] for dependency in dependencies]
+            with span(name):
+                self._values[name] = func(self, *inputs)
+        return self._values[name]
+
+    def computed(self):
+        """Names of the nodes computed so far"""
+        return list(self._values)
+
+
+# ---- Spectral features ----
+
+@feature()
+def stft(graph):
+    return np.abs(librosa.stft(graph.y, n_fft=graph.n_fft, hop_length=graph.hop_length))
+
+
+@feature("stft")
+def stft_db(graph, S):
+    return librosa.amplitude_to_db(S, ref=np.max)
+
+
+@feature("stft")
+def rms(graph, S):
+    return librosa.feature.rms(S=S, frame_length=graph.n_fft, hop_length=graph.hop_length)[0]
+
+
+@feature("stft")
+def centroid(graph, S):
+    return librosa.feature.spectral_centroid(S=S, sr=graph.sr, n_fft=graph.n_fft, hop_length=graph.hop_length)[0]
+
+
+@feature("stft")
+def rolloff(graph, S):
+    return librosa.feature.spectral_rolloff(S=S, sr=graph.sr, n_fft=graph.n_fft, hop_length=graph.hop_length)[0]
+
+
+@feature()
+def zero_crossings(graph):
+    return librosa.feature.zero_crossing_rate(graph.y, hop_length=graph.hop_length)[0]
+
+
+@feature("rms", "centroid", "rolloff")
+def mood_intensity(graph, rms, centroid, rolloff):
+    # High RMS + high spectral centroid + high rolloff = energetic
+    # Low values = calm/relaxed
+    return (normalize(rms) + normalize(centroid) + normalize(rolloff)) / 3
+
+
+@feature("stft")
+def times_ms(graph, S):
+    """Start time of every STFT frame in ms"""
+    times = librosa.frames_to_time(np.arange(S.shape[1]), sr=graph.sr, hop_length=graph.hop_length)
+    return (times * 1000).astype(int)
+
+
+# ---- Rhythm ----
+
+@feature()
+def onset(graph):
+    # Same envelope librosa.beat.beat_track builds internally
+    return librosa.onset.onset_strength(y=graph.y, sr=graph.sr, hop_length=graph.hop_length, aggregate=np.median)
+
+
+@feature("onset")
+def tempo(graph, onset_envelope):
+    """Tempo in BPM, 0.0 when the track has no onsets at all"""
+    if not onset_envelope.any():
+        return 0.0
+    return float(librosa.feature.tempo(
+        onset_envelope=onset_envelope, sr=graph.sr, hop_length=graph.hop_length, ac_size=graph.tempo_window
+    )[0])
+
+
+@feature("onset", "tempo")
+def beats(graph, onset_envelope, bpm):
+    """Beat positions in frames, tracked at the already estimated tempo"""
+    if bpm <= 0:
+        return np.array([], dtype=int)
+    _, beat_frames = librosa.beat.beat_track(
+        onset_envelope=onset_envelope, sr=graph.sr, hop_length=graph.hop_length, bpm=bpm
+    )
+    return beat_frames
+
+
+# ---- Incremental estimates ----
+
+class RunningRange:
+    """Min/max of everything seen so far, for normalizing chunk by chunk"""
+
+    def __init__(self):
+        self.low = np.inf
+        self.high = -np.inf
+
+    def normalize(self, values):
+        if len(values):
+            self.low = min(self.low, float(values.min()))
+            self.high = max(self.high, float(values.max()))
+        return (values - self.low) / (self.high - self.low + 1e-6)
+
+
+class RunningTempo:
+    """
+    Tempo over all onsets seen so far.
+
+    Keeps the sum of the tempogram frames instead of the envelope itself, so
+    each update only costs a tempogram of the new chunk (plus half a window
+    of context) and the estimate is the one librosa.feature.tempo would give
+    for the mean tempogram of the whole prefix.
+    """
+
+    def __init__(self, sr, hop_length=512, tempo_window=8.0):
+        self.sr = sr
+        self.hop_length = hop_length
+        self.win_length = int(librosa.time_to_frames(tempo_window, sr=sr, hop_length=hop_length))
+        self.context = np.zeros(0)
+        self.tg_sum = np.zeros((self.win_length, 1))
+        self.count = 0
+
+    def update(self, onset_envelope):
+        """Add a chunk's onset envelope; returns the tempo in BPM, 0.0 while there are no onsets"""
+        envelope = np.concatenate([self.context, onset_envelope])
+        # Tempogram frames are centered, so half a window of history is all they look back
+        self.context = envelope[-(self.win_length // 2):]
+        if len(onset_envelope):
+            tg = librosa.feature.tempogram(
+                onset_envelope=envelope, sr=self.sr, hop_length=self.hop_length, win_length=self.win_length
+            )[:, -len(onset_envelope):]
+            self.tg_sum += tg.sum(axis=1, keepdims=True)
+            self.count += tg.shape[1]
+
+        if not self.count or not self.tg_sum.any():
+            return 0.0
+        return float(librosa.feature.tempo(
+            tg=self.tg_sum / self.count, sr=self.sr, hop_length=self.hop_length, aggregate=None
+        )[0])
@@ -0,0 +1,147 @@
+"""
+Client for the frame generation API used by main.py.
+
+The audio file is streamed into the multipart request body block by block,
+so an upload never holds the whole file in memory, over a pooled keep-alive
+session with timeouts. Responses are cached on disk under the hash of the
+audio contents and the API URL: opening a track that was already sent skips
+the upload entirely.
+
+    frames = fetch_frames("song.mp3", api_key, "https://api.asi1.ai/v1")
+
+With payload="features" the file is not uploaded at all: a JSON feature
+summary of a few kB (see analysis.feature_summary) is posted instead, as
+{"features": {...}}. That body is a server-side addition to the frames
+API; an API that rejects it (FEATURES_UNSUPPORTED_STATUSES) gets the audio
+upload instead, and is remembered for the rest of the session.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+from audio_cache import content_hash
+from http_session import get_session
+
+CACHE_DIR = os.environ.get(
+    "CHROMAMIND_FRAME_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "chromamind", "frames")
+)
+FEATURES_UNSUPPORTED_STATUSES = {400, 404, 405, 415, 422}
+
+_features_unsupported = set()  # API URLs that rejected a feature summary
+
+
+class MultipartFile:
+    """
+    File-like multipart/form-data body with a single file field.
+
+    requests sends it with a Content-Length and reads it block by block,
+    so only one block of the file is in memory at a time.
+    """
+
+    def __init__(self, field, file_path):
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', "")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._file_size = os.path.getsize(file_path)
+        self._file = open(file_path, "rb")
+        self._parts = [self._head, None, self._tail]  # None stands for the file
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self)
+        out = bytearray()
+        while self._parts and len(out) < size:
+            part = self._parts[0]
+            if part is None:
+                data = self._file.read(size - len(out))
+                if not data:
+                    self._parts.pop(0)
+                out += data
+            else:
+                taken = part[:size - len(out)]
+                out += taken
+                self._parts[0] = part[len(taken):]
+                if not self._parts[0]:
+                    self._parts.pop(0)
+        return bytes(out)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _cache_path(audio_path, api_url, payload="audio"):
+    key = f"{api_url}\n{content_hash(audio_path)}"
+    if payload != "audio":
+        key += f"\n{payload}"  # Audio keys stay as they were, so existing entries still hit
+    key = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def cached_frames(audio_path, api_url, payload="audio"):
+    """Frames from an earlier response for the same audio, API and payload, or None"""
+    path = _cache_path(audio_path, api_url, payload)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def fetch_frames(audio_path, api_key, api_url, use_cache=True, session=None, payload="audio"):
+    """
+    Send an audio file (payload="audio") or its feature summary (payload="features")
+    and return the generated frames (list of 2D LED dict arrays)
+    """
+    if payload not in ("audio", "features"):
+        raise ValueError(f"Unknown payload: {payload}")
+    if payload == "features" and api_url in _features_unsupported:
+        payload = "audio"
+    if use_cache:
+        frames = cached_frames(audio_path, api_url, payload)
+        if frames is not None:
+            print(f"Using cached frames for {audio_path}")
+            return frames
+
+    session = session or get_session()
+    if payload == "features":
+        from analysis import feature_summary  # librosa only loads when a summary is needed
+
+        headers = {"Authorization": f"Bearer {api_key}"}
+        response = session.post(api_url, headers=headers, json={"features": feature_summary(audio_path)})
+        if response.status_code in FEATURES_UNSUPPORTED_STATUSES:
+            print(f"{api_url} does not accept feature summaries ({response.status_code}), uploading the audio instead")
+            _features_unsupported.add(api_url)
+            return fetch_frames(audio_path, api_key, api_url, use_cache, session, payload="audio")
+    else:
+        with MultipartFile("audio_file", audio_path) as body:
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": body.content_type,
+            }
+            response = session.post(api_url, headers=headers, data=body)
+    response.raise_for_status()
+    frames = response.json()["frames"]
+
+    if use_cache:
+        path = _cache_path(audio_path, api_url, payload)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(frames, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    return frames
@@ -0,0 +1,38 @@
+"""
+Shared HTTP sessions for the API clients.
+
+Each thread gets one requests.Session, so repeated calls to the same host
+reuse pooled keep-alive connections instead of a new TCP/TLS handshake per
+request, and every request gets DEFAULT_TIMEOUT unless it passes its own.
+
+    from http_session import get_session
+
+    response = get_session().post(url, data=stream)
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (10, 120)  # (connect, read) seconds
+POOL_CONNECTIONS = 4  # Hosts kept in the pool
+POOL_MAXSIZE = 8  # Connections kept per host
+
+_local = threading.local()
+
+
+class TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def get_session():
+    """This thread's pooled session"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = TimeoutSession()
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
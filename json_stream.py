@@ -0,0 +1,160 @@
+"""
+Streaming JSON writer for frame lists, animations and trips.
+
+dump() writes a value as JSON while walking it, so a list of frames can be
+a generator that renders them on demand and only one frame is ever held as
+text. Dicts, lists, tuples, iterators and NumPy arrays are walked; every
+list element is encoded on its own with the json module and written
+through a small buffer. NumPy arrays are converted one row at a time with
+tolist(), and NumPy scalars inside frames are handled by the encoder's
+default hook only when one actually turns up. The same hook finds iterators
+nested at any depth (a generator inside a list inside a frame), and those
+parts are walked and streamed too; objects json can't encode raise
+TypeError as with json.dumps.
+
+    with open("trip.json", "w") as f:
+        json_stream.dump({"metadata": meta, "frames": iter_frames()}, f, indent=2)
+
+With indent the output is byte for byte what json.dump(value, f, indent=...)
+writes for the same data; indent=None writes compact JSON without spaces.
+"""
+import json
+from collections.abc import Iterator
+
+import numpy as np
+
+BUFFER_BYTES = 1 << 16
+
+
+class _Lazy(Exception):
+    """An iterator turned up inside a value being encoded in one go"""
+
+
+def _default(obj):
+    """Types json can't encode: NumPy scalars and arrays and datetimes; iterators raise _Lazy"""
+    if isinstance(obj, Iterator):
+        raise _Lazy
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if hasattr(obj, "item"):  # numpy types
+        return obj.item()
+    if hasattr(obj, "isoformat"):  # datetime objects
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _Encoder:
+    def __init__(self, indent):
+        self.indent = indent
+        if indent is None:
+            self.item_separator, self.key_separator = ",", ":"
+        else:
+            self.item_separator, self.key_separator = ",", ": "
+
+    def encode(self, value, level):
+        """Chunks of JSON text for value, nested `level` deep"""
+        if isinstance(value, dict):
+            yield from self._encode_dict(value, level)
+        elif isinstance(value, np.ndarray) and value.ndim > 1:
+            yield from self._encode_items((row for row in value), level)
+        elif isinstance(value, (list, tuple, Iterator)) and not isinstance(value, (str, bytes)):
+            yield from self._encode_items(value, level)
+        else:
+            yield self._leaf(value, level)
+
+    def _leaf(self, value, level):
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        if self.indent is None:
+            return json.dumps(value, separators=(self.item_separator, self.key_separator), default=_default)
+        text = json.dumps(value, indent=self.indent, default=_default)
+        # Raw newlines only come from the indentation; strings have theirs escaped
+        return text.replace("\n", self._newline(level)) if level else text
+
+    def _newline(self, level):
+        return "\n" + " " * (self.indent * level)
+
+    def _encode_items(self, items, level):
+        """List elements are encoded one at a time; the first decides whether the list is empty"""
+        if self.indent is None:
+            opening, separator, closing = "[", self.item_separator, "]"
+        else:
+            opening = "[" + self._newline(level + 1)
+            separator = self.item_separator + self._newline(level + 1)
+            closing = self._newline(level) + "]"
+
+        empty = True
+        for item in items:
+            yield opening if empty else separator
+            empty = False
+            if _walk(item):
+                yield from self.encode(item, level + 1)
+                continue
+            try:
+                text = self._leaf(item, level + 1)
+            except _Lazy:
+                # Something lazy deeper down: walk the element, each level trying its parts in one go
+                yield from self.encode(item, level + 1)
+            else:
+                yield text
+        yield "[]" if empty else closing
+
+    def _encode_dict(self, value, level):
+        if not value:
+            yield "{}"
+            return
+        if self.indent is None:
+            opening, separator, closing = "{", self.item_separator, "}"
+        else:
+            opening = "{" + self._newline(level + 1)
+            separator = self.item_separator + self._newline(level + 1)
+            closing = self._newline(level) + "}"
+
+        for i, (key, item) in enumerate(value.items()):
+            yield opening if i == 0 else separator
+            yield json.dumps(key if isinstance(key, str) else _key(key)) + self.key_separator
+            yield from self.encode(item, level + 1)
+        yield closing
+
+
+def _lazy(value):
+    return isinstance(value, Iterator) or (isinstance(value, np.ndarray) and value.ndim > 1)
+
+
+def _walk(item):
+    """
+    Whether a list element needs walking rather than encoding in one go (it or
+    one of its dict values is lazy). Deeper iterators are found by _default
+    while encoding, without scanning every element first.
+    """
+    if isinstance(item, dict):
+        return any(_lazy(value) for value in item.values())
+    return _lazy(item)
+
+
+def _key(key):
+    """Dict keys the way json.dumps converts them"""
+    if isinstance(key, bool) or key is None:
+        return json.dumps(key)
+    if hasattr(key, "item"):
+        key = key.item()
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def iterencode(value, indent=None):
+    """Chunks of the JSON text for value"""
+    return _Encoder(indent).encode(value, 0)
+
+
+def dump(value, f, indent=None):
+    """Write value to the text file f as JSON, holding at most one list element and BUFFER_BYTES of text"""
+    buffer = []
+    size = 0
+    for chunk in iterencode(value, indent):
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_BYTES:
+            f.write("".join(buffer))
+            buffer = []
+            size = 0
+    f.write("".join(buffer))
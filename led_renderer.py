@@ -0,0 +1,93 @@
+"""
+Image-backed LED renderer for the viewers.
+
+A frame is a (rows, cols, 3) uint8 RGB array. It is wrapped in a QImage
+without copying and scaled onto the widget in a single drawImage call, instead
+of one QColor and fillRect per LED. The cell grid overlay is rendered once
+per widget size and geometry and reused on every repaint.
+"""
+from functools import lru_cache
+
+import numpy as np
+from PyQt6.QtCore import QRect, QRectF, Qt
+from PyQt6.QtGui import QColor, QImage, QPainter, QPixmap
+
+# Arduino mode (1-8) -> preview color, index 0 is the unknown-mode gray
+MODE_PALETTE = np.array([
+    (128, 128, 128),
+    (255, 255, 255),  # 1 White
+    (255, 100, 100),  # 2 Red
+    (100, 255, 100),  # 3 Green
+    (100, 100, 255),  # 4 Blue
+    (255, 255, 100),  # 5 Yellow
+    (255, 100, 255),  # 6 Magenta
+    (100, 255, 255),  # 7 Cyan
+    (255, 150, 100),  # 8 Orange
+], dtype=np.uint8)
+
+MIN_GRID_CELL_PX = 6  # No grid lines when cells get smaller than this
+
+
+def frames_to_array(frames):
+    """Convert frames of LED dicts ([[{"r","g","b"}, ...], ...]) to an (N, rows, cols, 3) uint8 array"""
+    return np.array(
+        [[[(led["r"], led["g"], led["b"]) for led in row] for row in frame] for frame in frames],
+        dtype=np.uint8,
+    )
+
+
+@lru_cache(maxsize=1024)
+def mode_color(mode, brightness):
+    """Preview color of an Arduino mode frame, scaled by its 0-255 brightness (cached, don't modify)"""
+    rgb = MODE_PALETTE[mode if 0 < mode < len(MODE_PALETTE) else 0].tolist()
+    return QColor(*(int(c * brightness / 255.0) for c in rgb))
+
+
+def rgb_to_qimage(rgb):
+    """Wrap an (rows, cols, 3) uint8 array in a QImage sharing its memory"""
+    rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+    rows, cols, _ = rgb.shape
+    image = QImage(rgb.data, cols, rows, rgb.strides[0], QImage.Format.Format_RGB888)
+    # The QImage does not own the buffer; keep the array alive alongside it
+    image.buffer = rgb
+    return image
+
+
+class LEDImageRenderer:
+    def __init__(self, grid_color=QColor(0, 0, 0)):
+        self.grid_color = grid_color
+        self._grid = None
+        self._grid_key = None
+
+    def draw(self, painter: QPainter, rect: QRect, rgb):
+        """Scale one frame onto rect with nearest-neighbour cells, plus the cached grid"""
+        image = rgb_to_qimage(rgb)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        painter.drawImage(QRectF(rect), image)
+
+        grid = self._grid_overlay(rect.width(), rect.height(), image.height(), image.width())
+        if grid is not None:
+            painter.drawPixmap(rect.topLeft(), grid)
+
+    def _grid_overlay(self, width, height, rows, cols):
+        key = (width, height, rows, cols)
+        if key != self._grid_key:
+            self._grid_key = key
+            self._grid = None
+            if rows and cols and min(width / cols, height / rows) >= MIN_GRID_CELL_PX:
+                self._grid = self._render_grid(width, height, rows, cols)
+        return self._grid
+
+    def _render_grid(self, width, height, rows, cols):
+        pixmap = QPixmap(width, height)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setPen(self.grid_color)
+        for col in range(1, cols):
+            x = round(col * width / cols)
+            painter.drawLine(x, 0, x, height)
+        for row in range(1, rows):
+            y = round(row * height / rows)
+            painter.drawLine(0, y, width, y)
+        painter.end()
+        return pixmap
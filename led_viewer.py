@@ -1,12 +1,13 @@
 import sys
+import argparse
 import random
 import json
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QPushButton, QVBoxLayout, QFileDialog,
     QSlider, QLabel, QColorDialog, QHBoxLayout, QComboBox, QDialog,
-    QDialogButtonBox
+    QDialogButtonBox, QCheckBox
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QRect, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QPainter, QColor
 import pygame
 import threading
@@ -19,8 +20,20 @@ import requests
 import os
 
 from patterns import * 
+from analysis import cached_trip, generate_trip, iter_trip_chunks, load_audio
+from features import FeatureGraph, normalize
+import json_stream
+from devices import get_device_profile
+from led_renderer import mode_color
+from playback import AudioScrubber, PlaybackClock, PlaybackScheduler
+from timeline import TimelineWidget
+import walrus
+from walrus_chunks import MANIFEST_FORMAT, upload_chunked_trip
+from walrus_index import BlobIndex
+from profiling import PROFILER
 
 ESP32_WS_URL = "ws://10.151.240.37:81"
+PLAYBACK_READY_MS = 5000  # Generated frames needed before playback can start
 
 LED_ROWS = 2
 LED_COLS = 16
@@ -74,9 +87,96 @@ class ColorAlphaDialog(QDialog):
         self.brightness_label.setText(f"Display Brightness: {int(value * 255 / 25)}%")
 
 
+class AnalysisThread(QThread):
+    """Runs progressive trip analysis off the GUI thread, one signal per chunk"""
+    chunk_ready = pyqtSignal(int, object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, file_path, generation, quality="draft"):
+        super().__init__()
+        self.file_path = file_path
+        self.generation = generation  # Chunks from an older load are dropped by the editor
+        self.quality = quality
+        self.cancelled = False
+
+    def run(self):
+        try:
+            for chunk in iter_trip_chunks(self.file_path, self.quality):
+                if self.cancelled:
+                    break
+                self.chunk_ready.emit(self.generation, chunk)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
+class RefineThread(QThread):
+    """Runs the final analysis tier off the GUI thread, to replace a progressive trip"""
+    trip_ready = pyqtSignal(int, object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, file_path, generation):
+        super().__init__()
+        self.file_path = file_path
+        self.generation = generation
+
+    def run(self):
+        try:
+            self.trip_ready.emit(self.generation, generate_trip(self.file_path, "final"))
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
+class PCMDecodeThread(QThread):
+    """Loads a track at the mixer frequency for scrub snippets and varispeed playback"""
+    pcm_ready = pyqtSignal(str, object)
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+
+    def run(self):
+        try:
+            # Memory-mapped from the PCM cache, shared with analysis
+            y, _ = load_audio(self.file_path, sr=pygame.mixer.get_init()[0])
+            self.pcm_ready.emit(self.file_path, y)
+        except Exception as e:
+            print(f"Scrub audio decode failed: {e}")
+
+
+class WalrusUploadThread(QThread):
+    """Compresses and uploads a trip to Walrus as chunks plus a manifest, reporting bytes sent"""
+    progress = pyqtSignal(int, int)
+    uploaded = pyqtSignal(object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, upload_data, publisher_url=walrus.PUBLISHER_URL, epochs=walrus.EPOCHS, index=None):
+        super().__init__()
+        self.upload_data = upload_data
+        self.publisher_url = publisher_url
+        self.epochs = epochs
+        self.index = index  # BlobIndex; trips uploaded before resolve without a request
+
+    def report(self, sent, total):
+        # Only whole-percent steps; requests reads the body in small blocks
+        if sent * 100 // total != self._percent:
+            self._percent = sent * 100 // total
+            self.progress.emit(sent, total)
+
+    def run(self):
+        self._percent = -1
+        try:
+            # Chunked, so re-uploading an edited trip only sends the chunks that changed
+            blob = upload_chunked_trip(self.upload_data, self.publisher_url, self.epochs, index=self.index,
+                                       progress=self.report)
+            self.uploaded.emit(blob)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
 class LEDVisualizer(QWidget):
-    def __init__(self):
+    def __init__(self, profile=False):
         super().__init__()
+        self.profile = profile
         self.setWindowTitle("LED Audio Visualizer Editor")
         self.setMinimumSize(900, 500)
 
@@ -86,6 +186,17 @@ class LEDVisualizer(QWidget):
         self.selected_led = None
         self.playback_speed = 1.0
         self.tempo = 0.0
+        self.audio_path = None
+        self.analysis_threads = []
+        self.analysis_generation = 0  # Bumped on every load; stale chunks carry an older one
+        self.ws = None  # Device connection while streaming
+        self.device_interval_s = 1.0 / get_device_profile()["max_fps"]
+        self.last_device_send = 0.0
+        self.pending_device_index = None
+        self.device_send_timer = QTimer(self)
+        self.device_send_timer.setSingleShot(True)
+        self.device_send_timer.timeout.connect(self.send_pending_frame)
+        self.walrus_index = None  # Opened on the first upload
 
         self.label = QLabel("Upload an MP3 file")
         self.upload_button = QPushButton("Upload MP3")
@@ -98,6 +209,13 @@ class LEDVisualizer(QWidget):
         self.slider = QSlider(Qt.Orientation.Horizontal)
         self.slider.setEnabled(False)
         self.slider.valueChanged.connect(self.slider_changed)
+        self.slider.sliderReleased.connect(self.slider_released)
+
+        self.scrub_audio_box = QCheckBox("Scrub audio")
+        self.scrub_audio_box.toggled.connect(self.scrub_audio_toggled)
+
+        self.timeline = TimelineWidget()
+        self.timeline.seek_requested.connect(self.slider.setValue)
 
         self.speed_box = QComboBox()
         self.speed_box.addItems(["0.5x", "0.75x", "1.0x", "1.25x", "1.5x", "2.0x"])
@@ -122,6 +240,7 @@ class LEDVisualizer(QWidget):
         control_layout.addWidget(self.save_frames_button)
         control_layout.addWidget(QLabel("Speed:"))
         control_layout.addWidget(self.speed_box)
+        control_layout.addWidget(self.scrub_audio_box)
         control_layout.addWidget(self.stream_button)
         control_layout.addWidget(self.upload_walrus_button)
 
@@ -129,10 +248,17 @@ class LEDVisualizer(QWidget):
         layout.addWidget(self.label)
         layout.addLayout(control_layout)
         layout.addWidget(self.slider)
+        layout.addWidget(self.timeline)
         self.setLayout(layout)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
+        self.clock = PlaybackClock()
+        self.scheduler = PlaybackScheduler(self.clock.position_ms, self)
+        self.scheduler.frame_changed.connect(self.show_frame)
+        self.scheduler.finished.connect(self.playback_finished)
+
+        self.scrubber = AudioScrubber(self)
+        self.scrubber.seek_requested.connect(self.seek_audio)
+        self.pcm_path = None  # Track the decoded PCM belongs to
 
         pygame.mixer.init()
 
@@ -144,35 +270,51 @@ class LEDVisualizer(QWidget):
             return
 
         self.label.setText(f"Loaded: {file_path}")
-        self.frames.clear()
+        self.frames = []
+        self.frame_moods = []
         self.audio_loaded = False
         self.selected_led = None
+        self.audio_path = file_path
+        self.scrubber.cancel()
+        self.scrubber.set_pcm(None)
+        self.pcm_path = None
+        self.analysis_generation += 1
+        for thread in self.analysis_threads:
+            thread.cancelled = True  # Stop generating frames for the previous file
+
+        self.scheduler.stop()
+        self.scheduler.set_frame_times([])
+        self.play_button.setText("Play")
+        self.clock.load(file_path)
+        self.audio_loaded = True
+        self.set_controls_enabled(playable=False, complete=False)
 
-        self.generate_led_frames_at_beats(file_path)
-
-        pygame.mixer.music.load(file_path)
-        self.slider.setMaximum(len(self.frames) - 1)
-        self.slider.setEnabled(True)
-        self.play_button.setEnabled(True)
-        self.save_frames_button.setEnabled(True)
-        self.stream_button.setEnabled(True)
-        self.upload_walrus_button.setEnabled(True)
+        if cached_trip(file_path, "final") is not None:
+            self.generate_led_frames_at_beats(file_path, quality="final")
+            self.set_controls_enabled(playable=True, complete=True)
+        else:
+            # Frames show up chunk by chunk; playback can start after the first few seconds
+            self.generate_progressively(file_path)
 
-        self.audio_loaded = True
+        if self.scrub_audio_box.isChecked() or self.playback_speed != 1.0:
+            self.decode_pcm()
         self.update()
+
+    def set_controls_enabled(self, playable, complete):
+        self.slider.setEnabled(bool(self.frames))
+        self.play_button.setEnabled(playable)
+        self.stream_button.setEnabled(playable)
+        # Saving and uploading need the whole trip
+        self.save_frames_button.setEnabled(complete)
+        self.upload_walrus_button.setEnabled(complete)
     
     def generate_led_frames_fft_based(self, file_path):
-        print(f"Loading audio file: {file_path}")
-        y, sr = librosa.load(file_path, sr=None)
+        y, sr = load_audio(file_path)
+        features = FeatureGraph(y, sr, hop_length=256, n_fft=1024)
 
         print("Computing STFT...")
-        hop_length = 256
-        n_fft = 1024
-        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))  # Shape: (freq_bins, time_frames)
-        S_db = librosa.amplitude_to_db(S, ref=np.max)
-
-        times = librosa.frames_to_time(range(S.shape[1]), sr=sr, hop_length=hop_length)
-        times_ms = (times * 1000).astype(int)
+        S_db = features["stft_db"]  # Shape: (freq_bins, time_frames)
+        times_ms = features["times_ms"]
 
         freq_bins = S_db.shape[0]
         frames = S_db.shape[1]
@@ -218,32 +360,23 @@ class LEDVisualizer(QWidget):
 
     
     def generate_led_frames_from_audio(self, file_path):
-        print(f"Loading audio file: {file_path}")
-        y, sr = librosa.load(file_path, sr=None)  # use native sample rate
+        y, sr = load_audio(file_path)  # use native sample rate
+        features = FeatureGraph(y, sr, hop_length=512)
 
-        print("Detecting tempo and beats...")
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        if hasattr(tempo, '__len__') and not isinstance(tempo, str):
-            tempo = float(tempo[0])
+        print("Detecting tempo...")
+        tempo = features["tempo"]
         self.tempo = tempo
 
         print(f"Estimated BPM: {tempo:.2f}")
         self.label.setText(f"BPM detected: {tempo:.2f}")
 
-        # Extract features across the whole audio
-        hop_length = 512
-        rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
-        zero_crossings = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
-
         # Normalize features
-        rms_norm = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-        centroid_norm = (spectral_centroid - spectral_centroid.min()) / (spectral_centroid.max() - spectral_centroid.min() + 1e-6)
-        zc_norm = (zero_crossings - zero_crossings.min()) / (zero_crossings.max() - zero_crossings.min() + 1e-6)
+        rms_norm = normalize(features["rms"])
+        centroid_norm = normalize(features["centroid"])
+        zc_norm = normalize(features["zero_crossings"])
 
         # Time for each feature frame (ms)
-        frame_times_ms = librosa.frames_to_time(range(len(rms)), sr=sr, hop_length=hop_length) * 1000
+        frame_times_ms = features["times_ms"]
 
         def get_feature_at_time(feature_array, times_array, t_ms):
             idx = min(range(len(times_array)), key=lambda i: abs(times_array[i] - t_ms))
@@ -276,32 +409,23 @@ class LEDVisualizer(QWidget):
         self.total_duration_ms = duration_ms
 
     def generate_led_frames_from_audio1(self, file_path):
-        print(f"Loading audio file: {file_path}")
-        y, sr = librosa.load(file_path, sr=None)  # native sample rate
+        y, sr = load_audio(file_path)  # native sample rate
+        features = FeatureGraph(y, sr, hop_length=512)
 
         print("Detecting tempo and beats...")
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        if hasattr(tempo, '__len__') and not isinstance(tempo, str):
-            tempo = float(tempo[0])
+        tempo = features["tempo"]
         self.tempo = tempo
 
         print(f"Estimated BPM: {tempo:.2f}")
         self.label.setText(f"BPM detected: {tempo:.2f}")
 
-        beat_times = librosa.frames_to_time(beat_frames, sr=sr)  # seconds
+        beat_times = librosa.frames_to_time(features["beats"], sr=sr, hop_length=512)  # seconds
         beat_times_ms = [int(x * 1000) for x in beat_times]
 
-        # Extract features for entire audio (frame-wise)
-        hop_length = 512
-        rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
-        zero_crossings = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
-
         # Normalize features for mapping
-        rms_norm = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-        centroid_norm = (spectral_centroid - spectral_centroid.min()) / (spectral_centroid.max() - spectral_centroid.min() + 1e-6)
-        zc_norm = (zero_crossings - zero_crossings.min()) / (zero_crossings.max() - zero_crossings.min() + 1e-6)
+        rms_norm = normalize(features["rms"])
+        centroid_norm = normalize(features["centroid"])
+        zc_norm = normalize(features["zero_crossings"])
 
         total_frames = len(beat_times_ms)
         frames_per_beat = 4
@@ -309,7 +433,7 @@ class LEDVisualizer(QWidget):
         self.frames = []
 
         # Map librosa frames to beat frames index
-        frame_times_ms = librosa.frames_to_time(range(len(rms)), sr=sr, hop_length=hop_length) * 1000
+        frame_times_ms = features["times_ms"]
 
         def get_feature_at_time(feature_array, times_array, t_ms):
             # Find closest frame index to time t_ms
@@ -384,138 +508,113 @@ class LEDVisualizer(QWidget):
             leds.append(row_leds)
         return leds
 
-    def generate_led_frames_at_beats(self, file_path):
+    def generate_led_frames_at_beats(self, file_path, quality="final"):
+        if self.profile:
+            PROFILER.reset()
 
-        print(f"Loading audio file: {file_path}")
-        y, sr = librosa.load(file_path, sr=None)
-
-        print("Detecting tempo...")
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        if hasattr(tempo, '__len__') and not isinstance(tempo, str):
-            tempo = float(tempo[0])
-        self.tempo = tempo
+        self.apply_trip(generate_trip(file_path, quality))
+        if self.profile:
+            self.print_profile()
 
-        print(f"Estimated BPM: {tempo:.2f}")
-        self.label.setText(f"BPM detected: {tempo:.2f}")
+    def apply_trip(self, trip):
+        """Show a generated trip, keeping the playhead at the same time"""
+        position_ms = 0
+        if self.frames and self.slider.value() < len(self.frames):
+            position_ms = self.frames[self.slider.value()]["time"]
 
-        # ---- Enhanced audio analysis ----
-        hop_length = 512
-        n_fft = 1024
-        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
-        S_db = librosa.amplitude_to_db(S, ref=np.max)
-
-        # Extract mood and intensity features
-        rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=hop_length)[0]
-        zero_crossings = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
-        
-        # Calculate mood intensity (0-1 scale)
-        # High RMS + high spectral centroid + high rolloff = energetic
-        # Low values = calm/relaxed
-        rms_norm = (rms - rms.min()) / (rms.max() - rms.min() + 1e-6)
-        centroid_norm = (spectral_centroid - spectral_centroid.min()) / (spectral_centroid.max() - spectral_centroid.min() + 1e-6)
-        rolloff_norm = (spectral_rolloff - spectral_rolloff.min()) / (spectral_rolloff.max() - spectral_rolloff.min() + 1e-6)
-        
-        mood_intensity = (rms_norm + centroid_norm + rolloff_norm) / 3
+        self.tempo = trip["tempo"]
+        self.frames = trip["frames"]
+        self.frame_moods = trip["frame_moods"]
+        self.total_duration_ms = trip["total_duration_ms"]
 
-        times = librosa.frames_to_time(np.arange(S_db.shape[1]), sr=sr, hop_length=hop_length)
-        times_ms = (times * 1000).astype(int)
+        index = 0
+        while index + 1 < len(self.frames) and self.frames[index + 1]["time"] <= position_ms:
+            index += 1
+        self.slider.blockSignals(True)
+        self.slider.setMaximum(len(self.frames) - 1)
+        self.slider.setValue(index)
+        self.slider.blockSignals(False)
 
-        freq_bins = S_db.shape[0]
-        bands_per_row = freq_bins // LED_ROWS
+        self.timeline.set_frames(self.frames, self.frame_moods)
+        self.timeline.set_playhead(index)
+        self.scheduler.set_frame_times([frame["time"] for frame in self.frames])
+        if self.scheduler.is_active():
+            self.scheduler.tick()
 
-        # ---- Brain entrainment patterns ----
-        brain_patterns = [
-            pattern_brain_entrainment,
-            pattern_tempo_sync_pulse,
-            pattern_mood_amplitude_wave,
-            pattern_photic_stimulation,
-            pattern_theta_flow,
-            pattern_alpha_relaxation,
-            pattern_beta_focus,
-            pattern_wave_vertical,
-            pattern_zigzag,
-            pattern_gradient_rainbow,
-            pattern_fading_left_to_right,
-            pattern_fading_right_to_left,
-            pattern_alternating_rows,
-            pattern_checkerboard,
-            pattern_snake,
-            pattern_cylon,
-            pattern_diagonal_wave,
-        ]
+        self.label.setText(f"Generated {len(self.frames)} brain entrainment frames (BPM: {self.tempo:.1f})")
+        self.update()
 
-        self.frames = []
-        self.frame_moods = []  # Store mood data for each frame
-        pattern_change_interval = 30  # Change pattern every 30 frames (0.6s at 50fps)
-        current_pattern_func = random.choice(brain_patterns)
-        current_frequency_type = 'alpha'  # Default brain frequency
-
-        for t_idx in range(S_db.shape[1]):
-            # Every N frames, pick a new pattern
-            if t_idx % pattern_change_interval == 0:
-                current_pattern_func = random.choice(brain_patterns)
-                
-                # Select brain frequency based on mood
-                avg_mood = np.mean(mood_intensity[max(0, t_idx-10):t_idx+1])
-                if avg_mood < 0.3:
-                    current_frequency_type = 'theta'  # Calm -> theta for meditation
-                elif avg_mood < 0.6:
-                    current_frequency_type = 'alpha'  # Moderate -> alpha for relaxation
-                else:
-                    current_frequency_type = 'beta'   # Energetic -> beta for focus
-
-            # Calculate average energy across bands for overall brightness
-            band_energies = [
-                np.mean(S_db[row * bands_per_row:(row + 1) * bands_per_row, t_idx])
-                for row in range(LED_ROWS)
-            ]
-            avg_energy_db = np.mean(band_energies)
-            brightness = np.clip((avg_energy_db + 80) / 80, 0.1, 1.0)
-
-            # Get current mood intensity
-            current_mood = mood_intensity[min(t_idx, len(mood_intensity)-1)]
-            self.frame_moods.append(current_mood)  # Store mood for this frame
-
-            step = t_idx % 16  # Pattern animation steps
-
-            # Apply the pattern function with enhanced parameters
-            if current_pattern_func == pattern_brain_entrainment:
-                frame_leds = current_pattern_func(step, brightness, current_frequency_type, tempo)
-            elif current_pattern_func == pattern_tempo_sync_pulse:
-                frame_leds = current_pattern_func(step, brightness, tempo)
-            elif current_pattern_func == pattern_mood_amplitude_wave:
-                frame_leds = current_pattern_func(step, brightness, current_mood, tempo)
-            elif current_pattern_func == pattern_photic_stimulation:
-                # Use tempo to determine flash frequency
-                flash_freq = max(5.0, min(20.0, tempo / 6.0))  # 5-20 Hz range
-                frame_leds = current_pattern_func(step, brightness, flash_freq)
-            elif current_pattern_func == pattern_theta_flow:
-                frame_leds = current_pattern_func(step, brightness, tempo)
-            elif current_pattern_func == pattern_alpha_relaxation:
-                frame_leds = current_pattern_func(step, brightness, tempo)
-            elif current_pattern_func == pattern_beta_focus:
-                frame_leds = current_pattern_func(step, brightness, tempo)
-            else:
-                # Original patterns
-                frame_leds = current_pattern_func(step, brightness)
-
-            # Calculate Arduino mode for this frame
-            mode, blink_interval, brightness = self.calculate_arduino_mode(frame_leds, t_idx, current_mood, tempo)
-            
-            # Store simplified frame data with only mode information
-            self.frames.append({
-                "time": int(times_ms[t_idx]),
-                "mode": mode,
-                "blink_interval": blink_interval,
-                "brightness": brightness
-            })
+    def generate_progressively(self, file_path):
+        if self.profile:
+            PROFILER.reset()
+
+        # The draft tier gets the whole preview out fast; refine_in_background replaces it
+        thread = AnalysisThread(file_path, self.analysis_generation, "draft")
+        thread.chunk_ready.connect(self.trip_chunk_ready)
+        thread.error_occurred.connect(lambda msg: self.label.setText(f"Analysis failed: {msg}"))
+        # Keep a reference until the thread is done, even if another file gets loaded
+        thread.finished.connect(lambda: self.analysis_threads.remove(thread))
+        self.analysis_threads.append(thread)
+        thread.start()
+
+    def trip_chunk_ready(self, generation, chunk):
+        """Append newly generated frames; the playhead and scheduler keep running"""
+        if generation != self.analysis_generation:
+            return  # Queued before another file (or the same one again) was loaded
+
+        first_chunk = not self.frames
+        self.frames.extend(chunk["frames"])
+        self.frame_moods.extend(chunk["frame_moods"])
+        self.tempo = chunk["tempo"]
+        self.total_duration_ms = chunk["total_duration_ms"]
 
-        self.total_duration_ms = times_ms[-1] if len(times_ms) > 0 else 0
-        print(f"Generated {len(self.frames)} frames with brain entrainment patterns")
-        print(f"Average mood intensity: {np.mean(mood_intensity):.2f}")
-        self.label.setText(f"Generated {len(self.frames)} brain entrainment frames (BPM: {tempo:.1f})")
+        self.slider.blockSignals(True)
+        self.slider.setMaximum(len(self.frames) - 1)
+        self.slider.blockSignals(False)
+        if first_chunk:
+            self.timeline.set_frames(chunk["frames"], chunk["frame_moods"], chunk["total_frames"])
+        else:
+            self.timeline.append_frames(chunk["frames"], chunk["frame_moods"], chunk["total_frames"])
+        self.scheduler.extend_frame_times([frame["time"] for frame in chunk["frames"]])
+
+        playable = chunk["complete"] or chunk["generated_ms"] >= PLAYBACK_READY_MS
+        self.set_controls_enabled(playable, chunk["complete"])
+        if chunk["complete"]:
+            self.label.setText(
+                f"Generated {len(self.frames)} brain entrainment frames (BPM: {self.tempo:.1f}), refining..."
+            )
+            if self.profile:
+                self.print_profile()
+            self.refine_in_background(self.audio_path)
+        else:
+            self.label.setText(
+                f"Generated up to {chunk['generated_ms'] / 1000:.0f}s of "
+                f"{chunk['total_duration_ms'] / 1000:.0f}s (BPM so far: {self.tempo:.1f})"
+            )
+        if first_chunk:
+            self.update(self.display_rect())
+
+    def refine_in_background(self, file_path):
+        """Swap in the final tier at the same playhead time; the draft preview used running ranges"""
+        thread = RefineThread(file_path, self.analysis_generation)
+        thread.trip_ready.connect(self.final_trip_ready)
+        thread.error_occurred.connect(lambda msg: self.label.setText(f"Final analysis failed: {msg}"))
+        thread.finished.connect(lambda: self.analysis_threads.remove(thread))
+        self.analysis_threads.append(thread)
+        thread.start()
+
+    def final_trip_ready(self, generation, trip):
+        if generation == self.analysis_generation:
+            self.apply_trip(trip)
+
+    def print_profile(self):
+        """Print the per-stage breakdown of the last analysis (--profile)"""
+        print(PROFILER.report())
+        if PROFILER.cprofile_stage:
+            print(PROFILER.cprofile_report())
+            dump_path = f"profile_{PROFILER.cprofile_stage}.prof"
+            PROFILER.dump_cprofile(dump_path)
+            print(f"cProfile data saved to {dump_path}")
 
     def on_stream_clicked(self):
         if not self.frames:
@@ -523,69 +622,95 @@ class LEDVisualizer(QWidget):
             return
 
         if self.stream_button.text() == "Stop Streaming":
-            self.stream_button.setText("Stream Frames to Device")
+            self.stop_arduino_mode_streaming()
             self.label.setText("Streaming stopped.")
             # Stop audio playback
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
+            self.clock.pause()
+            self.scheduler.stop()
+            self.play_button.setText("Play")
             return
 
-        self.stream_button.setText("Stop Streaming")
         self.label.setText("Starting synchronized streaming...")
-        
-        # Start audio playback
-        if not pygame.mixer.music.get_busy():
-            pygame.mixer.music.play()
-        
-        self.start_arduino_mode_streaming()
+        if not self.start_arduino_mode_streaming():
+            self.label.setText("Could not connect to the device.")
+            return
+        self.stream_button.setText("Stop Streaming")
+
+        # Frames go out from show_frame as the playback clock reaches them
+        self.send_frame_to_device(self.slider.value())
+        if not self.clock.playing:
+            self.toggle_play()
 
     def toggle_play(self):
         if not self.audio_loaded:
             return
 
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.pause()
+        if self.clock.playing:
+            self.clock.pause()
             self.play_button.setText("Play")
-            self.timer.stop()
+            self.scheduler.stop()
         else:
-            if pygame.mixer.music.get_pos() == -1:
-                pygame.mixer.music.play()
-            else:
-                pygame.mixer.music.unpause()
+            self.scrubber.flush()  # Start from a seek that is still pending
+            self.clock.play()
             self.play_button.setText("Pause")
-            self.timer.start(30)
+            self.scheduler.start()
 
-    def update_frame(self):
-        if not pygame.mixer.music.get_busy():
-            self.timer.stop()
-            self.play_button.setText("Play")
-            return
-
-        pos_ms = pygame.mixer.music.get_pos()
-        adjusted_ms = pos_ms * self.playback_speed
-
-        current_frame_index = 0
-        for i, frame in enumerate(self.frames):
-            if frame["time"] <= adjusted_ms:
-                current_frame_index = i
-            else:
-                break
+    def playback_finished(self):
+        self.play_button.setText("Play")
+        if self.ws is not None:
+            self.stop_arduino_mode_streaming()
+            print("Arduino mode streaming completed.")
 
+    def show_frame(self, index):
+        """Called by the scheduler only when the visible frame changes"""
         self.slider.blockSignals(True)
-        self.slider.setMaximum(len(self.frames) - 1)
-        self.slider.setValue(current_frame_index)
+        self.slider.setValue(index)
         self.slider.blockSignals(False)
-        self.update()
+        self.timeline.set_playhead(index)
+        self.update(self.display_rect())
+        self.send_frame_to_device(index)
 
     def slider_changed(self, value):
+        """Preview the frame right away; the audio seek is debounced"""
         if not self.frames or value >= len(self.frames):
             return
 
-        time_ms = self.frames[value]["time"]
-        pygame.mixer.music.stop()
-        pygame.mixer.music.play(start=time_ms / 1000.0)
-        pygame.mixer.music.pause()
-        self.update()
+        if self.scheduler.is_active():
+            # Seeking pauses playback, without waiting for the debounced seek
+            self.clock.pause()
+            self.scheduler.stop()
+            self.play_button.setText("Play")
+
+        self.timeline.set_playhead(value)
+        self.update(self.display_rect())
+        dragging = self.slider.isSliderDown() and self.scrub_audio_box.isChecked()
+        self.scrubber.scrub(self.frames[value]["time"], snippet=dragging)
+
+    def slider_released(self):
+        self.scrubber.flush()
+
+    def seek_audio(self, time_ms):
+        self.clock.seek(time_ms)
+
+    def scrub_audio_toggled(self, checked):
+        if checked and self.audio_loaded:
+            self.decode_pcm()
+
+    def decode_pcm(self):
+        if self.pcm_path == self.audio_path:
+            return
+        self.pcm_path = self.audio_path
+        thread = PCMDecodeThread(self.audio_path)
+        thread.pcm_ready.connect(self.pcm_ready)
+        thread.finished.connect(lambda: self.analysis_threads.remove(thread))
+        self.analysis_threads.append(thread)
+        thread.start()
+
+    def pcm_ready(self, file_path, pcm):
+        if file_path == self.audio_path:
+            self.scrubber.set_pcm(pcm)
+            self.clock.set_pcm(pcm)
+            self.scheduler.speed = self.clock.effective_speed()
 
     def speed_changed(self, value):
         speed_map = {
@@ -597,16 +722,24 @@ class LEDVisualizer(QWidget):
             "2.0x": 2.0
         }
         self.playback_speed = speed_map[value]
-        if pygame.mixer.music.get_busy():
-            self.timer.start(30)
+        self.clock.set_speed(self.playback_speed)
+        self.scheduler.speed = self.clock.effective_speed()
+        if self.playback_speed != 1.0 and self.audio_loaded:
+            self.decode_pcm()  # Plays at 1x until the PCM is decoded
+        if self.scheduler.is_active():
+            self.scheduler.tick()  # Re-arm for the new speed
+
+    def display_rect(self):
+        return QRect(0, 0, self.width(), self.height() - 150)  # Reserve space for controls
 
     def paintEvent(self, event):
         if not self.frames:
             return
 
         painter = QPainter(self)
-        w = self.width()
-        h = self.height() - 150  # Reserve space for controls
+        rect = self.display_rect()
+        w = rect.width()
+        h = rect.height()
 
         cell_w = w / LED_COLS
         cell_h = h / LED_ROWS
@@ -623,22 +756,7 @@ class LEDVisualizer(QWidget):
         brightness = frame["brightness"]
         
         # Create a simple visualization based on mode
-        mode_colors = {
-            1: QColor(255, 255, 255),  # White
-            2: QColor(255, 100, 100),  # Red
-            3: QColor(100, 255, 100),  # Green
-            4: QColor(100, 100, 255),  # Blue
-            5: QColor(255, 255, 100),  # Yellow
-            6: QColor(255, 100, 255),  # Magenta
-            7: QColor(100, 255, 255),  # Cyan
-            8: QColor(255, 150, 100)   # Orange
-        }
-        
-        color = mode_colors.get(mode, QColor(128, 128, 128))
-        brightness_scale = brightness / 255.0
-        color.setRed(int(color.red() * brightness_scale))
-        color.setGreen(int(color.green() * brightness_scale))
-        color.setBlue(int(color.blue() * brightness_scale))
+        color = mode_color(mode, brightness)
         
         # Fill the entire display area with the mode color
         painter.fillRect(0, 0, w, h, color)
@@ -669,64 +787,11 @@ class LEDVisualizer(QWidget):
 
         try:
             with open(save_path, "w") as f:
-                json.dump(self.frames, f, indent=2)
+                json_stream.dump(self.frames, f, indent=2)
             self.label.setText(f"Frames saved to: {save_path}")
         except Exception as e:
             self.label.setText(f"Error saving frames: {e}")
 
-    def calculate_arduino_mode(self, frame_leds, frame_index, mood_intensity, tempo):
-        """Calculate Arduino mode (1-8) based on audio analysis and LED pattern"""
-        if not frame_leds:
-            return 1, 50, 100  # Default mode, interval, brightness
-        
-        # Analyze LED activity
-        total_leds = 0
-        active_leds = 0
-        brightness_sum = 0
-        edge_leds = 0
-        
-        for row_idx, row in enumerate(frame_leds):
-            for col_idx, led in enumerate(row):
-                total_leds += 1
-                if led["a"] > 0:
-                    active_leds += 1
-                    brightness_sum += led["a"]
-                    # Check if it's an edge LED
-                    if col_idx == 0 or col_idx == 15:
-                        edge_leds += 1
-        
-        activity_ratio = active_leds / total_leds if total_leds > 0 else 0
-        avg_brightness = brightness_sum / active_leds if active_leds > 0 else 0
-        edge_ratio = edge_leds / max(1, active_leds)
-        
-        # Calculate blink interval based on tempo and mood
-        base_interval = max(20, min(50, int(60000 / tempo)))  # BPM to ms, max 100ms
-        mood_factor = 0.5 + mood_intensity * 1.5  # 0.5x to 2.0x
-        blink_interval = int(base_interval * mood_factor)
-        blink_interval = min(50, blink_interval)  # Ensure maximum 100ms
-        
-        # Calculate brightness (0-20 for safer brain entrainment)
-        brightness = int(min(20, avg_brightness * 20 / 30))
-        
-        # Determine mode based on pattern characteristics
-        if activity_ratio > 0.8:
-            # High activity - use mode 1 (full strip flash) or mode 2 (color transition)
-            mode = 1 if mood_intensity < 0.5 else 2
-        elif edge_ratio > 0.3:
-            # Edge-focused pattern - use mode 3 (edge only)
-            mode = 3
-        elif activity_ratio > 0.5:
-            # Moderate activity - use mode 4 (expanding) or mode 5 (center out)
-            mode = 4 if frame_index % 2 == 0 else 5
-        elif activity_ratio > 0.2:
-            # Low activity - use mode 6 (moving dot) or mode 7 (row toggle)
-            mode = 6 if mood_intensity > 0.5 else 7
-        else:
-            # Very low activity - use mode 8 (snake)
-            mode = 8
-        
-        return mode, blink_interval, brightness
-
     def send_arduino_mode(self, mode, blink_interval, brightness):
         """Send mode data to Arduino in the expected format"""
         try:
@@ -737,48 +802,49 @@ class LEDVisualizer(QWidget):
             print(f"Failed to send mode: {e}")
 
     def start_arduino_mode_streaming(self):
-        """Stream Arduino modes based on audio analysis"""
+        """Connect to the device; frames are then sent as the playback clock reaches them"""
         print("Starting Arduino mode streaming...")
         print("Connecting to WebSocket...")
-        
+
         try:
             self.ws = websocket.create_connection(ESP32_WS_URL)
             print("Connected to Arduino!")
-            
-            # Calculate frame interval
-            total_duration_ms = self.frames[-1]["time"] if self.frames else 0
-            frame_interval_ms = total_duration_ms / len(self.frames) if len(self.frames) > 0 else 50
-            
-            print(f"Total duration: {total_duration_ms}ms, {len(self.frames)} frames")
-            print(f"Frame interval: {frame_interval_ms:.2f}ms")
-            
-            for i, frame in enumerate(self.frames):
-                if self.stream_button.text() == "Stream Frames to Device":
-                    print("Streaming stopped by user.")
-                    self.ws.close()
-                    return
-                
-                # Extract mode data from simplified frame
-                mode = frame["mode"]
-                blink_interval = frame["blink_interval"]
-                brightness = frame["brightness"]
-                
-                # Send mode to Arduino
-                self.send_arduino_mode(mode, blink_interval, brightness)
-                
-                # Add delay to prevent buffer overflow
-                # Wait for the blink interval duration plus some buffer time
-                sleep_time = (blink_interval / 1000.0) + 0.05  # Add 50ms buffer
-                sleep_time = max(0.1, sleep_time)  # Minimum 100ms between sends
-                time.sleep(sleep_time)
-            
-            print("Arduino mode streaming completed.")
-            self.ws.close()
-            
+            print(f"Total duration: {self.total_duration_ms}ms, {len(self.frames)} frames")
+            return True
         except Exception as e:
             print(f"Arduino streaming error: {e}")
-            if hasattr(self, 'ws'):
-                self.ws.close()
+            self.ws = None
+            return False
+
+    def stop_arduino_mode_streaming(self):
+        self.stream_button.setText("Stream Frames to Device")
+        self.device_send_timer.stop()
+        self.pending_device_index = None
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    def send_frame_to_device(self, index):
+        """Send one frame's mode while streaming, at most the device's max_fps; later frames wait for the slot"""
+        if self.ws is None or index >= len(self.frames):
+            return
+        wait_s = self.last_device_send + self.device_interval_s - time.perf_counter()
+        if wait_s > 0:
+            # Only the newest frame is sent once the interval is over
+            self.pending_device_index = index
+            if not self.device_send_timer.isActive():
+                self.device_send_timer.start(math.ceil(wait_s * 1000))
+            return
+        self.pending_device_index = None
+        frame = self.frames[index]
+        if "mode" not in frame:
+            return
+        self.last_device_send = time.perf_counter()
+        self.send_arduino_mode(frame["mode"], frame["blink_interval"], frame["brightness"])
+
+    def send_pending_frame(self):
+        if self.pending_device_index is not None:
+            self.send_frame_to_device(self.pending_device_index)
 
     def get_mood_at_frame(self, frame_index):
         """Get mood intensity for a specific frame"""
@@ -786,15 +852,6 @@ class LEDVisualizer(QWidget):
             return self.frame_moods[frame_index]
         return 0.5  # Default mood if not available
 
-    def json_serializer(self, obj):
-        """Custom JSON serializer to handle numpy types and other non-serializable objects"""
-        if hasattr(obj, 'item'):  # numpy types
-            return obj.item()
-        elif hasattr(obj, 'isoformat'):  # datetime objects
-            return obj.isoformat()
-        else:
-            return str(obj)
-
     def calculate_led_blinking_rate(self, led_data, frame_index, mood_intensity, row, col):
         """Calculate blinking rate for individual LED based on its properties and position"""
         if led_data["a"] == 0:
@@ -824,63 +881,59 @@ class LEDVisualizer(QWidget):
         return blinking_rate
 
     def upload_to_walrus(self):
-        """Save frames to JSON and upload to Walrus"""
+        """Upload the trip to Walrus on a worker thread; the editor stays usable meanwhile"""
         if not self.frames:
             self.label.setText("No frames to upload.")
             return
 
-        try:
-            # Create a temporary JSON file
-            temp_file = "brain_entrainment_frames.json"
-            
-            # Prepare the data with metadata
-            upload_data = {
-                "metadata": {
-                    "name": "Brain Entrainment Frames",
-                    "description": f"Audio-reactive brain entrainment patterns generated from {self.tempo:.1f} BPM audio",
-                    "total_frames": len(self.frames),
-                    "duration_ms": self.total_duration_ms,
-                    "tempo_bpm": self.tempo,
-                    "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "version": "1.0"
-                },
-                "frames": self.frames
-            }
-            
-            # Save to temporary file with proper JSON serialization
-            with open(temp_file, 'w') as f:
-                json.dump(upload_data, f, indent=2, default=self.json_serializer)
-            
-            self.label.setText("Uploading to Walrus...")
-            
-            # Upload to Walrus
-            upload_response = self.upload_json_to_walrus(temp_file, epochs=10)
-            
-            if upload_response:
-                self.label.setText("Successfully uploaded to Walrus!")
-                
-                # Get the blob ID for access
-                if 'newlyCreated' in upload_response:
-                    blob_id = upload_response['newlyCreated']['blobObject']['blobId']
-                    object_id = upload_response['newlyCreated']['blobObject']['id']
-                    
-                    print(f"\n--- Walrus Upload Successful ---")
-                    print(f"Blob ID: {blob_id}")
-                    print(f"Object ID: {object_id}")
-                    print(f"Access URL: https://aggregator.walrus-testnet.walrus.space/v1/blobs/{blob_id}")
-                    
-                    # Clean up temporary file
-                    os.remove(temp_file)
-                else:
-                    self.label.setText("Upload completed but no blob ID received.")
-            else:
-                self.label.setText("Failed to upload to Walrus.")
-                
-        except Exception as e:
-            self.label.setText(f"Error uploading to Walrus: {e}")
-            print(f"Upload error: {e}")
+        # Prepare the data with metadata
+        upload_data = {
+            "metadata": {
+                "name": "Brain Entrainment Frames",
+                "description": f"Audio-reactive brain entrainment patterns generated from {self.tempo:.1f} BPM audio",
+                "total_frames": len(self.frames),
+                "duration_ms": self.total_duration_ms,
+                "tempo_bpm": self.tempo,
+                "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "version": "1.0"
+            },
+            "frames": list(self.frames)  # Snapshot; a new analysis replaces self.frames
+        }
+
+        if self.walrus_index is None:
+            self.walrus_index = BlobIndex()
+        self.upload_walrus_button.setEnabled(False)
+        self.label.setText("Uploading to Walrus...")
+        self.walrus_thread = WalrusUploadThread(upload_data, epochs=10, index=self.walrus_index)
+        self.walrus_thread.progress.connect(self.walrus_upload_progress)
+        self.walrus_thread.uploaded.connect(self.walrus_upload_done)
+        self.walrus_thread.error_occurred.connect(self.walrus_upload_failed)
+        self.walrus_thread.start()
+
+    def walrus_upload_progress(self, sent, total):
+        self.label.setText(f"Uploading to Walrus... {sent * 100 // max(total, 1)}% of {total / 1e6:.1f} MB")
+
+    def walrus_upload_done(self, blob):
+        self.upload_walrus_button.setEnabled(True)
+        if blob["source"] == "index" and not blob["chunks_sent"]:
+            extended = f" Extended the storage of {blob['chunks_extended']} chunks." if blob["chunks_extended"] else ""
+            self.label.setText(f"Already on Walrus, nothing to upload.{extended}")
+        else:
+            self.label.setText(f"Successfully uploaded to Walrus! Sent {blob['chunks_sent']} of {blob['chunks']} chunks "
+                               f"({blob['bytes_sent'] / 1e6:.2f} MB)")
+        print(f"\n--- Walrus Upload Successful ({blob['source']}) ---")
+        print(f"Blob ID: {blob['blob_id']}")
+        print(f"Object ID: {blob['object_id']}")
+        print(f"Access URL: {walrus.blob_url(blob['blob_id'])}")
+        print(f"This blob is a chunked-trip manifest ({MANIFEST_FORMAT}), not the trip JSON; "
+              f"read it with walrus_chunks.read_chunked_trip(blob_id)")
+
+    def walrus_upload_failed(self, message):
+        self.label.setText(f"Error uploading to Walrus: {message}")
+        self.upload_walrus_button.setEnabled(True)
+        print(f"Upload error: {message}")
 
-    def upload_json_to_walrus(self, file_path: str, publisher_url: str = "https://publisher.walrus-testnet.walrus.space", epochs: int = 10):
+    def upload_json_to_walrus(self, file_path: str, publisher_url: str = walrus.PUBLISHER_URL, epochs: int = 10):
         """
         Uploads a JSON file to a Walrus publisher.
         """
@@ -888,41 +941,29 @@ class LEDVisualizer(QWidget):
             print(f"Error: File not found at {file_path}")
             return None
 
-        # Read the content of the JSON file
-        with open(file_path, 'r') as f:
-            try:
-                json_data = json.load(f)
-            except json.JSONDecodeError:
-                print(f"Error: Invalid JSON file at {file_path}")
-                return None
-
-        # The API expects the raw file content in the body
         with open(file_path, 'rb') as f:
             file_content = f.read()
 
-        # Construct the full URL with parameters
-        url = f"{publisher_url}/v1/blobs"
-        params = {
-            'epochs': epochs
-        }
-
-        headers = {
-            'Content-Type': 'application/json'
-        }
-
         try:
-            response = requests.put(url, params=params, data=file_content, headers=headers)
-            response.raise_for_status()
-
-            return response.json()
-
+            return walrus.upload_blob(file_content, publisher_url, epochs)
         except requests.exceptions.RequestException as e:
             print(f"An error occurred: {e}")
             return None
 
 def main():
-    app = QApplication(sys.argv)
-    window = LEDVisualizer()
+    parser = argparse.ArgumentParser(description="ChromaMind Studio")
+    parser.add_argument("--profile", action="store_true",
+                        help="print wall time, CPU time and memory peak per analysis stage")
+    parser.add_argument("--profile-stage",
+                        help="also run cProfile around one stage, e.g. stft or patterns")
+    args, qt_args = parser.parse_known_args()
+
+    if args.profile or args.profile_stage:
+        PROFILER.trace_memory()
+        PROFILER.cprofile_stage = args.profile_stage
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = LEDVisualizer(profile=args.profile or bool(args.profile_stage))
     window.show()
     sys.exit(app.exec())
 
@@ -0,0 +1,179 @@
+"""
+Persistent cache of chat completion responses.
+
+The mood lookups in dreamer.py and maker.py send the same system prompt and
+tools every time and only the visitor's sentence changes, so a response is
+stored under the hash of everything else in the request (model, parameters,
+earlier messages) plus the normalized last message. Repeated booth phrases
+("I'm stressed", "i am stressed!") are answered from a local SQLite file
+instead of a network round trip.
+
+    cache = ResponseCache()
+    message = cache.get(payload)
+    if message is None:
+        message = post(payload)["choices"][0]["message"]
+        cache.put(payload, message)
+
+A miss on the exact key falls back to the closest earlier sentence with the
+same request parameters, if its words overlap enough (NEAR_DUPLICATE_SIMILARITY)
+and it agrees on negation. Entries expire after TTL_S and the least recently
+used ones are dropped beyond MAX_ENTRIES. Rows read once are kept in memory
+as well, so a repeated hit does not touch the database at all.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.environ.get(
+    "CHROMAMIND_LLM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "chromamind", "llm.sqlite")
+)
+TTL_S = 7 * 24 * 3600
+MAX_ENTRIES = 5000
+NEAR_DUPLICATE_SIMILARITY = 0.8  # Jaccard similarity of the word sets, fillers left out
+TOUCH_INTERVAL_S = 60  # A hit rewrites the LRU timestamp at most this often
+
+CONTRACTIONS = [
+    (r"\bi'm\b", "i am"), (r"\bim\b", "i am"), (r"\bcan't\b", "cannot"), (r"\bwon't\b", "will not"),
+    (r"n't\b", " not"), (r"'re\b", " are"), (r"'ve\b", " have"), (r"'ll\b", " will"), (r"'d\b", " would"),
+]
+FILLER_WORDS = {
+    "a", "an", "the", "so", "very", "really", "just", "quite", "bit", "little", "kind", "of", "sort",
+    "today", "now", "right", "like", "um", "uh", "well", "feeling", "feel", "i", "am", "me", "my", "and",
+}
+NEGATIONS = {"not", "no", "never", "cannot", "nothing", "hardly", "barely"}  # Shared with mood_classifier
+
+
+def normalize_text(text):
+    """Lower case, contractions expanded, punctuation dropped, whitespace collapsed"""
+    text = text.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = re.sub(pattern, replacement, text)
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def content_words(normalized):
+    return frozenset(normalized.split()) - FILLER_WORDS
+
+
+def similarity(words, other):
+    if (words & NEGATIONS) != (other & NEGATIONS):
+        return 0.0  # "not stressed" is never a near duplicate of "stressed"
+    if not words or not other:
+        return 0.0  # Nothing to compare; identical texts already hit as exact matches
+    return len(words & other) / len(words | other)
+
+
+def request_key(payload):
+    """(hash of everything but the last message, normalized last message)"""
+    messages = payload.get("messages") or []
+    text = normalize_text(str(messages[-1].get("content") or "")) if messages else ""
+    context = dict(payload, messages=messages[:-1])
+    context.pop("stream", None)
+    encoded = json.dumps(context, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode()).hexdigest(), text
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, ttl_s=TTL_S, max_entries=MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " context TEXT NOT NULL, text TEXT NOT NULL, response TEXT NOT NULL,"
+            " created REAL NOT NULL, used REAL NOT NULL, PRIMARY KEY (context, text))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self._words = {}  # context -> {text: content words}, for near-duplicate lookups
+        self._rows = {}  # (context, text) -> [response JSON, created, used]
+
+    def get(self, payload, near_duplicates=True):
+        """The cached response message for this request, or None"""
+        context, text = request_key(payload)
+        now = time.time()
+        with self._lock:
+            row = self._row(context, text)
+            if row is None and near_duplicates:
+                match = self._nearest(context, text)
+                if match is not None:
+                    text = match
+                    row = self._row(context, text)
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_s:
+                self._delete(context, text)
+                return None
+            if now - row[2] > TOUCH_INTERVAL_S:
+                row[2] = now
+                self._db.execute("UPDATE responses SET used = ? WHERE context = ? AND text = ?", (now, context, text))
+        return json.loads(row[0])  # A fresh copy, callers may modify it
+
+    def put(self, payload, message):
+        context, text = request_key(payload)
+        now = time.time()
+        response = json.dumps(message)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (context, text, response, now, now)
+            )
+            self._rows[(context, text)] = [response, now, now]
+            if context in self._words:
+                self._words[context][text] = content_words(text)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._words.clear()
+            self._rows.clear()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _row(self, context, text):
+        row = self._rows.get((context, text))
+        if row is None:
+            found = self._db.execute(
+                "SELECT response, created, used FROM responses WHERE context = ? AND text = ?", (context, text)
+            ).fetchone()
+            if found is not None:
+                row = self._rows[(context, text)] = list(found)
+        return row
+
+    def _nearest(self, context, text):
+        """Closest cached text for this context, if it is similar enough"""
+        if context not in self._words:
+            rows = self._db.execute("SELECT text FROM responses WHERE context = ?", (context,))
+            self._words[context] = {cached: content_words(cached) for cached, in rows}
+        words = content_words(text)
+        best, best_similarity = None, NEAR_DUPLICATE_SIMILARITY
+        for cached, cached_words in self._words[context].items():
+            score = similarity(words, cached_words)
+            if score >= best_similarity:
+                best, best_similarity = cached, score
+        return best
+
+    def _delete(self, context, text):
+        self._db.execute("DELETE FROM responses WHERE context = ? AND text = ?", (context, text))
+        self._words.get(context, {}).pop(text, None)
+        self._rows.pop((context, text), None)
+
+    def _evict(self):
+        removed = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_s,)).rowcount
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            removed += self._db.execute(
+                "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY used LIMIT ?)", (excess,)
+            ).rowcount
+        if removed:
+            # Rebuilt lazily from what is left
+            self._words.clear()
+            self._rows.clear()
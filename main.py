@@ -1,66 +1,98 @@
 import sys
 import json
-import requests
+import time
+import argparse
+import numpy as np
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QPushButton, QSlider, QVBoxLayout, QFileDialog, QLabel
 )
-from PyQt6.QtGui import QPainter, QColor
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
+from PyQt6.QtGui import QPainter
+from PyQt6.QtCore import Qt, QRect, QThread, pyqtSignal
 import pygame
 from dotenv import load_dotenv
 import os
 
+from frame_api import fetch_frames
+from led_renderer import LEDImageRenderer, frames_to_array
+from playback import AudioScrubber, PlaybackClock, PlaybackScheduler
+from stream_frames import stream_led_frames
+
 load_dotenv()  # loads variables from .env into os.environ
 API_KEY = os.environ.get("ASI1_API_KEY")
 if not API_KEY:
     raise ValueError("Missing ASI1_API_KEY in environment variables")
 
+FRAME_INTERVAL_MS = 100  # AI frames carry no timestamps; they play at 10 FPS
+STREAM_BATCH_FRAMES = 20  # Streamed frames are handed to the viewer in batches of up to this many
+STREAM_BATCH_S = 0.25  # ... or at least this often
+
 
 class FrameFetchThread(QThread):
-    frames_received = pyqtSignal(list)
-    error_occurred = pyqtSignal(str)
+    frames_received = pyqtSignal(int, list)
+    frames_streamed = pyqtSignal(int, list)  # One batch of frames while streaming
+    error_occurred = pyqtSignal(int, str)
 
-    def __init__(self, audio_path, api_key, api_url):
+    def __init__(self, audio_path, generation, api_key, api_url, stream=False, payload=None):
         super().__init__()
         self.audio_path = audio_path
+        self.generation = generation  # Frames from an older upload are dropped by the viewer
+        self.cancelled = False
         self.api_key = api_key
         self.api_url = api_url
+        self.stream = stream
+        self.payload = payload  # "audio" or "features"; None for each client's default
 
     def run(self):
         try:
-            # Read audio file bytes
-            with open(self.audio_path, "rb") as f:
-                audio_bytes = f.read()
-
-            # Replace with your real API call
-            # Here, we're simulating with a dummy response for demo
-            # Example: send multipart/form-data with audio to your API
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-            }
-            files = {"audio_file": (self.audio_path, audio_bytes)}
-
-            response = requests.post(self.api_url, headers=headers, files=files)
-            response.raise_for_status()
-            frames = response.json()["frames"]
-
+            if self.stream:
+                self.stream_frames()
+                return
             # Frames should be a list of frames, each frame is a 2D array of LED dicts: [{"r":0,"g":0,"b":0},...]
-            self.frames_received.emit(frames)
+            options = {"payload": self.payload} if self.payload else {}
+            frames = fetch_frames(self.audio_path, self.api_key, self.api_url, **options)
+            self.frames_received.emit(self.generation, frames)
 
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            self.error_occurred.emit(self.generation, str(e))
+
+    def stream_frames(self):
+        """Emit frames from the chat model in small batches as they arrive"""
+        batch = []
+        last_emit = time.perf_counter()
+        options = {"payload": self.payload} if self.payload else {}
+        frames = stream_led_frames(self.audio_path, **options)
+        try:
+            for frame in frames:
+                if self.cancelled:
+                    return
+                batch.append(frame["frame"])
+                if len(batch) >= STREAM_BATCH_FRAMES or time.perf_counter() - last_emit >= STREAM_BATCH_S:
+                    self.frames_streamed.emit(self.generation, batch)
+                    batch = []
+                    last_emit = time.perf_counter()
+        finally:
+            frames.close()  # Closes the response of a cancelled stream
+        if batch and not self.cancelled:
+            self.frames_streamed.emit(self.generation, batch)
 
 
 class LEDFrameViewer(QWidget):
-    def __init__(self):
+    def __init__(self, stream=False, payload=None):
         super().__init__()
+        self.stream = stream  # Stream frames from the chat model instead of the frames API
+        self.payload = payload
         self.frames = []
+        self.frame_array = None
+        self._frame_buffer = None  # Grows by doubling; frame_array is a view of the filled part
+        self.renderer = LEDImageRenderer()
         self.rows = 0
         self.columns = 0
         self.current_frame = 0
         self.is_playing = False
         self.api_key = API_KEY
         self.api_url = "https://api.asi1.ai/v1"
+        self.fetch_generation = 0  # Bumped on every upload; stale frames carry an older one
+        self.fetch_threads = []
 
         self.setWindowTitle("LED Music Visualizer with AI Frames")
         self.setMinimumSize(800, 600)
@@ -76,6 +108,7 @@ class LEDFrameViewer(QWidget):
         self.slider = QSlider(Qt.Orientation.Horizontal)
         self.slider.setEnabled(False)
         self.slider.valueChanged.connect(self.slider_changed)
+        self.slider.sliderReleased.connect(self.slider_released)
 
         layout = QVBoxLayout()
         layout.addWidget(self.status_label)
@@ -85,8 +118,13 @@ class LEDFrameViewer(QWidget):
         self.setLayout(layout)
 
         pygame.mixer.init()
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.next_frame)
+        self.clock = PlaybackClock()
+        self.scheduler = PlaybackScheduler(self.clock.position_ms, self)
+        self.scheduler.frame_changed.connect(self.show_frame)
+        self.scheduler.finished.connect(self.playback_finished)
+
+        self.scrubber = AudioScrubber(self)
+        self.scrubber.seek_requested.connect(self.seek_audio)
 
         self.audio_path = None
 
@@ -95,18 +133,10 @@ class LEDFrameViewer(QWidget):
             return
 
         painter = QPainter(self)
-        w = self.width()
-        h = self.height() - 150  # leave space for buttons and status
-
-        cell_w = w / self.columns
-        cell_h = h / self.rows
+        self.renderer.draw(painter, self.display_rect(), self.frame_array[self.current_frame])
 
-        frame = self.frames[self.current_frame]
-        for y in range(self.rows):
-            for x in range(self.columns):
-                led = frame[y][x]
-                color = QColor(led["r"], led["g"], led["b"])
-                painter.fillRect(int(x * cell_w), int(y * cell_h), int(cell_w), int(cell_h), color)
+    def display_rect(self):
+        return QRect(0, 0, self.width(), self.height() - 150)  # leave space for buttons and status
 
     def upload_audio(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Audio File", "", "Audio Files (*.mp3 *.wav)")
@@ -118,67 +148,141 @@ class LEDFrameViewer(QWidget):
         self.play_button.setEnabled(False)
         self.slider.setEnabled(False)
 
-        self.thread = FrameFetchThread(file_path, self.api_key, self.api_url)
-        self.thread.frames_received.connect(self.frames_received)
-        self.thread.error_occurred.connect(self.api_error)
-        self.thread.start()
-
-    def frames_received(self, frames):
+        self.scheduler.stop()
+        self.scrubber.cancel()
+        self.is_playing = False
+        self.play_button.setText("Play")
+        self.frames = []
+        self.frame_array = None
+        self._frame_buffer = None
+        self.scheduler.set_frame_times([])
+        self.fetch_generation += 1
+        for thread in self.fetch_threads:
+            thread.cancelled = True  # Stop streaming frames for the previous file
+
+        generation = self.fetch_generation
+        thread = FrameFetchThread(file_path, generation, self.api_key, self.api_url, stream=self.stream,
+                                  payload=self.payload)
+        thread.frames_received.connect(self.frames_received)
+        thread.frames_streamed.connect(self.frames_streamed)
+        thread.error_occurred.connect(self.api_error)
+        thread.finished.connect(lambda: self.fetch_finished(generation))
+        thread.finished.connect(lambda: self.fetch_threads.remove(thread))
+        self.fetch_threads.append(thread)
+        thread.start()
+
+    def frames_received(self, generation, frames):
+        if generation != self.fetch_generation:
+            return  # From a file that was replaced
         if not frames or not isinstance(frames, list):
             self.status_label.setText("Error: Invalid frames data received")
             return
 
-        self.frames = frames
-        self.rows = len(frames[0])
-        self.columns = len(frames[0][0])
-        self.current_frame = 0
-
-        self.slider.setMaximum(len(frames) - 1)
-        self.slider.setEnabled(True)
-        self.play_button.setEnabled(True)
+        self.append_frames(frames)
         self.status_label.setText(f"Loaded {len(frames)} frames from AI model")
 
-        # Load and play audio with pygame
-        pygame.mixer.music.load(self.audio_path)
+    def frames_streamed(self, generation, frames):
+        if generation == self.fetch_generation:
+            self.append_frames(frames)
+
+    def fetch_finished(self, generation):
+        # Now that all frames are in, playback stops after the last one
+        if generation == self.fetch_generation and self.frames:
+            self.scheduler.end_ms = len(self.frames) * FRAME_INTERVAL_MS
+
+    def append_frames(self, frames):
+        """Add frames to the store; playback can start with the first batch"""
+        first_batch = not self.frames
+        array = frames_to_array(frames)  # (N, rows, cols, 3) uint8, converted once
+        count = len(self.frames)
+        if self._frame_buffer is None or count + len(array) > len(self._frame_buffer):
+            grown = np.empty((max(64, 2 * (count + len(array))),) + array.shape[1:], dtype=np.uint8)
+            if count:
+                grown[:count] = self.frame_array
+            self._frame_buffer = grown
+        self._frame_buffer[count:count + len(array)] = array
+        self.frame_array = self._frame_buffer[:count + len(array)]
+        self.frames.extend(frames)
+
+        self.slider.blockSignals(True)
+        self.slider.setMaximum(len(self.frames) - 1)
+        self.slider.blockSignals(False)
+        self.scheduler.extend_frame_times([i * FRAME_INTERVAL_MS for i in range(count, len(self.frames))])
+        self.status_label.setText(f"Received {len(self.frames)} frames from AI model")
+
+        if first_batch:
+            self.rows = len(frames[0])
+            self.columns = len(frames[0][0])
+            self.current_frame = 0
+            self.slider.setEnabled(True)
+            self.play_button.setEnabled(True)
 
-        self.update()
+            # Load and play audio with pygame
+            self.clock.load(self.audio_path)
+            self.update()
 
-    def api_error(self, msg):
+    def api_error(self, generation, msg):
+        if generation != self.fetch_generation:
+            return
         self.status_label.setText(f"Error contacting AI model: {msg}")
 
     def slider_changed(self, value):
+        """Show the frame right away; the audio seek is debounced while dragging"""
         self.current_frame = value
-        self.update()
+        if self.is_playing:
+            self.scheduler.stop()  # Resumed by seek_audio, or it would pull the slider back
+        self.scrubber.scrub(value * FRAME_INTERVAL_MS)
+        self.update(self.display_rect())
+
+    def slider_released(self):
+        self.scrubber.flush()
+
+    def seek_audio(self, time_ms):
+        self.clock.seek(time_ms)
+        if self.is_playing:
+            self.scheduler.start()
 
     def toggle_play(self):
         if self.is_playing:
-            self.timer.stop()
-            pygame.mixer.music.pause()
+            self.scheduler.stop()
+            self.clock.pause()
             self.play_button.setText("Play")
         else:
-            self.timer.start(100)  # 10 FPS animation
-            if not pygame.mixer.music.get_busy():
-                pygame.mixer.music.play()
-            else:
-                pygame.mixer.music.unpause()
+            self.scrubber.flush()  # Start from a seek that is still pending
+            self.clock.play()
+            self.scheduler.start()
             self.play_button.setText("Pause")
         self.is_playing = not self.is_playing
 
-    def next_frame(self):
-        self.current_frame += 1
-        if self.current_frame >= len(self.frames):
-            self.current_frame = 0
-            pygame.mixer.music.stop()
-            self.timer.stop()
-            self.is_playing = False
-            self.play_button.setText("Play")
+    def show_frame(self, index):
+        """Called by the scheduler only when the visible frame changes"""
+        self.current_frame = index
+        self.slider.blockSignals(True)
+        self.slider.setValue(index)
+        self.slider.blockSignals(False)
+        self.update(self.display_rect())
+
+    def playback_finished(self):
+        self.current_frame = 0
+        self.clock.stop()
+        self.clock.seek(0)
+        self.is_playing = False
+        self.play_button.setText("Play")
         self.slider.setValue(self.current_frame)
-        self.update()
+        self.update(self.display_rect())
 
 
 def main():
-    app = QApplication(sys.argv)
-    viewer = LEDFrameViewer()
+    parser = argparse.ArgumentParser(description="LED Music Visualizer with AI Frames")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream frames from the chat model and start playback on the first ones")
+    parser.add_argument("--payload", choices=["audio", "features"],
+                        help="send the audio file or a compact feature summary (default: audio for the frames API, "
+                             "features when streaming)")
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    viewer = LEDFrameViewer(stream=args.stream, payload=args.payload)
     viewer.show()
     sys.exit(app.exec())
 
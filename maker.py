@@ -1,77 +1,28 @@
-import requests
-import json
+import argparse
+import asyncio
 import math
+import shutil
+
+import numpy as np
 
 # === CONFIGURATION ===
 from dotenv import load_dotenv
 import os
 
+import json_stream
+from asi1_client import APIError, ASI1Client
+
 load_dotenv()  # loads variables from .env into os.environ
 API_KEY = os.environ.get("ASI1_API_KEY")
-if not API_KEY:
-    raise ValueError("Missing ASI1_API_KEY in environment variables")
-
-
-BASE_URL = "https://api.asi1.ai/v1"
-MODEL = "asi1-mini"
 
 COLUMNS = 8
 ROWS = 4
 FRAME_COUNT = 30  # Number of animation frames
 
-headers = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json"
-}
-
-# === TOOLS ===
-choose_trip_tool = {
-    "type": "function",
-    "function": {
-        "name": "choose_trip",
-        "description": "Selects a trip based on the user's mood.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "mood": {
-                    "type": "string",
-                    "enum": ["stressed", "anxious", "sad", "happy", "energized", "tired", "angry", "neutral"]
-                },
-            },
-            "required": ["mood"]
-        }
-    }
-}
-
-# === USER INPUT ===
-initial_message = [
-    {
-        "role": "system",
-        "content": "You are a wellness assistant in LED sunglasses. When a user describes how they feel, you detect their mood and call choose_trip with it."
-    },
-    {
-        "role": "user",
-        "content": "I'm feeling really anxious today and need to calm down."
-    }
-]
-
-# === API CALL ===
-payload = {
-    "model": MODEL,
-    "messages": initial_message,
-    "tools": [choose_trip_tool],
-    "temperature": 0.7,
-    "max_tokens": 1024
-}
-
-response = requests.post(f"{BASE_URL}/chat/completions", headers=headers, json=payload)
-
-if response.status_code != 200:
-    print("API call failed:", response.text)
-    exit()
-
-response_data = response.json()
-message = response_data["choices"][0]["message"]
+SYSTEM_PROMPT = (
+    "You are a wellness assistant in LED sunglasses. "
+    "When a user describes how they feel, you detect their mood and call choose_trip with it."
+)
 
 # === MOOD & TRIP EXTRACTION ===
 def fallback_trip(mood):
@@ -86,132 +37,236 @@ def fallback_trip(mood):
         "neutral": "Balance Mode"
     }.get(mood, "Balance Mode")
 
-if "tool_calls" in message:
-    tool_args = json.loads(message["tool_calls"][0]["function"]["arguments"])
-    mood = tool_args["mood"]
-    trip = fallback_trip(mood)
-    print(f"🧠 Mood: {mood}\n🎧 Trip: {trip}")
-else:
-    print("No tool call detected.")
-    exit()
+
+async def detect_mood(text):
+    """The visitor's mood: local classifier, response cache, then ASI1's choose_trip tool call"""
+    async with ASI1Client(API_KEY) as client:
+        return await client.choose_trip(text, SYSTEM_PROMPT)
 
 # === LED FRAME UTILITIES ===
-def generate_led_matrix(columns, rows, r, g, b):
-    return [[{"r": r, "g": g, "b": b} for _ in range(columns)] for _ in range(rows)]
+BASE_FPS = 10  # Frame rate the animation speeds below are written for
+RENDER_BLOCK_PIXELS = 1 << 16  # LEDs rendered per kernel call; keeps float temporaries below the mmap threshold
+
+# name -> (trip name keywords, kernel)
+ANIMATIONS = {}
+
+
+def animation(*keywords):
+    """
+    Register an animation kernel for trips whose name contains one of keywords.
+
+    A kernel gets the animation step t of every frame (the frame index at
+    BASE_FPS, shape (frames, 1, 1)), the progress through the animation
+    (0 to 1, same shape), the LED column and row indices (shapes (1, 1,
+    columns) and (1, rows, 1)) and the (frames, rows, columns, 3) uint8
+    block to render into. It returns r, g, b arrays that broadcast to
+    (frames, rows, columns), or fills the block itself and returns it.
+    """
+    def register(func):
+        ANIMATIONS[func.__name__] = (keywords, func)
+        return func
+    return register
+
+
+HSV_SECTORS = np.array([[0, 3, 2], [1, 0, 2], [2, 0, 3], [2, 1, 0], [3, 2, 0], [0, 2, 1]])
+
 
 def hsv_to_rgb(h, s, v):
-    h = float(h)
-    s = float(s)
-    v = float(v)
+    """Hue in degrees, saturation and value 0-1 (scalars or arrays) to 0-255 uint8 r, g, b arrays"""
+    h, s, v = (np.asarray(x, dtype=np.float64) for x in (h, s, v))
+    shape = np.broadcast_shapes(h.shape, s.shape, v.shape)
     h60 = h / 60.0
-    h60f = math.floor(h60)
-    hi = int(h60f) % 6
+    h60f = np.floor(h60)
     f = h60 - h60f
-    p = int(v * (1 - s) * 255)
-    q = int(v * (1 - f * s) * 255)
-    t = int(v * (1 - (1 - f) * s) * 255)
-    v = int(v * 255)
-    if hi == 0: return v, t, p
-    elif hi == 1: return q, v, p
-    elif hi == 2: return p, v, t
-    elif hi == 3: return p, q, v
-    elif hi == 4: return t, p, v
-    elif hi == 5: return v, p, q
-
-# === ANIMATION FUNCTIONS ===
-def ocean_calm(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        val = int(100 + 80 * math.sin(i * 0.2))
-        anim.append(generate_led_matrix(columns, rows, 0, 0, val))
-    return anim
-
-def forest_focus(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        g = int(100 + 100 * math.sin(i * 0.15))
-        anim.append(generate_led_matrix(columns, rows, 0, g, 0))
-    return anim
-
-def sunrise_uplift(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        r = int((i / frames) * 255)
-        g = int((i / frames) * 128)
-        anim.append(generate_led_matrix(columns, rows, r, g, 0))
-    return anim
-
-def joy_ride(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        hue = (i / frames) * 360
-        frame = []
-        for y in range(rows):
-            row = []
-            for x in range(columns):
-                h = (hue + x * 15 + y * 10) % 360
-                r, g, b = hsv_to_rgb(h, 1.0, 1.0)
-                row.append({"r": r, "g": g, "b": b})
-            frame.append(row)
-        anim.append(frame)
-    return anim
-
-def momentum(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        val = 255 if (i % 2 == 0) else 0
-        anim.append(generate_led_matrix(columns, rows, val, 0, 0))
-    return anim
-
-def power_nap(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        val = int(80 + 40 * math.sin(i * 0.1))
-        anim.append(generate_led_matrix(columns, rows, val, val, val))
-    return anim
-
-def cool_down(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        b = int(150 + 80 * math.sin(i * 0.2))
-        anim.append(generate_led_matrix(columns, rows, 0, 0, b))
-    return anim
-
-def balance_mode(columns, rows, frames):
-    anim = []
-    for i in range(frames):
-        r = int(100 + 50 * math.sin(i * 0.2))
-        g = int(100 + 50 * math.sin(i * 0.2 + 2))
-        b = int(100 + 50 * math.sin(i * 0.2 + 4))
-        anim.append(generate_led_matrix(columns, rows, r, g, b))
-    return anim
+    # v, q, p, t; storing to uint8 truncates like int() since all are in 0-255
+    components = np.empty(shape + (4,), dtype=np.uint8)
+    components[..., 0] = v * 255
+    components[..., 1] = v * (1 - f * s) * 255
+    components[..., 2] = v * (1 - s) * 255
+    components[..., 3] = v * (1 - (1 - f) * s) * 255
+    # Gather each channel's component by flat index; "wrap" takes the sector modulo 6
+    sector = h60f.astype(np.intp)
+    first = np.arange(0, components.size, 4).reshape(shape)
+    flat = components.reshape(-1)
+    return tuple(np.take(flat, first + np.take(HSV_SECTORS[:, channel], sector, mode="wrap")) for channel in range(3))
+
+
+def wave(t, center, amplitude, rate, phase=0.0):
+    """Integer center + amplitude * sin(rate * t + phase), truncated like int()"""
+    return (center + amplitude * np.sin(t * rate + phase)).astype(np.int64)
+
+
+# === ANIMATION KERNELS ===
+@animation("ocean")
+def ocean_calm(t, progress, x, y, out):
+    return 0, 0, wave(t, 100, 80, 0.2)
+
+
+@animation("forest")
+def forest_focus(t, progress, x, y, out):
+    return 0, wave(t, 100, 100, 0.15), 0
+
+
+@animation("sunrise")
+def sunrise_uplift(t, progress, x, y, out):
+    return (progress * 255).astype(np.int64), (progress * 128).astype(np.int64), 0
+
+
+JOY_COLUMN_HUE = 15  # Degrees of hue between neighbouring LEDs in a row
+JOY_ROW_HUE = 10  # and in a column
+
+
+@animation("joy")
+def joy_ride(t, progress, x, y, out):
+    # Every LED's hue offset is a multiple of step, so a frame is one strip of hues, converted once and
+    # read as the LED grid through strides: a row starts JOY_ROW_HUE further along the strip and a
+    # column JOY_COLUMN_HUE further. Each channel is copied straight into out.
+    step = math.gcd(JOY_COLUMN_HUE, JOY_ROW_HUE)
+    length = (JOY_COLUMN_HUE * (x.shape[2] - 1) + JOY_ROW_HUE * (y.shape[1] - 1)) // step + 1
+    hue = np.fmod(progress[:, :, 0] * 360 + np.arange(length) * step, 360)  # % for non-negative hues, but faster
+    for channel, strip in enumerate(hsv_to_rgb(hue, 1.0, 1.0)):
+        frame_stride, hue_stride = strip.strides
+        grid = np.lib.stride_tricks.as_strided(
+            strip, out.shape[:3],
+            (frame_stride, hue_stride * (JOY_ROW_HUE // step), hue_stride * (JOY_COLUMN_HUE // step)),
+            writeable=False,
+        )
+        np.copyto(out[..., channel], grid)
+    return out
+
+
+@animation("momentum")
+def momentum(t, progress, x, y, out):
+    return np.where(np.floor(t) % 2 == 0, 255, 0), 0, 0
+
+
+@animation("nap")
+def power_nap(t, progress, x, y, out):
+    val = wave(t, 80, 40, 0.1)
+    return val, val, val
+
+
+@animation("cool")
+def cool_down(t, progress, x, y, out):
+    return 0, 0, wave(t, 150, 80, 0.2)
+
+
+@animation("balance")
+def balance_mode(t, progress, x, y, out):
+    return wave(t, 100, 50, 0.2), wave(t, 100, 50, 0.2, 2), wave(t, 100, 50, 0.2, 4)
+
+
+DEFAULT_ANIMATION = "balance_mode"
+
 
 # === TRIP → ANIMATION ROUTER ===
-def generate_animation(trip, columns, rows, frames):
+def animation_for(trip):
+    """Name of the first registered animation with a keyword in the trip name"""
     trip = trip.lower()
-    if "ocean" in trip:
-        return ocean_calm(columns, rows, frames)
-    elif "forest" in trip:
-        return forest_focus(columns, rows, frames)
-    elif "sunrise" in trip:
-        return sunrise_uplift(columns, rows, frames)
-    elif "joy" in trip:
-        return joy_ride(columns, rows, frames)
-    elif "momentum" in trip:
-        return momentum(columns, rows, frames)
-    elif "nap" in trip:
-        return power_nap(columns, rows, frames)
-    elif "cool" in trip:
-        return cool_down(columns, rows, frames)
-    elif "balance" in trip:
-        return balance_mode(columns, rows, frames)
-    else:
-        return balance_mode(columns, rows, frames)  # fallback
+    for name, (keywords, _) in ANIMATIONS.items():
+        if any(keyword in trip for keyword in keywords):
+            return name
+    return DEFAULT_ANIMATION  # fallback
+
+
+def iter_animation(trip, columns, rows, frames, fps=BASE_FPS, out=None):
+    """
+    Yield the animation as consecutive (n, rows, columns, 3) uint8 blocks
+    of frames; with out, a (frames, rows, columns, 3) uint8 array, the
+    blocks are rendered in place as views of it.
+    """
+    _, kernel = ANIMATIONS[animation_for(trip)]
+    x = np.arange(columns)[None, None, :]
+    y = np.arange(rows)[None, :, None]
+
+    # Blocks of frames keep the kernels' float temporaries small
+    block = max(1, RENDER_BLOCK_PIXELS // max(1, rows * columns))
+    for start in range(0, frames, block):
+        index = np.arange(start, min(start + block, frames), dtype=np.float64)[:, None, None]
+        if out is None:
+            target = np.empty((len(index), rows, columns, 3), dtype=np.uint8)
+        else:
+            target = out[start:start + len(index)]
+        rgb = kernel(index * (BASE_FPS / fps), index / frames, x, y, target)
+        if rgb is not target:
+            for channel, values in enumerate(rgb):
+                if getattr(values, "dtype", None) != np.uint8:
+                    values = np.clip(values, 0, 255)
+                target[..., channel] = values
+        yield target
+
+
+def render_animation(trip, columns, rows, frames, fps=BASE_FPS):
+    """(frames, rows, columns, 3) uint8 animation for a trip, at any geometry, length and frame rate"""
+    out = np.empty((frames, rows, columns, 3), dtype=np.uint8)
+    for _ in iter_animation(trip, columns, rows, frames, fps, out):
+        pass
+    return out
+
+
+def frames_to_dicts(frames):
+    """Nested [frame][row][column] {"r", "g", "b"} lists, the animation JSON schema"""
+    return [
+        [[{"r": r, "g": g, "b": b} for r, g, b in row] for row in frame]
+        for frame in frames.tolist()
+    ]
+
+
+def generate_animation(trip, columns, rows, frames, fps=BASE_FPS):
+    return frames_to_dicts(render_animation(trip, columns, rows, frames, fps))
+
+
+def iter_animation_dicts(trip, columns, rows, frames, fps=BASE_FPS):
+    """Frames in the animation JSON schema, one at a time"""
+    for block in iter_animation(trip, columns, rows, frames, fps):
+        for frame in block:
+            yield frames_to_dicts(frame[None])[0]
 
 # === GENERATE & SAVE ===
-animation = generate_animation(trip, COLUMNS, ROWS, FRAME_COUNT)
+def main():
+    parser = argparse.ArgumentParser(description="Generate the LED trip animation for how a visitor feels")
+    parser.add_argument("text", nargs="?", default="I'm feeling really anxious today and need to calm down.")
+    parser.add_argument("--output", default="trip_animation.json")
+    parser.add_argument("--columns", type=int, default=COLUMNS)
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--frames", type=int, default=FRAME_COUNT)
+    parser.add_argument("--fps", type=float, default=BASE_FPS)
+    parser.add_argument("--compact", action="store_true", help="write JSON without indentation")
+    args = parser.parse_args()
+    if not API_KEY:
+        raise ValueError("Missing ASI1_API_KEY in environment variables")
+
+    # The default animations come pre-rendered from the catalogue, warmed while the mood is detected
+    from trip_catalogue import TripCatalogue  # trip_catalogue imports this module
+    catalogue = None
+    if (args.columns, args.rows, args.frames, args.fps) == (COLUMNS, ROWS, FRAME_COUNT, BASE_FPS):
+        catalogue = TripCatalogue()
+        catalogue.warm()
+
+    try:
+        result = asyncio.run(detect_mood(args.text))
+    except APIError as e:
+        print(e)
+        return 1
+    if result["mood"] is None:
+        print("No tool call detected.")
+        return 1
+
+    trip = fallback_trip(result["mood"])
+    print(f"🧠 Mood: {result['mood']}\n🎧 Trip: {trip}")
+
+    if catalogue is not None:
+        shutil.copyfile(catalogue.json_path(trip, indent=None if args.compact else 2), args.output)
+    else:
+        # Frames are rendered while they are written, so memory doesn't grow with the length
+        animation = iter_animation_dicts(trip, args.columns, args.rows, args.frames, args.fps)
+
+        with open(args.output, "w") as f:
+            json_stream.dump(animation, f, indent=None if args.compact else 2)
+
+    print(f"✅ Saved LED frames to {args.output}")
+    return 0
 
-with open("trip_animation.json", "w") as f:
-    json.dump(animation, f, indent=2)
 
-print("✅ Saved LED frames to trip_animation.json")
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+"""
+Offline mood classifier for visitor sentences.
+
+Scores the eight choose_trip moods from weighted keyword stems, so a plain
+"I'm stressed" picks a trip in well under a millisecond without network.
+Keywords right after a negation ("not tired") are ignored. The confidence
+is the top score against the runner-up and a prior, and callers fall back
+to the chat model when it is below MIN_CONFIDENCE: mixed or unknown moods
+still get the model's judgement.
+
+    mood, confidence = classify_mood("I'm feeling really anxious today")
+    if confidence >= MIN_CONFIDENCE:
+        message = tool_call_message(mood)   # same shape as the API's reply
+"""
+import json
+
+from llm_cache import NEGATIONS, normalize_text
+
+MOODS = ["stressed", "anxious", "sad", "happy", "energized", "tired", "angry", "neutral"]
+MIN_CONFIDENCE = 0.6
+PRIOR = 0.5  # Evidence a single keyword has to beat; one strong keyword gives 0.67
+NEGATION_SPAN = 3  # Words after a negation that it applies to
+SHORT_STEM = 3
+
+# Stem -> weight; a stem matches any word starting with it. Stems of up to
+# SHORT_STEM letters and those in WHOLE_WORDS only match whole words ("mad"
+# is not "made", "blue" is not "bluetooth"), so their other forms are listed.
+MOOD_KEYWORDS = {
+    "stressed": {"stress": 1.0, "overwhelm": 1.0, "pressure": 0.8, "swamped": 0.8, "burn": 0.6, "burned": 0.6,
+                 "burnt": 0.6, "burnout": 0.8, "hectic": 0.8, "tense": 0.7, "tension": 0.7, "busy": 0.5,
+                 "deadline": 0.6},
+    "anxious": {"anxi": 1.0, "nervous": 1.0, "worr": 1.0, "panic": 1.0, "uneasy": 0.8, "restless": 0.6,
+                "scared": 0.8, "afraid": 0.8, "jitter": 0.8, "on edge": 0.8},
+    "sad": {"sad": 1.0, "sadness": 1.0, "sadder": 1.0, "saddest": 1.0, "sadly": 0.7, "depress": 1.0,
+            "unhappy": 1.0, "lonely": 0.9, "blue": 0.5, "miserable": 1.0, "heartbroken": 1.0, "grief": 1.0,
+            "griev": 1.0, "upset": 0.7, "cry": 0.8, "crying": 0.8, "cried": 0.8, "cries": 0.8, "low": 0.5,
+            "feeling down": 0.8, "feel down": 0.8},
+    "happy": {"happy": 1.0, "glad": 0.9, "great": 0.7, "good": 0.6, "joy": 1.0, "joyful": 1.0, "joyous": 1.0,
+              "cheer": 0.8, "content": 0.6, "wonderful": 0.8, "amazing": 0.8, "excited": 0.7, "fantastic": 0.8,
+              "awesome": 0.8},
+    "energized": {"energ": 1.0, "pumped": 1.0, "hyped": 1.0, "motivat": 0.8, "alive": 0.7, "active": 0.6,
+                  "buzz": 0.7, "charged": 0.8, "ready to go": 0.9},
+    "tired": {"tired": 1.0, "exhaust": 1.0, "sleepy": 1.0, "drained": 1.0, "fatigue": 1.0, "weary": 0.9,
+              "worn out": 1.0, "drowsy": 1.0, "no energy": 1.0, "sleep": 0.6, "sleeping": 0.6},
+    "angry": {"angry": 1.0, "anger": 1.0, "mad": 0.9, "madder": 0.9, "furious": 1.0, "annoy": 0.8, "irritat": 0.8,
+              "frustrat": 0.8, "pissed": 1.0, "rage": 1.0, "raging": 1.0, "enraged": 1.0, "livid": 1.0,
+              "resent": 0.7},
+    "neutral": {"neutral": 1.0, "okay": 0.7, "ok": 0.7, "fine": 0.7, "alright": 0.7, "normal": 0.7, "meh": 0.7,
+                "so so": 0.8, "nothing special": 0.9},
+}
+# Stems that start unrelated words ("bluetooth", "goodbye", "activity", "contentious")
+WHOLE_WORDS = {"blue", "good", "great", "content", "active", "alive", "buzz", "busy", "burn", "tense", "fine",
+               "normal", "sleep", "rage"}
+
+# Single-word stems, and phrases matched against the normalized text
+_STEMS = [(stem, mood, weight, len(stem) > SHORT_STEM and stem not in WHOLE_WORDS)  # Last: prefix match
+          for mood, words in MOOD_KEYWORDS.items() for stem, weight in words.items() if " " not in stem]
+_PHRASES = [(phrase, mood, weight) for mood, words in MOOD_KEYWORDS.items()
+            for phrase, weight in words.items() if " " in phrase]
+
+
+def mood_scores(text):
+    """Keyword evidence per mood for a sentence"""
+    normalized = normalize_text(text)
+    words = normalized.split()
+    scores = dict.fromkeys(MOODS, 0.0)
+
+    negated_until = -1
+    for i, word in enumerate(words):
+        if word in NEGATIONS:
+            negated_until = i + NEGATION_SPAN
+            continue
+        if i <= negated_until:
+            continue
+        # Longest matching stem wins
+        matches = [stem for stem in _STEMS
+                   if word == stem[0] or (stem[3] and word.startswith(stem[0]))]
+        best = max(matches, key=lambda stem: len(stem[0]), default=None)
+        if best is not None:
+            scores[best[1]] += best[2]
+
+    padded = f" {normalized} "
+    for phrase, mood, weight in _PHRASES:
+        if f" {phrase} " in padded and not any(f" {negation} {phrase} " in padded for negation in NEGATIONS):
+            scores[mood] += weight
+    return scores
+
+
+def classify_mood(text):
+    """(mood, confidence 0-1); ("neutral", 0.0) when no keyword matched"""
+    scores = mood_scores(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (mood, top), (_, second) = ranked[0], ranked[1]
+    if top <= 0:
+        return "neutral", 0.0
+    return mood, top / (top + second + PRIOR)
+
+
+def tool_call_message(mood):
+    """An assistant message calling choose_trip(mood), shaped like the chat API's"""
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": "local-mood",
+            "type": "function",
+            "function": {"name": "choose_trip", "arguments": json.dumps({"mood": mood})},
+        }],
+    }
@@ -0,0 +1,312 @@
+"""
+Frame-accurate playback scheduling for the viewers.
+
+Instead of polling the audio position on a fixed timer and repainting on
+every tick, PlaybackScheduler looks up the visible frame for the current
+position, emits frame_changed only when it differs from the last one and
+arms a precise single-shot timer for the moment the next frame starts.
+
+PlaybackClock is the single source of the track position. The scheduler
+polls it, so the painter and the device streamer both follow the audio
+that is actually playing, across seeks, pauses and speed changes.
+
+AudioScrubber coalesces the seeks fired while dragging the seek slider into
+one decoder restart, and can play short snippets from decoded PCM instead.
+"""
+import math
+import time
+from bisect import bisect_right
+
+import numpy as np
+import pygame
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSignal
+
+END_POLL_MS = 100  # After the last frame, check this often whether playback ended
+SEEK_DEBOUNCE_MS = 150  # Seek the audio once the playhead rests this long
+SNIPPET_MS = 80  # Length of a scrub snippet, also the minimum gap between two
+SNIPPET_FADE_MS = 5  # Fade in/out so snippets don't click
+VARISPEED_CHUNK_MS = 1000  # Output length of each resampled chunk queued at speeds other than 1x
+
+# Mixer channels for decoded PCM; music playback has its own stream
+VARISPEED_CHANNEL = 0
+SCRUB_CHANNEL = 1
+
+
+class PlaybackScheduler(QObject):
+    frame_changed = pyqtSignal(int)
+    finished = pyqtSignal()
+
+    def __init__(self, position_ms, parent=None):
+        """position_ms() returns the track position in ms, or None once playback stopped"""
+        super().__init__(parent)
+        self.position_ms = position_ms
+        self.frame_times = []
+        self.end_ms = None
+        self.speed = 1.0
+        self.current_index = -1
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+    def set_frame_times(self, frame_times, end_ms=None):
+        """
+        Sorted start time of every frame in ms. With end_ms, playback
+        finishes there instead of when position_ms() returns None.
+        """
+        self.frame_times = list(frame_times)
+        self.end_ms = end_ms
+        self.current_index = -1
+
+    def extend_frame_times(self, frame_times):
+        """Append frames that start after the current last one, e.g. while they are being generated"""
+        self.frame_times.extend(frame_times)
+
+    def is_active(self):
+        return self.timer.isActive()
+
+    def start(self):
+        self.current_index = -1
+        self.tick()
+
+    def stop(self):
+        self.timer.stop()
+
+    def frame_at(self, position_ms):
+        return max(0, bisect_right(self.frame_times, position_ms) - 1)
+
+    def tick(self):
+        position = self.position_ms()
+        if position is None or not self.frame_times or (self.end_ms is not None and position >= self.end_ms):
+            self.timer.stop()
+            self.finished.emit()
+            return
+
+        index = self.frame_at(position)
+        if index != self.current_index:
+            self.current_index = index
+            self.frame_changed.emit(index)
+
+        if index + 1 < len(self.frame_times):
+            boundary = self.frame_times[index + 1]
+        elif self.end_ms is not None:
+            boundary = self.end_ms
+        else:
+            self.timer.start(END_POLL_MS)
+            return
+
+        # Track time until the next frame boundary, in wall-clock ms
+        delay = (boundary - position) / self.speed
+        self.timer.start(max(1, math.ceil(delay)))
+
+
+def mixer_sound(y):
+    """Mono float samples -> pygame Sound in the mixer's channel layout"""
+    _, _, channels = pygame.mixer.get_init()
+    pcm = (np.clip(y, -1.0, 1.0) * 32767).astype(np.int16)
+    if channels > 1:
+        pcm = np.repeat(pcm[:, None], channels, axis=1)
+    return pygame.mixer.Sound(buffer=pcm.tobytes())
+
+
+class PlaybackClock:
+    """
+    Track position of the audio that is playing.
+
+    At 1x the track plays through pygame.mixer.music, and the position is the
+    offset it was started at plus get_pos(), which counts the samples the
+    mixer consumed since that play() call. Other speeds need decoded PCM
+    (set_pcm): it is resampled in chunks queued on a mixer channel, and the
+    position advances by whole chunks as the channel consumes them.
+    """
+
+    def __init__(self):
+        self.speed = 1.0
+        self.pcm = None  # Mono float samples at the mixer frequency, e.g. a PCM cache memmap
+        self.playing = False
+        self._start_ms = 0.0  # Track position the current source started at, or the paused position
+        self._channel = None
+        self._chunks = []  # Track (start_ms, end_ms) of the playing and the queued chunk
+        self._chunk_started = 0.0
+        self._next_ms = 0.0
+
+    def load(self, file_path):
+        self.stop()
+        pygame.mixer.music.load(file_path)
+        self.pcm = None
+        self._start_ms = 0.0
+
+    def set_pcm(self, pcm):
+        """Enables speeds other than 1x; playback switches over if it is already running"""
+        self.pcm = pcm
+        if self.playing and self.speed != 1.0:
+            self.pause()
+            self.play()
+
+    def effective_speed(self):
+        """Speed the audio really plays at; 1x until PCM is available"""
+        return self.speed if self.pcm is not None else 1.0
+
+    def position_ms(self):
+        """Track position in ms, None once playback reached the end"""
+        if not self.playing:
+            return self._start_ms
+        if self._channel is None:
+            position = pygame.mixer.music.get_pos()
+            if position == -1 or not pygame.mixer.music.get_busy():
+                return self._ended()
+            return self._start_ms + position
+
+        self._refill()
+        if not self._chunks or not self._channel.get_busy():
+            return self._ended()
+        start, end = self._chunks[0]
+        elapsed = (time.perf_counter() - self._chunk_started) * 1000 * self.speed
+        return min(start + elapsed, end)
+
+    def play(self):
+        if self.playing:
+            return
+        self.playing = True
+        if self.effective_speed() != 1.0:
+            self._play_varispeed(self._start_ms)
+        else:
+            pygame.mixer.music.play(start=self._start_ms / 1000.0)
+
+    def pause(self):
+        if not self.playing:
+            return
+        position = self.position_ms()
+        self.stop()
+        if position is not None:
+            self._start_ms = position
+
+    def stop(self):
+        self.playing = False
+        pygame.mixer.music.stop()
+        if self._channel is not None:
+            self._channel.stop()
+            self._channel = None
+        self._chunks = []
+
+    def seek(self, time_ms):
+        playing = self.playing
+        self.stop()
+        self._start_ms = float(time_ms)
+        if playing:
+            self.play()
+
+    def set_speed(self, speed):
+        playing = self.playing
+        self.pause()
+        self.speed = speed
+        if playing:
+            self.play()
+
+    def _ended(self):
+        self.stop()
+        self._start_ms = 0.0  # The next play() starts over
+        return None
+
+    def _play_varispeed(self, start_ms):
+        self._channel = pygame.mixer.Channel(VARISPEED_CHANNEL)
+        self._chunks = []
+        self._next_ms = start_ms
+        first = self._next_chunk()
+        if first is None:
+            self._channel.stop()
+            return
+        self._channel.play(first)
+        self._chunk_started = time.perf_counter()
+        queued = self._next_chunk()
+        if queued is not None:
+            self._channel.queue(queued)
+
+    def _refill(self):
+        # get_queue() is None once the queued chunk has become the playing one
+        if len(self._chunks) < 2 or self._channel.get_queue() is not None:
+            return
+        start, end = self._chunks.pop(0)
+        self._chunk_started += (end - start) / self.speed / 1000.0
+        queued = self._next_chunk()
+        if queued is not None:
+            self._channel.queue(queued)
+
+    def _next_chunk(self):
+        sr = pygame.mixer.get_init()[0]
+        a = int(self._next_ms * sr / 1000)
+        b = min(a + int(VARISPEED_CHUNK_MS * self.speed * sr / 1000), len(self.pcm))
+        if a >= b:
+            return None
+
+        # Only this chunk of the (memory-mapped) track is read and converted
+        positions = np.arange(int((b - a) / self.speed)) * self.speed
+        out = np.interp(positions, np.arange(b - a), self.pcm[a:b])
+
+        start_ms = a * 1000.0 / sr
+        self._next_ms = b * 1000.0 / sr
+        self._chunks.append((start_ms, self._next_ms))
+        return mixer_sound(out)
+
+
+class AudioScrubber(QObject):
+    """Debounces seeks while the playhead is being dragged"""
+    seek_requested = pyqtSignal(float)  # Track position in ms
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pending_ms = None
+        self.pcm = None  # Mono float samples at the mixer frequency
+        self.last_snippet = 0.0
+        self.channel = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def set_pcm(self, pcm):
+        self.pcm = pcm
+
+    def scrub(self, time_ms, snippet=False):
+        """Move the playhead; the audio follows SEEK_DEBOUNCE_MS after the last call"""
+        self.pending_ms = time_ms
+        self.timer.start(SEEK_DEBOUNCE_MS)
+        if snippet:
+            self.play_snippet(time_ms)
+
+    def flush(self):
+        """Seek to the pending position now, e.g. when the slider is released"""
+        self.timer.stop()
+        if self.pending_ms is not None:
+            time_ms, self.pending_ms = self.pending_ms, None
+            self.seek_requested.emit(time_ms)
+
+    def cancel(self):
+        self.timer.stop()
+        self.pending_ms = None
+        if self.channel is not None:
+            self.channel.stop()
+
+    def play_snippet(self, time_ms):
+        if self.pcm is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_snippet < SNIPPET_MS / 1000.0:
+            return
+        self.last_snippet = now
+
+        sr = pygame.mixer.get_init()[0]
+        start = int(time_ms * sr / 1000)
+        snippet = self.pcm[start:start + int(SNIPPET_MS * sr / 1000)]
+        if len(snippet) == 0:
+            return
+        fade = min(int(SNIPPET_FADE_MS * sr / 1000), len(snippet) // 2)
+        envelope = np.ones(len(snippet), dtype=np.float32)
+        if fade:
+            envelope[:fade] = np.linspace(0, 1, fade)
+            envelope[-fade:] = np.linspace(1, 0, fade)
+
+        if self.channel is None:
+            self.channel = pygame.mixer.Channel(SCRUB_CHANNEL)
+        self.channel.play(mixer_sound(snippet * envelope))
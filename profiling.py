@@ -0,0 +1,189 @@
+"""
+Named, nestable profiling spans for the analysis pipeline.
+
+    from profiling import span, PROFILER
+
+    with span("stft"):
+        ...
+
+    PROFILER.results()   # [{"path": "features/rms", "calls": 1, "wall_s": ..., ...}]
+    print(PROFILER.report())
+
+Spans always record wall and CPU time, which costs about a microsecond per
+span, so they stay on in production. Memory peaks are recorded only while
+tracemalloc is tracing (see Profiler.trace_memory), since tracing slows
+every allocation down. Setting cprofile_stage runs cProfile around every
+span with that name.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class SpanStats:
+    """Aggregated timings for every call of one span path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.mem_peak_bytes = None
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "calls": self.calls,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "mem_peak_bytes": self.mem_peak_bytes,
+        }
+
+
+class _OpenSpan:
+    __slots__ = ("path", "mem_start", "mem_peak")
+
+    def __init__(self, path):
+        self.path = path
+        self.mem_start = 0
+        self.mem_peak = 0
+
+
+class Profiler:
+    def __init__(self, cprofile_stage=None):
+        self.cprofile_stage = cprofile_stage
+        self.cprofile_stats = None
+        self._stats = {}
+        self._order = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def trace_memory(self, enabled=True):
+        """Start or stop tracemalloc so spans also record their memory peak"""
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._order = {}
+            self.cprofile_stats = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        current = _OpenSpan(f"{parent.path}/{name}" if parent else name)
+        # Remember first-entry order so parents are listed before their children
+        self._order.setdefault(current.path, len(self._order))
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # reset_peak() is global, so fold the peak seen so far into the parent first
+            mem_now, mem_peak = tracemalloc.get_traced_memory()
+            if parent:
+                parent.mem_peak = max(parent.mem_peak, mem_peak)
+            tracemalloc.reset_peak()
+            current.mem_start = current.mem_peak = mem_now
+
+        profile = None
+        if name == self.cprofile_stage:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        stack.append(current)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            stack.pop()
+
+            if profile is not None:
+                profile.disable()
+                self._add_cprofile(profile)
+
+            mem_peak = None
+            if tracing and tracemalloc.is_tracing():
+                current.mem_peak = max(current.mem_peak, tracemalloc.get_traced_memory()[1])
+                mem_peak = current.mem_peak - current.mem_start
+                if parent:
+                    parent.mem_peak = max(parent.mem_peak, current.mem_peak)
+
+            self._record(current.path, wall, cpu, mem_peak)
+
+    def _record(self, path, wall, cpu, mem_peak):
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                stats = self._stats[path] = SpanStats(path)
+            stats.calls += 1
+            stats.wall_s += wall
+            stats.cpu_s += cpu
+            if mem_peak is not None:
+                stats.mem_peak_bytes = max(stats.mem_peak_bytes or 0, mem_peak)
+
+    def _add_cprofile(self, profile):
+        with self._lock:
+            if self.cprofile_stats is None:
+                self.cprofile_stats = pstats.Stats(profile)
+            else:
+                self.cprofile_stats.add(profile)
+
+    def results(self):
+        """Aggregated span stats in the order the spans were first entered"""
+        with self._lock:
+            paths = sorted(self._stats, key=lambda path: self._order.get(path, len(self._order)))
+            return [self._stats[path].as_dict() for path in paths]
+
+    def stage_times(self):
+        """Wall time per span path, e.g. {"features/rms": 0.02}"""
+        return {r["path"]: r["wall_s"] for r in self.results()}
+
+    def report(self):
+        return format_report(self.results())
+
+    def dump_cprofile(self, path):
+        """Write the cProfile data in pstats format, e.g. for snakeviz"""
+        if self.cprofile_stats is not None:
+            self.cprofile_stats.dump_stats(path)
+
+    def cprofile_report(self, limit=25):
+        if self.cprofile_stats is None:
+            return f"No cProfile data for stage {self.cprofile_stage!r}"
+        out = io.StringIO()
+        self.cprofile_stats.stream = out
+        self.cprofile_stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+def format_report(results):
+    """Indented text table for a list of Profiler.results() dicts"""
+    lines = [f"{'span':<40}{'calls':>8}{'wall s':>10}{'cpu s':>10}{'mem peak':>12}"]
+    for r in results:
+        depth = r["path"].count("/")
+        name = "  " * depth + r["path"].rsplit("/", 1)[-1]
+        mem = f"{r['mem_peak_bytes'] / (1024 * 1024):.1f} MB" if r["mem_peak_bytes"] is not None else "-"
+        lines.append(f"{name:<40}{r['calls']:>8}{r['wall_s']:>10.3f}{r['cpu_s']:>10.3f}{mem:>12}")
+    return "\n".join(lines)
+
+
+PROFILER = Profiler()
+
+
+def span(name):
+    return PROFILER.span(name)
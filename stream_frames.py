@@ -1,7 +1,25 @@
-import os
-import requests
-import json
+"""
+Stream LED frames from the ASI1 chat completions API.
+
+The response is parsed incrementally: server-sent events are reassembled
+from the byte stream, the model's text deltas are scanned for complete JSON
+objects (which may be split across any number of deltas) and every frame is
+yielded as soon as its closing brace arrives. Nothing is collected, so
+memory stays flat however long the stream runs.
+
+    for frame in stream_led_frames("audio.mp3"):
+        show(frame["frame"])
+
+By default the model gets a compact feature summary of the track (see
+analysis.feature_summary) rather than the base64-encoded file, which keeps
+requests a few kB instead of megabytes and lets long tracks fit in the
+model's context. payload="audio" sends the file as before.
+"""
 import base64
+import json
+import os
+
+from http_session import get_session
 
 BASE_URL = "https://api.asi1.ai/v1"
 API_KEY = os.getenv("ASI1_API_KEY")  # Make sure to set this in your environment
@@ -11,19 +29,150 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+
 def audio_to_base64(audio_path):
     with open(audio_path, "rb") as f:
         return base64.b64encode(f.read()).decode()
 
-def stream_led_frames(audio_path):
-    # Convert audio file to base64 to send in message
-    audio_b64 = audio_to_base64(audio_path)
 
+def _field_value(line):
+    value = line.split(":", 1)[1]
+    return value[1:] if value.startswith(" ") else value
+
+
+def iter_sse_data(byte_chunks):
+    """
+    Yield the data of every server-sent event in a byte stream.
+
+    Lines may be split across chunks; multi-line data fields are joined with
+    newlines and comment lines are skipped. A stream without SSE framing
+    (plain JSON lines) yields each line as its own event.
+    """
+    buffer = b""
+    data_lines = []
+    for chunk in byte_chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r").decode("utf-8")
+            if not line:
+                # A blank line ends the event
+                if data_lines:
+                    yield "\n".join(data_lines)
+                    data_lines = []
+            elif line.startswith("data:"):
+                data_lines.append(_field_value(line))
+            elif line.startswith(":") or line.split(":", 1)[0] in ("event", "id", "retry"):
+                continue
+            else:
+                yield line
+
+    line = buffer.rstrip(b"\r").decode("utf-8")
+    if line.startswith("data:"):
+        data_lines.append(_field_value(line))
+    elif line:
+        yield line
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+class JSONObjectStream:
+    """
+    Finds complete top-level JSON objects in text that arrives in fragments.
+
+    Only the object currently being received is buffered, and the scan state
+    (nesting depth, inside a string, after a backslash) carries over between
+    feed() calls, so every character is looked at once.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        """Return the objects completed by text; text outside objects is ignored"""
+        objects = []
+        start = 0 if self.depth else None
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char == "{":
+                if self.depth == 0:
+                    start = i
+                self.depth += 1
+            elif char == "}" and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.buffer.append(text[start:i + 1])
+                    raw = "".join(self.buffer)
+                    self.buffer = []
+                    start = None
+                    try:
+                        objects.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        print(f"Skipping malformed object: {raw[:80]}")
+        if self.depth and start is not None:
+            self.buffer.append(text[start:])
+        return objects
+
+
+def iter_frames(byte_chunks):
+    """Yield {"frame_index", "frame"} dicts from a streamed chat completion (or plain frame lines)"""
+    objects = JSONObjectStream()
+    for data in iter_sse_data(byte_chunks):
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            event = None
+
+        if isinstance(event, dict) and "choices" in event:
+            text = "".join((choice.get("delta") or {}).get("content") or "" for choice in event["choices"])
+            candidates = objects.feed(text)
+        elif isinstance(event, dict):
+            candidates = [event]
+        else:
+            candidates = objects.feed(data)
+
+        for candidate in candidates:
+            if "frame_index" in candidate and "frame" in candidate:
+                yield candidate
+
+
+def user_content(audio_path, payload="features"):
+    """The user message describing the track: a feature summary or the base64 audio"""
+    if payload == "audio":
+        # Convert audio file to base64 to send in message
+        return f"Audio data (base64): {audio_to_base64(audio_path)}"
+    if payload != "features":
+        raise ValueError(f"Unknown payload: {payload}")
+    from analysis import feature_summary  # librosa only loads when a summary is needed
+
+    summary = feature_summary(audio_path)
+    return (
+        "Audio features (curves are 0-100, one value every curve_step_ms): "
+        + json.dumps(summary, separators=(",", ":"))
+    )
+
+
+def stream_led_frames(audio_path, session=None, payload="features"):
+    """Generator of {"frame_index", "frame"} dicts, yielded as soon as each frame is complete"""
+    track = "a base64-encoded audio track" if payload == "audio" else "a summary of an audio track's features"
     system_message = {
         "role": "system",
         "content": (
             "You are a smart LED controller. "
-            "Given a base64-encoded audio track, generate a sequence of LED frames chunk by chunk. "
+            f"Given {track}, generate a sequence of LED frames chunk by chunk. "
             "Each frame is a 2D matrix representing LED colors as RGB values from 0 to 255. "
             "Stream the frames as JSON objects incrementally in this format: "
             "{\"frame_index\": <int>, \"frame\": [[{\"r\":0,\"g\":0,\"b\":0}, ...], ...]} "
@@ -33,10 +182,10 @@ def stream_led_frames(audio_path):
 
     user_message = {
         "role": "user",
-        "content": f"Audio data (base64): {audio_b64}"
+        "content": user_content(audio_path, payload)
     }
 
-    payload = {
+    request = {
         "model": "asi1-mini",
         "messages": [system_message, user_message],
         "temperature": 0.7,
@@ -44,41 +193,18 @@ def stream_led_frames(audio_path):
         "stream": True  # Enable streaming to receive chunked frames
     }
 
-    response = requests.post(
-        f"{BASE_URL}/chat/completions",
-        headers=HEADERS,
-        json=payload,
-        stream=True
-    )
-
-    frames = []
-    print("Receiving frames...")
-
-    try:
-        for line in response.iter_lines():
-            if line:
-                # Each line is expected to be a JSON chunk with frames info
-                decoded_line = line.decode('utf-8')
-                # Usually ASI1 streams JSON objects line by line
-                try:
-                    data = json.loads(decoded_line)
-                    # Example of expected data:
-                    # {"frame_index": 0, "frame": [[{"r":10,"g":20,"b":30}, ...], ...]}
-                    if "frame_index" in data and "frame" in data:
-                        print(f"Received frame {data['frame_index']}")
-                        frames.append(data)
-                    else:
-                        print("Received unknown chunk:", data)
-                except json.JSONDecodeError:
-                    print("Non-JSON chunk:", decoded_line)
-    except Exception as e:
-        print(f"Error reading stream: {e}")
-
-    print(f"Total frames received: {len(frames)}")
-    return frames
+    session = session or get_session()
+    with session.post(f"{BASE_URL}/chat/completions", headers=HEADERS, json=request, stream=True) as response:
+        response.raise_for_status()
+        # chunk_size=None hands over data as soon as it arrives
+        yield from iter_frames(response.iter_content(chunk_size=None))
 
 
 if __name__ == "__main__":
     audio_file = "audio.mp3"  # Replace with your audio path
-    led_frames = stream_led_frames(audio_file)
-    # Here you can save frames or feed them to your Qt app for display
+    print("Receiving frames...")
+    count = 0
+    for led_frame in stream_led_frames(audio_file):
+        count += 1
+        # Here you can save frames or feed them to your Qt app for display
+    print(f"Total frames received: {count}")
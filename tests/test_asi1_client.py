@@ -0,0 +1,144 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+from aiohttp import web
+
+import asi1_client
+from asi1_client import APIError, ASI1Client
+from llm_cache import ResponseCache
+
+AMBIGUOUS = "the weather is whatever today"  # Too unclear for the local classifier
+
+
+def completion(mood):
+    call = {"type": "function", "function": {"name": "choose_trip", "arguments": json.dumps({"mood": mood})}}
+    return {"choices": [{"message": {"role": "assistant", "content": None, "tool_calls": [call]}}]}
+
+
+@contextlib.asynccontextmanager
+async def stub_api(handler):
+    """Serve handler as /chat/completions on 127.0.0.1; yields the base URL"""
+    app = web.Application()
+    app.router.add_post("/chat/completions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(asi1_client, "BACKOFF_S", 0)
+
+
+def test_503_is_retried():
+    statuses = [503, 503, 200]
+    calls = []
+
+    async def handler(request):
+        calls.append(await request.json())
+        status = statuses[len(calls) - 1]
+        if status != 200:
+            return web.Response(status=status, text="busy", headers={"Retry-After": "0"})
+        return web.json_response(completion("calm"))
+
+    async def run():
+        async with stub_api(handler) as url, ASI1Client("key", url) as client:
+            return await client.chat({"model": "m"})
+
+    assert asyncio.run(run()) == completion("calm")
+    assert len(calls) == 3
+
+
+def test_retries_run_out():
+    calls = []
+
+    async def handler(request):
+        calls.append(1)
+        return web.Response(status=503, text="busy")
+
+    async def run():
+        async with stub_api(handler) as url, ASI1Client("key", url, max_retries=2) as client:
+            await client.chat({"model": "m"})
+
+    with pytest.raises(APIError) as error:
+        asyncio.run(run())
+    assert error.value.status == 503
+    assert len(calls) == 3
+
+
+def test_400_raises_without_retry():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.headers["Authorization"])
+        return web.Response(status=400, text="bad request: unknown model")
+
+    async def run():
+        async with stub_api(handler) as url, ASI1Client("key", url) as client:
+            await client.chat({"model": "m"})
+
+    with pytest.raises(APIError) as error:
+        asyncio.run(run())
+    assert error.value.status == 400
+    assert "unknown model" in str(error.value)
+    assert calls == ["Bearer key"]
+
+
+def test_concurrency_is_capped():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return web.json_response(completion("calm"))
+
+    async def run():
+        async with stub_api(handler) as url, ASI1Client("key", url, max_concurrency=3) as client:
+            return await asyncio.gather(*(client.chat({"n": i}) for i in range(10)))
+
+    assert len(asyncio.run(run())) == 10
+    assert peak == 3
+
+
+def test_choose_trip_uses_the_tool_call_then_the_cache(tmp_path):
+    calls = []
+
+    async def handler(request):
+        payload = await request.json()
+        calls.append(payload)
+        return web.json_response(completion("tired"))
+
+    async def run():
+        cache = ResponseCache(str(tmp_path / "llm.sqlite"))
+        async with stub_api(handler) as url, ASI1Client("key", url, cache=cache) as client:
+            return await client.choose_trip(AMBIGUOUS), await client.choose_trip(AMBIGUOUS)
+
+    first, second = asyncio.run(run())
+    assert (first["mood"], first["source"]) == ("tired", "api")
+    assert (second["mood"], second["source"]) == ("tired", "cache")
+    assert len(calls) == 1
+    assert calls[0]["tools"][0]["function"]["name"] == "choose_trip"
+
+
+def test_clear_moods_never_reach_the_api():
+    async def handler(request):
+        raise AssertionError("the API was called")
+
+    async def run():
+        async with stub_api(handler) as url, ASI1Client("key", url) as client:
+            return await client.choose_trip("I'm so stressed and overwhelmed")
+
+    result = asyncio.run(run())
+    assert (result["mood"], result["source"]) == ("stressed", "local")
@@ -0,0 +1,77 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import frame_api
+
+FRAMES = [[[{"r": 255, "g": 0, "b": 0}]], [[{"r": 0, "g": 0, "b": 255}]]]
+
+
+@pytest.fixture
+def audio(tmp_path):
+    path = tmp_path / "track.mp3"
+    path.write_bytes(bytes(range(256)) * 1000)
+    return path
+
+
+@pytest.fixture
+def frames_api(http_server, tmp_path, monkeypatch):
+    """A frames endpoint that records every request; returns (url, requests)"""
+    monkeypatch.setattr(frame_api, "CACHE_DIR", str(tmp_path / "cache"))
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append({"headers": dict(self.headers), "body": body})
+            out = json.dumps({"frames": FRAMES}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    return http_server(Handler) + "/frames", received
+
+
+def test_upload_is_multipart_with_the_whole_file(audio, frames_api):
+    url, received = frames_api
+    assert frame_api.fetch_frames(str(audio), "key", url) == FRAMES
+
+    [request] = received
+    assert request["headers"]["Authorization"] == "Bearer key"
+    boundary = request["headers"]["Content-Type"].split("boundary=")[1]
+    head, rest = request["body"].split(b"\r\n\r\n", 1)
+    assert head.startswith(f"--{boundary}\r\n".encode())
+    assert b'name="audio_file"; filename="track.mp3"' in head
+    assert rest == audio.read_bytes() + f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_multipart_body_reads_in_blocks(audio):
+    with frame_api.MultipartFile("audio_file", str(audio)) as body:
+        blocks = iter(lambda: body.read(4096), b"")
+        data = b"".join(blocks)
+    assert len(data) == len(body)
+    assert audio.read_bytes() in data
+
+
+def test_cached_track_is_not_sent_again(audio, frames_api):
+    url, received = frames_api
+    frame_api.fetch_frames(str(audio), "key", url)
+    assert frame_api.fetch_frames(str(audio), "key", url) == FRAMES
+    assert len(received) == 1
+
+    # Another API URL is another cache entry
+    frame_api.fetch_frames(str(audio), "key", url + "?v=2")
+    assert len(received) == 2
+
+
+def test_use_cache_false_always_sends(audio, frames_api):
+    url, received = frames_api
+    frame_api.fetch_frames(str(audio), "key", url, use_cache=False)
+    frame_api.fetch_frames(str(audio), "key", url, use_cache=False)
+    assert len(received) == 2
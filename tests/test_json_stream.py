@@ -0,0 +1,30 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import json_stream
+
+
+def dumped(value, indent=None):
+    f = io.StringIO()
+    json_stream.dump(value, f, indent=indent)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_nested_generators_are_streamed(indent):
+    value = {"frames": [[(i for i in range(3))], {"deeper": [1, [(c for c in "ab")]]}]}
+    expected = {"frames": [[[0, 1, 2]], {"deeper": [1, [["a", "b"]]]}]}
+    separators = (",", ":") if indent is None else None
+    assert dumped(value, indent) == json.dumps(expected, indent=indent, separators=separators)
+
+
+def test_numpy_values():
+    assert dumped([[np.int64(3), np.arange(4).reshape(2, 2)]]) == "[[3,[[0,1],[2,3]]]]"
+
+
+def test_unknown_objects_raise():
+    with pytest.raises(TypeError, match="not JSON serializable"):
+        dumped([[object()]])
@@ -0,0 +1,31 @@
+import llm_cache
+import mood_classifier
+from llm_cache import ResponseCache
+
+
+def payload(text):
+    return {"model": "asi1-mini", "messages": [{"role": "system", "content": "moods"}, {"role": "user", "content": text}]}
+
+
+def test_near_duplicates_share_an_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite"))
+    cache.put(payload("I'm so stressed about work"), {"mood": "stressed"})
+    assert cache.get(payload("i am really stressed about work!")) == {"mood": "stressed"}
+
+
+def test_texts_without_content_words_only_match_exactly(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite"))
+    cache.put(payload("I'm feeling..."), {"mood": "sad"})
+    assert cache.get(payload("um, today")) is None
+    assert cache.get(payload("I'm feeling...")) == {"mood": "sad"}
+
+
+def test_negations_never_match_the_plain_text(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite"))
+    cache.put(payload("calm"), {"mood": "neutral"})
+    for text in ["not calm", "hardly calm", "barely calm"]:
+        assert cache.get(payload(text)) is None
+
+
+def test_one_negation_set():
+    assert mood_classifier.NEGATIONS is llm_cache.NEGATIONS
@@ -0,0 +1,69 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import stream_frames
+
+
+def frame(index):
+    return {"frame_index": index, "frame": [[{"r": index, "g": 0, "b": 0}]]}
+
+
+def delta_events(text, size):
+    """SSE events carrying text as chat completion content deltas of size characters"""
+    for i in range(0, len(text), size):
+        event = {"choices": [{"delta": {"content": text[i:i + size]}}]}
+        yield f"data: {json.dumps(event)}\n\n".encode()
+    yield b"data: [DONE]\n\n"
+
+
+def test_sse_lines_split_across_chunks():
+    stream = b": keep-alive\r\nevent: message\r\ndata: one\r\n\r\ndata: two\ndata: lines\n\nid: 3\ndata: last"
+    chunks = [stream[i:i + 3] for i in range(0, len(stream), 3)]
+    assert list(stream_frames.iter_sse_data(chunks)) == ["one", "two\nlines", "last"]
+
+
+def test_plain_json_lines_without_sse_framing():
+    lines = [json.dumps(frame(0)).encode(), b"\n", json.dumps(frame(1)).encode()]
+    assert list(stream_frames.iter_frames(lines)) == [frame(0), frame(1)]
+
+
+def test_objects_split_across_deltas():
+    text = "Here you go: " + " ".join(json.dumps(frame(i)) for i in range(5)) + ' {"note": "a } in a string"}'
+    events = b"".join(delta_events(text, 7))
+    chunks = [events[i:i + 11] for i in range(0, len(events), 11)]
+    assert list(stream_frames.iter_frames(chunks)) == [frame(i) for i in range(5)]
+
+
+def test_stream_from_local_server(http_server, tmp_path, monkeypatch):
+    text = "".join(json.dumps(frame(i)) for i in range(3))
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            requests_seen.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in delta_events(text, 5):
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+                time.sleep(0.001)
+            self.wfile.write(b"0\r\n\r\n")
+
+    monkeypatch.setattr(stream_frames, "BASE_URL", http_server(Handler))
+    audio = tmp_path / "track.mp3"
+    audio.write_bytes(b"ID3" + bytes(100))
+
+    frames = list(stream_frames.stream_led_frames(str(audio), payload="audio"))
+
+    assert frames == [frame(i) for i in range(3)]
+    [request] = requests_seen
+    assert request["stream"] is True
+    assert request["messages"][1]["content"] == f"Audio data (base64): {stream_frames.audio_to_base64(str(audio))}"
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import walrus
+import walrus_chunks
+from walrus_index import BlobIndex
+
+
+def trip(first=0, count=60):
+    frames = [[[i, j, 255 - j] for j in range(40)] for i in range(first, first + count)]
+    return {"metadata": {"generated_at": "2026-01-01", "name": "trip"}, "frames": frames}
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(walrus_chunks, "CHUNK_MIN_BYTES", 2000)
+    monkeypatch.setattr(walrus_chunks, "CHUNK_MAX_BYTES", 4000)
+
+
+@pytest.fixture
+def walrus_stub(http_server):
+    """Publisher and aggregator stub; blob IDs are content hashes, like on Walrus"""
+
+    class Stub:
+        blobs = {}
+        puts = []
+        lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            blob_id = hashlib.sha256(body).hexdigest()[:16]
+            with Stub.lock:
+                Stub.blobs[blob_id] = body
+                Stub.puts.append(blob_id)
+                object_id = f"0x{len(Stub.puts)}"
+            out = json.dumps({"newlyCreated": {"blobObject": {"blobId": blob_id, "id": object_id}}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def do_GET(self):
+            body = Stub.blobs[self.path.rsplit("/", 1)[1]]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    Stub.url = http_server(Handler)
+    return Stub
+
+
+def age(index, days):
+    """Move every index entry days closer to its expiry"""
+    index._db.execute("UPDATE blobs SET expires_at = expires_at - ?", (days * walrus.EPOCH_S,))
+
+
+def test_unchanged_trip_resolves_to_its_manifest(walrus_stub):
+    index = BlobIndex(":memory:")
+    first = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, index=index)
+    assert first["source"] == "publisher"
+    assert first["chunks"] > 2
+    assert len(walrus_stub.puts) == first["chunks_sent"] + 1
+
+    second = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, index=index)
+    assert (second["source"], second["blob_id"]) == ("index", first["blob_id"])
+    assert (second["chunks_sent"], second["chunks_extended"], second["bytes_sent"]) == (0, 0, 0)
+    assert len(walrus_stub.puts) == first["chunks_sent"] + 1
+
+    assert walrus_chunks.read_chunked_trip(second["blob_id"], walrus_stub.url) == trip()
+
+
+def test_edit_sends_only_the_changed_chunks(walrus_stub):
+    index = BlobIndex(":memory:")
+    first = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, index=index)
+    edited = trip()
+    edited["frames"][-1] = [[0, 0, 0]] * 40
+    second = walrus_chunks.upload_chunked_trip(edited, walrus_stub.url, index=index)
+    assert second["source"] == "publisher"
+    assert second["chunks_sent"] == 1
+    assert second["chunks"] == first["chunks"]
+    assert walrus_chunks.read_chunked_trip(second["blob_id"], walrus_stub.url)["frames"] == edited["frames"]
+
+
+def test_chunks_expiring_before_the_manifest_are_extended(walrus_stub, monkeypatch):
+    extended = []
+    monkeypatch.setattr(walrus, "extend_blob", lambda object_id, epochs: extended.append((object_id, epochs)))
+    index = BlobIndex(":memory:")
+    first = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, epochs=10, index=index)
+    puts = len(walrus_stub.puts)
+
+    age(index, 5.5)  # Chunks have 6.5 epochs left, a new manifest would need 10
+    second = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, epochs=10, index=index)
+    assert (second["source"], second["chunks_sent"]) == ("index", 0)
+    assert second["chunks_extended"] == first["chunks_sent"] == len(extended)
+    assert {epochs for _, epochs in extended} == {4 + walrus_chunks.CHUNK_SPARE_EPOCHS}
+    assert len(walrus_stub.puts) == puts
+
+    third = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, epochs=10, index=index)
+    assert third["chunks_extended"] == 0
+
+
+def test_chunks_that_cannot_be_extended_are_sent_again(walrus_stub, monkeypatch):
+    def failing_extend(object_id, epochs):
+        raise subprocess.CalledProcessError(1, ["walrus", "extend"])
+
+    monkeypatch.setattr(walrus, "extend_blob", failing_extend)
+    index = BlobIndex(":memory:")
+    first = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, epochs=10, index=index)
+    age(index, 5)
+    second = walrus_chunks.upload_chunked_trip(trip(), walrus_stub.url, epochs=10, index=index)
+    assert (second["chunks_sent"], second["chunks_extended"]) == (first["chunks_sent"], 0)
+    assert index.get(walrus_stub.url, second["content_hash"]) is not None
+    assert walrus_chunks.read_chunked_trip(second["blob_id"], walrus_stub.url)["frames"] == trip()["frames"]
@@ -0,0 +1,118 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import walrus
+import walrus_publish
+from walrus_index import BlobIndex
+
+
+def trip(i, generated_at="2026-01-01"):
+    return {"metadata": {"generated_at": generated_at, "name": f"trip {i}"}, "frames": [[[i, 0, 255]]]}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(walrus, "BACKOFF_S", 0)
+
+
+@pytest.fixture
+def publisher(http_server):
+    """A publisher stub storing blobs in memory; statuses queued in .fail are answered first"""
+
+    class Publisher:
+        blobs = []
+        fail = []  # (name, status) pairs: the next upload of that trip gets status
+        lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            name = walrus.read_trip(body)["metadata"]["name"]
+            with Publisher.lock:
+                status = next((s for n, s in Publisher.fail if n == name), None)
+                if status is not None:
+                    Publisher.fail.remove((name, status))
+                else:
+                    Publisher.blobs.append((name, self.headers["Content-Type"], body))
+                    blob_id = f"blob-{len(Publisher.blobs)}"
+            if status is not None:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            out = json.dumps({"newlyCreated": {"blobObject": {"blobId": blob_id, "id": "0x1"}}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    Publisher.url = http_server(Handler)
+    return Publisher
+
+
+@pytest.fixture
+def trips(tmp_path):
+    directory = tmp_path / "trips"
+    (directory / "nested").mkdir(parents=True)
+    for i in range(4):
+        (directory / f"trip{i}.json").write_text(json.dumps(trip(i), indent=2))
+    (directory / "nested" / "trip4.json").write_bytes(gzip.compress(json.dumps(trip(4)).encode()))
+    return directory
+
+
+def test_publish_then_resume_from_the_journal(trips, publisher):
+    stats = walrus_publish.publish(str(trips), publisher.url, index=BlobIndex(":memory:"))
+    assert (stats.uploaded, stats.resumed, len(stats.failed)) == (5, 0, 0)
+    assert len(publisher.blobs) == 5
+    assert all(content_type == "application/gzip" for _, content_type, _ in publisher.blobs)
+
+    stats = walrus_publish.publish(str(trips), publisher.url, index=BlobIndex(":memory:"))
+    assert (stats.uploaded, stats.resumed) == (0, 5)
+    assert len(publisher.blobs) == 5
+
+    entries = [json.loads(line) for line in (trips / walrus_publish.JOURNAL_NAME).read_text().splitlines()]
+    assert sorted(entry["path"] for entry in entries) == sorted(
+        ["trip0.json", "trip1.json", "trip2.json", "trip3.json", "nested/trip4.json"])
+    assert {entry["publisher_url"] for entry in entries} == {publisher.url}
+
+
+def test_failed_and_changed_trips_are_sent_on_the_next_run(trips, publisher):
+    publisher.fail.append(("trip 2", 400))
+    stats = walrus_publish.publish(str(trips), publisher.url)
+    assert list(stats.failed) == ["trip2.json"]
+    assert stats.uploaded == 4
+
+    (trips / "trip3.json").write_text(json.dumps(trip(33)))
+    stats = walrus_publish.publish(str(trips), publisher.url)
+    assert (stats.uploaded, stats.resumed, len(stats.failed)) == (2, 3, 0)
+    assert sorted(name for name, _, _ in publisher.blobs[4:]) == ["trip 2", "trip 33"]
+
+
+def test_503_is_retried(trips, publisher):
+    publisher.fail += [("trip 1", 503), ("trip 1", 503)]
+    stats = walrus_publish.publish(str(trips), publisher.url, workers=1)
+    assert (stats.uploaded, stats.retries, len(stats.failed)) == (5, 2, 0)
+
+
+def test_journal_is_per_publisher(trips, publisher):
+    walrus_publish.publish(str(trips), publisher.url)
+    stats = walrus_publish.publish(str(trips), publisher.url.replace("127.0.0.1", "localhost"))
+    assert (stats.uploaded, stats.resumed) == (5, 0)
+
+
+def test_files_share_index_entries_with_editor_uploads(trips, publisher):
+    index = BlobIndex(":memory:")
+    walrus_publish.publish(str(trips), publisher.url, index=index)
+
+    # The same frames uploaded from the editor later, with a newer generated_at
+    blob = walrus.upload_trip(trip(0, generated_at="2026-06-01"), publisher.url, index=index)
+    assert blob["source"] == "index"
+    assert len(publisher.blobs) == 5
@@ -0,0 +1,245 @@
+"""
+Timeline overview strip for a whole trip.
+
+Per-frame mode color, brightness and mood intensity are kept in a
+multi-resolution pyramid: level k holds one bin per 2**k frames. A repaint
+reads from the level that has about one bin per pixel, so drawing, zooming
+and panning over a 2-hour trip cost O(visible pixels) rather than O(frames).
+Appending frames while analysis is still running only rebuilds the tail of
+each level, and a marker shows how far generation has got.
+"""
+import math
+
+import numpy as np
+from PyQt6.QtCore import QRect, pyqtSignal
+from PyQt6.QtGui import QColor, QPainter
+from PyQt6.QtWidgets import QWidget
+
+from led_renderer import MODE_PALETTE, rgb_to_qimage
+
+MAX_FRAME_BRIGHTNESS = 20  # Arduino frames are capped at 20 for safe viewing
+MIN_VISIBLE_FRAMES = 20  # Zoom limit
+
+# Pyramid columns: mode color r, g, b (mean), brightness (max), mood (mean)
+_MEAN_COLUMNS = [0, 1, 2, 4]
+_MAX_COLUMNS = [3]
+
+
+class _Level:
+    """Growable (n, 5) float32 buffer"""
+
+    def __init__(self):
+        self.data = np.zeros((256, 5), dtype=np.float32)
+        self.size = 0
+
+    def resize(self, size):
+        if size > len(self.data):
+            grown = np.zeros((max(size, 2 * len(self.data)), 5), dtype=np.float32)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.size = size
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class TimelinePyramid:
+    def __init__(self):
+        self.levels = [_Level()]
+
+    def __len__(self):
+        return self.levels[0].size
+
+    def clear(self):
+        self.levels = [_Level()]
+
+    def append(self, frames, moods):
+        """Add frames ({"mode", "brightness", ...}) and their mood intensity"""
+        if not frames:
+            return
+        modes = np.array([frame["mode"] for frame in frames])
+        modes = np.where((modes > 0) & (modes < len(MODE_PALETTE)), modes, 0)
+        rows = np.empty((len(frames), 5), dtype=np.float32)
+        rows[:, 0:3] = MODE_PALETTE[modes]
+        rows[:, 3] = [frame["brightness"] for frame in frames]
+        rows[:, 4] = np.asarray(moods[:len(frames)], dtype=np.float32)
+
+        base = self.levels[0]
+        first_changed = base.size
+        base.resize(base.size + len(frames))
+        base.data[first_changed:base.size] = rows
+        self._rebuild_from(first_changed)
+
+    def _rebuild_from(self, first_changed):
+        """Recompute the parent bins covering level-0 frames first_changed onwards"""
+        k = 0
+        while self.levels[k].size > 1:
+            child = self.levels[k]
+            if k + 1 == len(self.levels):
+                self.levels.append(_Level())
+            parent = self.levels[k + 1]
+
+            start = first_changed // 2
+            parent.resize((child.size + 1) // 2)
+            pairs = child.view()[2 * start:]
+            if len(pairs) % 2:
+                pairs = np.vstack([pairs, pairs[-1:]])  # Odd tail bin reduces to itself
+            pairs = pairs.reshape(-1, 2, 5)
+            parent.data[start:parent.size, _MEAN_COLUMNS] = pairs[:, :, _MEAN_COLUMNS].mean(axis=1)
+            parent.data[start:parent.size, _MAX_COLUMNS] = pairs[:, :, _MAX_COLUMNS].max(axis=1)
+
+            first_changed = start
+            k += 1
+
+    def sample(self, start, end, columns):
+        """Reduce frames [start, end) into `columns` bins read from the best fitting level"""
+        frames_per_column = max((end - start) / columns, 1.0)
+        k = min(int(math.log2(frames_per_column)), len(self.levels) - 1)
+        level = self.levels[k].view()
+
+        # Only touch the bins in view
+        end_bin = max(1, min(len(level), int(math.ceil(end / 2 ** k))))
+        edges = ((start + np.arange(columns) * frames_per_column) / 2 ** k).astype(np.int64)
+        edges = np.clip(edges, 0, end_bin - 1)
+        window = level[edges[0]:end_bin]
+        edges -= edges[0]
+        counts = np.maximum(np.diff(np.append(edges, len(window))), 1)
+
+        out = np.empty((columns, 5), dtype=np.float32)
+        out[:, _MEAN_COLUMNS] = np.add.reduceat(window[:, _MEAN_COLUMNS], edges, axis=0) / counts[:, None]
+        out[:, _MAX_COLUMNS] = np.maximum.reduceat(window[:, _MAX_COLUMNS], edges, axis=0)
+        return out
+
+
+class TimelineWidget(QWidget):
+    """Mode, brightness and mood lanes across the trip; click to seek, wheel to zoom, drag to pan"""
+    seek_requested = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(60)
+        self.setMouseTracking(False)
+        self.pyramid = TimelinePyramid()
+        self.total_frames = 0  # Expected length; frames may still be streaming in
+        self.view_start = 0.0
+        self.view_end = 0.0
+        self.playhead = 0
+        self._image = None
+        self._image_key = None
+        self._drag_x = None
+        self._drag_moved = False
+
+    # ---- Data ----
+
+    def set_frames(self, frames, moods, total_frames=None):
+        self.pyramid.clear()
+        self.total_frames = 0
+        self.append_frames(frames, moods, total_frames)
+        self.view_start, self.view_end = 0.0, float(max(self.total_frames, 1))
+
+    def append_frames(self, frames, moods, total_frames=None):
+        follow = self.view_end >= self.total_frames  # Keep following the end when fully zoomed out
+        self.pyramid.append(frames, moods)
+        self.total_frames = max(total_frames or 0, len(self.pyramid))
+        if follow:
+            self.view_end = float(self.total_frames)
+        self._image_key = None
+        self.update()
+
+    def set_playhead(self, index):
+        if index != self.playhead:
+            self.playhead = index
+            self.update()
+
+    # ---- Rendering ----
+
+    def paintEvent(self, event):
+        if len(self.pyramid) == 0:
+            return
+        painter = QPainter(self)
+        painter.drawImage(0, 0, self._overview_image())
+
+        if len(self.pyramid) < self.total_frames:
+            # "Generated up to" marker
+            x = self._frame_to_x(len(self.pyramid))
+            if 0 <= x < self.width():
+                painter.fillRect(QRect(int(x), 0, 2, self.height()), QColor(255, 170, 0))
+
+        x = self._frame_to_x(self.playhead)
+        if 0 <= x < self.width():
+            painter.fillRect(QRect(int(x), 0, 2, self.height()), QColor(255, 255, 255))
+
+    def _overview_image(self):
+        key = (self.width(), self.height(), self.view_start, self.view_end, len(self.pyramid))
+        if key != self._image_key:
+            self._image_key = key
+            self._image = rgb_to_qimage(self._render_lanes(self.width(), self.height()))
+        return self._image
+
+    def _render_lanes(self, width, height):
+        rgb = np.full((height, width, 3), 24, dtype=np.uint8)
+        available_end = min(self.view_end, len(self.pyramid))
+        if available_end <= self.view_start:
+            return rgb
+
+        # Columns past the generated frames stay dark
+        visible = int(width * (available_end - self.view_start) / (self.view_end - self.view_start))
+        visible = max(1, min(width, visible))
+        bins = self.pyramid.sample(int(self.view_start), int(math.ceil(available_end)), visible)
+
+        lane = height // 3
+        rgb[:lane, :visible] = bins[:, 0:3].astype(np.uint8)
+
+        rows = np.arange(height - lane)[:, None]
+        brightness_px = (np.clip(bins[:, 3] / MAX_FRAME_BRIGHTNESS, 0, 1) * lane).astype(int)
+        bars = rows[:lane] >= lane - brightness_px
+        rgb[lane:2 * lane, :visible][bars] = (200, 200, 200)
+
+        mood = np.clip(bins[:, 4], 0, 1)
+        mood_px = (mood * (height - 2 * lane)).astype(int)
+        bars = rows[:height - 2 * lane] >= (height - 2 * lane) - mood_px
+        # Calm (blue) to energetic (orange)
+        mood_rgb = np.stack([60 + 195 * mood, 120 + 20 * mood, 255 - 205 * mood], axis=1).astype(np.uint8)
+        lane_rgb = rgb[2 * lane:, :visible]
+        lane_rgb[bars] = np.broadcast_to(mood_rgb, lane_rgb.shape)[bars]
+        return rgb
+
+    # ---- Navigation ----
+
+    def _frame_to_x(self, frame):
+        span = max(self.view_end - self.view_start, 1e-9)
+        return (frame - self.view_start) / span * self.width()
+
+    def _x_to_frame(self, x):
+        return self.view_start + x / max(self.width(), 1) * (self.view_end - self.view_start)
+
+    def _set_view(self, start, end):
+        span = min(max(end - start, MIN_VISIBLE_FRAMES), max(self.total_frames, 1))
+        start = min(max(start, 0.0), max(self.total_frames - span, 0.0))
+        self.view_start, self.view_end = start, start + span
+        self.update()
+
+    def wheelEvent(self, event):
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        anchor = self._x_to_frame(event.position().x())
+        self._set_view(anchor - (anchor - self.view_start) * factor, anchor + (self.view_end - anchor) * factor)
+
+    def mousePressEvent(self, event):
+        self._drag_x = event.position().x()
+        self._drag_moved = False
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is None:
+            return
+        dx = event.position().x() - self._drag_x
+        if abs(dx) >= 3 or self._drag_moved:
+            self._drag_moved = True
+            shift = dx / max(self.width(), 1) * (self.view_end - self.view_start)
+            self._set_view(self.view_start - shift, self.view_end - shift)
+            self._drag_x = event.position().x()
+
+    def mouseReleaseEvent(self, event):
+        if self._drag_x is not None and not self._drag_moved:
+            frame = int(self._x_to_frame(event.position().x()))
+            self.seek_requested.emit(max(0, min(frame, len(self.pyramid) - 1)))
+        self._drag_x = None
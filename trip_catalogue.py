@@ -0,0 +1,117 @@
+"""
+Pre-rendered catalogue of the named trips in maker.py.
+
+Every trip (Ocean Calm, Forest Focus, ...) is rendered once per geometry
+(each device profile plus maker.py's default matrix) and stored on disk
+under the hash of everything that determines its frames: the animation,
+the renderer's source, the geometry, the frame count and the frame rate.
+Startup can warm the whole catalogue on a background thread while the
+visitor is still talking, so by the time the mood is known the frames are
+a memory-mapped array and the animation JSON a file that only needs copying.
+
+    catalogue = TripCatalogue()
+    catalogue.warm()                                   # background thread
+    ...
+    frames = catalogue.frames("Ocean Calm", "glasses")  # (n, rows, cols, 3) uint8 memmap
+    path = catalogue.json_path("Ocean Calm")            # maker.py's trip_animation.json
+
+A trip that is not warmed yet is rendered on first use.
+"""
+import hashlib
+import inspect
+import os
+import threading
+
+import numpy as np
+
+import json_stream
+import maker
+from devices import DEVICE_PROFILES
+from mood_classifier import MOODS
+
+CACHE_DIR = os.environ.get(
+    "CHROMAMIND_TRIP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "chromamind", "trips")
+)
+TRIP_NAMES = list(dict.fromkeys(maker.fallback_trip(mood) for mood in MOODS))
+TRIP_SECONDS = maker.FRAME_COUNT / maker.BASE_FPS  # Length of a trip animation
+
+# name -> geometry; "maker" is maker.py's default matrix
+GEOMETRIES = {
+    "maker": {"columns": maker.COLUMNS, "rows": maker.ROWS, "fps": maker.BASE_FPS},
+    **{name: {"columns": profile["cols"], "rows": profile["rows"], "fps": profile["max_fps"]}
+       for name, profile in DEVICE_PROFILES.items()},
+}
+
+_renderer_hash = hashlib.sha1(inspect.getsource(maker).encode()).hexdigest()
+
+
+class TripCatalogue:
+    def __init__(self, geometries=None, cache_dir=CACHE_DIR):
+        self.geometries = geometries or GEOMETRIES
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._frames = {}  # key -> memmap, so repeated requests skip the np.load
+        self._warm_thread = None
+
+    def key(self, trip, geometry="maker"):
+        """Content address of a trip's frames at a geometry"""
+        g = self.geometries[geometry]
+        frames = max(1, round(TRIP_SECONDS * g["fps"]))
+        source = f"{maker.animation_for(trip)}\n{_renderer_hash}\n{g['columns']}x{g['rows']}\n{frames}@{g['fps']}"
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def frames(self, trip, geometry="maker"):
+        """(frames, rows, columns, 3) uint8 animation, read-only and memory-mapped"""
+        key = self.key(trip, geometry)
+        if key in self._frames:
+            return self._frames[key]
+        path = os.path.join(self.cache_dir, f"{key}.npy")
+        with self._lock(key):
+            if not os.path.exists(path):
+                g = self.geometries[geometry]
+                count = max(1, round(TRIP_SECONDS * g["fps"]))
+                rendered = maker.render_animation(trip, g["columns"], g["rows"], count, g["fps"])
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, rendered)
+                os.replace(tmp_path, path)
+            self._frames[key] = np.load(path, mmap_mode="r")
+        return self._frames[key]
+
+    def json_path(self, trip, geometry="maker", indent=2):
+        """Path of the trip's animation JSON (maker.py's schema), written on first use"""
+        key = self.key(trip, geometry)
+        path = os.path.join(self.cache_dir, f"{key}-{'compact' if indent is None else indent}.json")
+        if os.path.exists(path):
+            return path
+        frames = self.frames(trip, geometry)
+        with self._lock(key):
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json_stream.dump((maker.frames_to_dicts(frame[None])[0] for frame in frames), f, indent=indent)
+                os.replace(tmp_path, path)
+        return path
+
+    def warm(self, background=True):
+        """Render every trip at every geometry; returns the thread when background"""
+        def render_all():
+            for trip in TRIP_NAMES:
+                for geometry in self.geometries:
+                    self.frames(trip, geometry)
+                self.json_path(trip)
+
+        if not background:
+            render_all()
+            return None
+        if self._warm_thread is None or not self._warm_thread.is_alive():
+            # Not a daemon: a render killed at exit would leave a temporary file behind
+            self._warm_thread = threading.Thread(target=render_all, name="trip-catalogue")
+            self._warm_thread.start()
+        return self._warm_thread
@@ -0,0 +1,230 @@
+"""
+Walrus storage for trips.
+
+A trip is serialized straight into a gzip-compressed buffer in memory (no
+temporary file, no re-read to validate) and PUT to a publisher over the
+shared pooled session, with timeouts. The body is read by requests block
+by block, so progress can be reported as it goes out; the GUI runs
+upload_trip() on a worker thread.
+
+    data, content_hash = encode_trip(upload_data)      # gzip JSON bytes, SHA-256 of the trip
+    response = upload_blob(data, progress=print)       # progress(sent, total)
+    blob = blob_info(response)                         # {"blob_id", "object_id", "end_epoch"}
+
+upload_trip() does all three. With a BlobIndex (walrus_index.py) it hashes
+the trip first (trip_hash(), no buffer, no compression), and a trip whose
+content hash was uploaded to the same publisher before resolves without
+compressing anything or making a network call.
+
+Blobs are stored compressed; read_trip() takes the bytes an aggregator
+returns and decodes them, compressed or not.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import time
+
+import requests
+
+import json_stream
+from http_session import get_session
+
+PUBLISHER_URL = os.environ.get("WALRUS_PUBLISHER_URL", "https://publisher.walrus-testnet.walrus.space")
+AGGREGATOR_URL = os.environ.get("WALRUS_AGGREGATOR_URL", "https://aggregator.walrus-testnet.walrus.space")
+EPOCHS = 10
+COMPRESS_LEVEL = 6
+UPLOAD_BLOCK_BYTES = 1 << 16
+EPOCH_S = 24 * 3600  # Length of a storage epoch on testnet
+VOLATILE_METADATA = ("generated_at",)  # Left out of the content hash
+UPLOAD_TIMEOUT = (10, 300)  # (connect, read) seconds; the publisher replies once the blob is certified
+MAX_RETRIES = 4
+BACKOFF_S = 0.5  # First retry delay, doubled on every attempt, plus jitter
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+WALRUS_CLI = os.environ.get("WALRUS_CLI", "walrus")  # Publishers cannot extend blobs; the CLI's wallet can
+
+
+class _Sink:
+    """Text writer that encodes into raw (if any) and hashes what it writes unless told not to"""
+
+    def __init__(self, raw=None):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def write(self, text, hashed=True):
+        data = text.encode()
+        if self.raw is not None:
+            self.raw.write(data)
+        if hashed:
+            self.digest.update(data)
+
+
+def _write_trip(upload_data, sink):
+    """Write a trip as compact JSON to sink, hashing all of it but VOLATILE_METADATA"""
+    if isinstance(upload_data, dict) and upload_data:
+        for i, (key, value) in enumerate(upload_data.items()):
+            sink.write(("{" if i == 0 else ",") + json.dumps(key) + ":")
+            if key == "metadata" and isinstance(value, dict):
+                stable = {k: v for k, v in value.items() if k not in VOLATILE_METADATA}
+                sink.digest.update("".join(json_stream.iterencode(stable)).encode())
+                sink.write("".join(json_stream.iterencode(value)), hashed=False)
+            else:
+                json_stream.dump(value, sink)
+        sink.write("}")
+    else:
+        json_stream.dump(upload_data, sink)
+    return sink.digest.hexdigest()
+
+
+def trip_hash(upload_data):
+    """
+    Content hash of a trip: the SHA-256 of its compact JSON with
+    VOLATILE_METADATA left out, so the same frames uploaded again later
+    hash the same. Nothing is buffered.
+    """
+    return _write_trip(upload_data, _Sink())
+
+
+def encode_trip(upload_data, compress=True):
+    """(body, trip_hash()) of a trip: compact JSON, gzip-compressed unless compress is False"""
+    buffer = io.BytesIO()
+    if compress:
+        raw = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0)
+    else:
+        raw = buffer
+    content_hash = _write_trip(upload_data, _Sink(raw))
+    if compress:
+        raw.close()
+    return buffer.getvalue(), content_hash
+
+
+def read_trip(data):
+    """Decode blob bytes written by encode_trip() (or plain JSON)"""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+class ProgressBody:
+    """File-like request body over bytes that calls progress(sent, total) as requests reads it"""
+
+    def __init__(self, data, progress=None):
+        self._data = memoryview(data)
+        self._sent = 0
+        self.progress = progress
+
+    def __len__(self):
+        return len(self._data)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data) - self._sent
+        size = min(size, UPLOAD_BLOCK_BYTES)
+        chunk = self._data[self._sent:self._sent + size].tobytes()
+        self._sent += len(chunk)
+        if self.progress is not None and chunk:
+            self.progress(self._sent, len(self._data))
+        return chunk
+
+
+def upload_blob(data, publisher_url=PUBLISHER_URL, epochs=EPOCHS, progress=None, session=None):
+    """PUT data to the publisher and return its JSON response; raises requests exceptions"""
+    session = session or get_session()
+    compressed = data[:2] == b"\x1f\x8b"
+    headers = {"Content-Type": "application/gzip" if compressed else "application/json"}
+    response = session.put(
+        f"{publisher_url}/v1/blobs",
+        params={"epochs": epochs},
+        data=ProgressBody(data, progress),
+        headers=headers,
+        timeout=UPLOAD_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def upload_with_retries(data, publisher_url=PUBLISHER_URL, epochs=EPOCHS, max_retries=MAX_RETRIES, on_retry=None,
+                        session=None):
+    """
+    upload_blob() retried with exponential backoff (honoring Retry-After)
+    on connection errors, timeouts and RETRY_STATUSES; on_retry() is
+    called before each retry. Returns the publisher response.
+    """
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            return upload_blob(data, publisher_url, epochs, session=session)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in RETRY_STATUSES or attempt >= max_retries:
+                raise
+            retry_after = e.response.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= max_retries:
+                raise
+
+        delay = BACKOFF_S * 2 ** attempt * (1 + random.random() * 0.5)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        attempt += 1
+        if on_retry is not None:
+            on_retry()
+        time.sleep(delay)
+
+
+def upload_trip(upload_data, publisher_url=PUBLISHER_URL, epochs=EPOCHS, progress=None, session=None, index=None):
+    """
+    Encode and upload a trip; returns blob_info() plus "content_hash" and
+    "source" ("index" when a BlobIndex already had it for this publisher,
+    else "publisher").
+    """
+    if index is not None:
+        content_hash = trip_hash(upload_data)
+        blob = index.get(publisher_url, content_hash)
+        if blob is not None:
+            return {**blob, "content_hash": content_hash, "source": "index"}
+    data, content_hash = encode_trip(upload_data)
+    blob = blob_info(upload_blob(data, publisher_url, epochs, progress, session))
+    if index is not None:
+        index.put(publisher_url, content_hash, blob, epochs, len(data))
+    return {**blob, "content_hash": content_hash, "source": "publisher"}
+
+
+def extend_blob(object_id, epochs):
+    """
+    Extend the storage of a blob object by epochs with the walrus CLI,
+    paid from its wallet, which must own the object. Raises OSError if
+    the CLI is missing and subprocess.SubprocessError if it fails.
+    """
+    subprocess.run([WALRUS_CLI, "extend", "--blob-obj-id", object_id, "--epochs-extended", str(epochs)],
+                   check=True, capture_output=True, timeout=UPLOAD_TIMEOUT[1])
+
+
+def blob_info(response):
+    """blob_id, object_id (None if the blob was already certified) and end_epoch of a publisher response"""
+    if "newlyCreated" in response:
+        blob = response["newlyCreated"]["blobObject"]
+        return {
+            "blob_id": blob["blobId"],
+            "object_id": blob.get("id"),
+            "end_epoch": (blob.get("storage") or {}).get("endEpoch"),
+        }
+    if "alreadyCertified" in response:
+        blob = response["alreadyCertified"]
+        return {"blob_id": blob["blobId"], "object_id": None, "end_epoch": blob.get("endEpoch")}
+    raise ValueError(f"Unexpected publisher response: {str(response)[:200]}")
+
+
+def blob_url(blob_id, aggregator_url=AGGREGATOR_URL):
+    return f"{aggregator_url}/v1/blobs/{blob_id}"
+
+
+def fetch_blob(blob_id, aggregator_url=AGGREGATOR_URL, session=None):
+    """A blob's bytes from an aggregator"""
+    response = (session or get_session()).get(blob_url(blob_id, aggregator_url))
+    response.raise_for_status()
+    return response.content
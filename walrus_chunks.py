@@ -0,0 +1,184 @@
+"""
+Chunked trips on Walrus: a manifest blob plus content-defined chunks.
+
+The frames of a trip are cut into chunks at frame boundaries chosen by
+the content of the frames themselves: a frame ends a chunk when the CRC
+of its JSON hits BOUNDARY_DIVISOR (once the chunk has CHUNK_MIN_BYTES),
+or when the chunk reaches CHUNK_MAX_BYTES. Editing a few seconds of a
+trip changes the chunks around the edit and leaves the boundaries, and
+so the chunks, everywhere else as they were. Each chunk is a gzip JSON
+list of frames stored as its own blob under its content hash in the
+BlobIndex, so a re-upload only sends chunks that changed, plus the small
+manifest listing them in order, and an unchanged trip resolves to its
+stored manifest without sending anything. Every chunk must stay stored at
+least as long as a new manifest would (epochs * walrus.EPOCH_S from now),
+so the trip cannot lose chunks before its manifest expires: a stored chunk
+that expires sooner is extended with walrus.extend_blob() for the
+difference plus CHUNK_SPARE_EPOCHS, and only sent again if that fails
+(no walrus CLI, or a blob object its wallet does not own).
+
+    result = upload_chunked_trip(upload_data, index=BlobIndex())
+    result["blob_id"]                      # the manifest; share this one
+    result["chunks_sent"], result["chunks_extended"], result["bytes_sent"]
+
+    trip = read_chunked_trip(result["blob_id"])   # {"metadata": ..., "frames": [...]}
+
+read_chunked_trip() also reads trips uploaded whole by walrus.upload_trip().
+"""
+import gzip
+import hashlib
+import math
+import subprocess
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import json_stream
+import walrus
+from walrus_publish import MAX_WORKERS
+
+MANIFEST_FORMAT = "chromamind.chunked-trip/1"
+CHUNK_MIN_BYTES = 1 << 17  # Uncompressed JSON
+CHUNK_MAX_BYTES = 1 << 20
+BOUNDARY_DIVISOR = 64  # A frame past the minimum ends a chunk with odds 1 in this
+CHUNK_SPARE_EPOCHS = 2  # Chunks are stored or extended this many epochs past their manifest
+
+
+def iter_chunks(frames):
+    """Compact JSON text of each chunk of frames, with its frame count"""
+    texts = []
+    size = 0
+    for frame in frames:
+        text = "".join(json_stream.iterencode(frame))
+        texts.append(text)
+        size += len(text) + 1
+        if size >= CHUNK_MAX_BYTES or (
+                size >= CHUNK_MIN_BYTES and zlib.crc32(text.encode()) % BOUNDARY_DIVISOR == 0):
+            yield "[" + ",".join(texts) + "]", len(texts)
+            texts = []
+            size = 0
+    if texts:
+        yield "[" + ",".join(texts) + "]", len(texts)
+
+
+def upload_chunked_trip(upload_data, publisher_url=walrus.PUBLISHER_URL, epochs=walrus.EPOCHS, index=None,
+                        progress=None, workers=MAX_WORKERS, max_retries=walrus.MAX_RETRIES):
+    """
+    Upload a trip as chunks plus a manifest; only chunks missing from the
+    index are sent, stored chunks expiring before the manifest would are
+    extended, and each is indexed as soon as it is done, so a failed
+    upload resumes with the rest. progress(sent, total) counts compressed
+    bytes of the chunks being sent. Returns blob_info() of the manifest
+    plus "content_hash", "source", "chunks", "chunks_sent",
+    "chunks_extended" and "bytes_sent".
+    """
+    lifetime_s = epochs * walrus.EPOCH_S
+    valid_until = time.time() + lifetime_s
+    chunks = []  # Manifest entries, in order
+    pending = {}  # content hash -> compressed chunk to send
+    extending = {}  # content hash -> (stored blob, uncompressed chunk in case the extension fails)
+    for text, frame_count in iter_chunks(upload_data["frames"]):
+        data = text.encode()
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob = index.get(publisher_url, content_hash) if index is not None else None
+        chunks.append({"hash": content_hash, "frames": frame_count, "bytes": len(data),
+                       "blob_id": blob["blob_id"] if blob else None})
+        if content_hash in pending or content_hash in extending:
+            continue
+        if blob is None:
+            pending[content_hash] = gzip.compress(data, walrus.COMPRESS_LEVEL, mtime=0)
+        elif blob["expires_at"] <= valid_until:
+            extending[content_hash] = (blob, data)
+
+    total = sum(len(data) for data in pending.values())
+    sent = 0
+    extended = 0
+    errors = []
+    chunk_epochs = epochs + CHUNK_SPARE_EPOCHS
+
+    def send(content_hash, data):
+        blob = walrus.blob_info(walrus.upload_with_retries(data, publisher_url, chunk_epochs, max_retries))
+        if index is not None:
+            index.put(publisher_url, content_hash, blob, chunk_epochs, len(data))
+        return blob, data
+
+    def extend(content_hash):
+        """Extend a stored chunk, or send it again; returns (blob, compressed bytes sent or None)"""
+        blob, data = extending[content_hash]
+        extra_epochs = math.ceil((valid_until - blob["expires_at"]) / walrus.EPOCH_S) + CHUNK_SPARE_EPOCHS
+        if blob["object_id"] is not None:
+            try:
+                walrus.extend_blob(blob["object_id"], extra_epochs)
+                index.extend(publisher_url, content_hash, extra_epochs)
+                return blob, None
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"Could not extend chunk {blob['blob_id']}, sending it again: {e}")
+        return send(content_hash, gzip.compress(data, walrus.COMPRESS_LEVEL, mtime=0))
+
+    done = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(send, content_hash, data): content_hash for content_hash, data in pending.items()}
+        futures.update({pool.submit(extend, content_hash): content_hash for content_hash in extending})
+        for future in as_completed(futures):
+            content_hash = futures[future]
+            try:
+                blob, data = future.result()
+            except Exception as e:
+                errors.append(e)  # The other chunks still finish and are indexed
+                continue
+            done[content_hash] = blob
+            if data is None:
+                extended += 1
+                continue
+            if content_hash in extending:
+                total += len(data)
+                pending[content_hash] = data
+            sent += len(data)
+            if progress is not None:
+                progress(sent, total)
+    if errors:
+        raise errors[0]
+    for chunk in chunks:
+        if chunk["hash"] in done:
+            chunk["blob_id"] = done[chunk["hash"]]["blob_id"]
+
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "metadata": upload_data.get("metadata", {}),
+        "total_frames": sum(chunk["frames"] for chunk in chunks),
+        "chunks": chunks,
+    }
+    content_hash = walrus.trip_hash(manifest)
+    # Every chunk now outlives a new manifest, so a stored one for the same chunks is as good
+    blob = index.get(publisher_url, content_hash) if index is not None else None
+    source = "index"
+    data = b""
+    if blob is None:
+        data, _ = walrus.encode_trip(manifest)
+        blob = walrus.blob_info(walrus.upload_with_retries(data, publisher_url, epochs, max_retries))
+        if index is not None:
+            index.put(publisher_url, content_hash, blob, epochs, len(data))
+        source = "publisher"
+    return {**blob, "content_hash": content_hash, "source": source, "chunks": len(chunks),
+            "chunks_sent": len(pending), "chunks_extended": extended, "bytes_sent": sent + len(data)}
+
+
+def read_chunked_trip(blob_id, aggregator_url=walrus.AGGREGATOR_URL, workers=MAX_WORKERS):
+    """{"metadata", "frames"} of a chunked trip, reassembled from its manifest and checked against the hashes"""
+    manifest = walrus.read_trip(walrus.fetch_blob(blob_id, aggregator_url))
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        return manifest  # Uploaded whole
+
+    def fetch(chunk):
+        data = walrus.fetch_blob(chunk["blob_id"], aggregator_url)
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        if hashlib.sha256(data).hexdigest() != chunk["hash"]:
+            raise ValueError(f"Chunk {chunk['blob_id']} does not match its hash")
+        return walrus.read_trip(data)
+
+    frames = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk_frames in pool.map(fetch, manifest["chunks"]):
+            frames.extend(chunk_frames)
+    return {"metadata": manifest["metadata"], "frames": frames}
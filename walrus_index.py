@@ -0,0 +1,125 @@
+"""
+Local index of trips already stored on Walrus.
+
+Maps a publisher URL and the content hash of a trip (see walrus.trip_hash)
+to the blob it was uploaded as there: blob ID, object ID, epochs paid for
+and an expiry estimate. Uploading a trip whose hash is in the index for
+the same publisher resolves instantly without a network call, so
+re-publishing a catalogue only sends the trips that changed, and blobs
+close to expiry can be listed for renewal. A blob stored through one
+publisher (say a local stand-in) is never handed out for another.
+
+    index = BlobIndex()
+    blob = walrus.upload_trip(upload_data, index=index)   # blob["source"] == "index" on a repeat
+    index.get(walrus.PUBLISHER_URL, blob["content_hash"])  # {"blob_id", "object_id", "end_epoch", "expires_at"}
+    for row in index.expiring(within_s=3 * 24 * 3600):
+        print(row["blob_id"], row["expires_at"])
+
+Expiry is estimated as upload time + epochs * walrus.EPOCH_S; entries past
+it are no longer returned by get(), so the trip is uploaded again.
+
+    python walrus_index.py --expiring-days 3
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import walrus
+
+INDEX_PATH = os.environ.get(
+    "CHROMAMIND_WALRUS_INDEX", os.path.join(os.path.expanduser("~"), ".cache", "chromamind", "walrus.sqlite")
+)
+RENEW_WITHIN_S = 2 * 24 * 3600  # Default window for expiring()
+
+COLUMNS = ["publisher_url", "content_hash", "blob_id", "object_id", "epochs", "end_epoch", "size", "uploaded_at",
+           "expires_at"]
+
+
+class BlobIndex:
+    def __init__(self, path=INDEX_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " publisher_url TEXT NOT NULL, content_hash TEXT NOT NULL, blob_id TEXT NOT NULL, object_id TEXT,"
+            " epochs INTEGER NOT NULL, end_epoch INTEGER, size INTEGER, uploaded_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL, PRIMARY KEY (publisher_url, content_hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS blobs_expires_at ON blobs (expires_at)")
+
+    def get(self, publisher_url, content_hash, valid_for_s=0):
+        """
+        The blob stored for a content hash through a publisher (blob_id,
+        object_id, end_epoch, expires_at), or None if unknown or expiring
+        within valid_for_s seconds.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT blob_id, object_id, end_epoch, expires_at FROM blobs"
+                " WHERE publisher_url = ? AND content_hash = ? AND expires_at > ?",
+                (publisher_url.rstrip("/"), content_hash, time.time() + valid_for_s),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"blob_id": row[0], "object_id": row[1], "end_epoch": row[2], "expires_at": row[3]}
+
+    def put(self, publisher_url, content_hash, blob, epochs, size=None):
+        """Record a walrus.blob_info() result for a content hash uploaded through a publisher"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (publisher_url.rstrip("/"), content_hash, blob["blob_id"], blob.get("object_id"), epochs,
+                 blob.get("end_epoch"), size, now, now + epochs * walrus.EPOCH_S),
+            )
+
+    def extend(self, publisher_url, content_hash, epochs):
+        """Record that the blob stored for a content hash was extended by epochs (see walrus.extend_blob)"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE blobs SET epochs = epochs + ?, end_epoch = end_epoch + ?, expires_at = expires_at + ?"
+                " WHERE publisher_url = ? AND content_hash = ?",
+                (epochs, epochs, epochs * walrus.EPOCH_S, publisher_url.rstrip("/"), content_hash),
+            )
+
+    def expiring(self, within_s=RENEW_WITHIN_S):
+        """Rows (dicts of COLUMNS) whose blobs expire within within_s seconds, soonest first; expired ones included"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM blobs WHERE expires_at <= ? ORDER BY expires_at",
+                (time.time() + within_s,),
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def forget(self, publisher_url, content_hash):
+        with self._lock:
+            self._db.execute("DELETE FROM blobs WHERE publisher_url = ? AND content_hash = ?",
+                             (publisher_url.rstrip("/"), content_hash))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List Walrus blobs that are due for renewal")
+    parser.add_argument("--expiring-days", type=float, default=RENEW_WITHIN_S / 86400)
+    parser.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    index = BlobIndex(args.index)
+    rows = index.expiring(args.expiring_days * 86400)
+    for row in rows:
+        expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["expires_at"]))
+        print(f"{row['blob_id']}  expires {expires}  ({row['epochs']} epochs, {row['size'] or 0} bytes, "
+              f"{row['publisher_url']})")
+    print(f"{len(rows)} of {len(index)} blobs expire within {args.expiring_days:g} days")
+
+
+if __name__ == "__main__":
+    main()
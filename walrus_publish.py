@@ -0,0 +1,195 @@
+"""
+Bulk publisher for trip files on Walrus.
+
+Uploads every trip JSON in a directory (or listed in a manifest, one path
+per line) with a bounded pool of worker threads, each on its own pooled
+session. Connection errors, timeouts, 429 and 5xx responses are retried
+with exponential backoff (walrus.upload_with_retries()); other errors
+fail the trip and the rest carry on.
+
+Every finished trip is appended to a journal (JSON lines, flushed as it
+goes), so an interrupted run picks up where it stopped: files whose size
+and modification time match their journal entry for the same publisher
+are not even read. Trips
+whose content hash is in the BlobIndex for the publisher resolve without
+a request, so re-publishing a catalogue only sends what changed.
+
+    python walrus_publish.py trips/                          # journal: trips/.walrus_journal.jsonl
+    python walrus_publish.py manifest.txt --workers 8 --epochs 20
+    python walrus_publish.py trips/ --publisher-url http://127.0.0.1:8080   # local stand-in
+
+Files are read (plain or gzip JSON) and sent encoded like
+walrus.upload_trip(), under the same walrus.trip_hash(), so a trip
+published from a file and the same trip uploaded from the editor share
+one index entry.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import walrus
+from walrus_index import BlobIndex
+
+MAX_WORKERS = 4  # Uploads in flight
+JOURNAL_NAME = ".walrus_journal.jsonl"
+PROGRESS_EVERY = 100  # Trips between progress lines
+
+
+def list_trips(source):
+    """(base directory, paths relative to it) of the trips in a directory or manifest"""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths += [os.path.relpath(os.path.join(root, name), source)
+                      for name in files if name.endswith(".json")]
+        return source, sorted(paths)
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return os.path.dirname(source) or ".", [line for line in lines if line and not line.startswith("#")]
+
+
+class Journal:
+    """Append-only record of published trips, keyed by publisher URL and relative path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut short by an interruption
+                    self.entries[entry.get("publisher_url"), entry["path"]] = entry
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def done(self, publisher_url, rel, stat):
+        """The entry for rel if the file is unchanged since it was published to publisher_url"""
+        entry = self.entries.get((publisher_url.rstrip("/"), rel))
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def record(self, entry):
+        with self._lock:
+            self.entries[entry["publisher_url"], entry["path"]] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PublishStats:
+    def __init__(self, total):
+        self.total = total
+        self.uploaded = 0
+        self.resumed = 0  # Unchanged since the journal entry
+        self.indexed = 0  # Content already on Walrus
+        self.failed = {}  # path -> error
+        self.retries = 0
+        self.bytes_sent = 0
+        self.interrupted = False
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def fail(self, rel, error):
+        with self._lock:
+            self.failed[rel] = error
+
+    @property
+    def finished(self):
+        return self.uploaded + self.resumed + self.indexed + len(self.failed)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return (
+            f"{self.finished}/{self.total} trips in {elapsed:.1f}s: {self.uploaded} uploaded, "
+            f"{self.indexed} already on Walrus, {self.resumed} resumed, {len(self.failed)} failed, "
+            f"{self.retries} retries; {self.bytes_sent / 1e6:.2f} MB sent "
+            f"({self.bytes_sent / 1e6 / max(elapsed, 1e-9):.2f} MB/s, {self.uploaded / max(elapsed, 1e-9):.1f} uploads/s)"
+        )
+
+
+def publish_trip(base, rel, journal, index, stats, publisher_url, epochs, max_retries):
+    path = os.path.join(base, rel)
+    try:
+        stat = os.stat(path)
+        if journal.done(publisher_url, rel, stat) is not None:
+            stats.add("resumed")
+            return
+        with open(path, "rb") as f:
+            trip = walrus.read_trip(f.read())
+        content_hash = walrus.trip_hash(trip)
+        blob = index.get(publisher_url, content_hash) if index is not None else None
+        if blob is not None:
+            stats.add("indexed")
+        else:
+            data, _ = walrus.encode_trip(trip)
+            response = walrus.upload_with_retries(data, publisher_url, epochs, max_retries,
+                                                  on_retry=lambda: stats.add("retries"))
+            blob = walrus.blob_info(response)
+            if index is not None:
+                index.put(publisher_url, content_hash, blob, epochs, len(data))
+            stats.add("uploaded")
+            stats.add("bytes_sent", len(data))
+        journal.record({"publisher_url": publisher_url.rstrip("/"), "path": rel, "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns, "content_hash": content_hash, **blob})
+    except Exception as e:
+        stats.fail(rel, str(e))
+        print(f"Failed: {rel}: {e}")
+    finally:
+        if stats.finished % PROGRESS_EVERY == 0:
+            print(f"{stats.finished}/{stats.total} trips", flush=True)
+
+
+def publish(source, publisher_url=walrus.PUBLISHER_URL, epochs=walrus.EPOCHS, workers=MAX_WORKERS,
+            max_retries=walrus.MAX_RETRIES, journal_path=None, index=None):
+    """Publish every trip in a directory or manifest; returns PublishStats"""
+    base, paths = list_trips(source)
+    journal = Journal(journal_path or os.path.join(base, JOURNAL_NAME))
+    stats = PublishStats(len(paths))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for rel in paths:
+            pool.submit(publish_trip, base, rel, journal, index, stats, publisher_url, epochs, max_retries)
+        pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        # Uploads in flight still finish and reach the journal; the rest are picked up by the next run
+        print("Interrupted, waiting for the uploads in flight (run again to resume)")
+        stats.interrupted = True
+        pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        journal.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a directory or manifest of trips to Walrus")
+    parser.add_argument("source", help="directory of trip JSON files, or a manifest with one path per line")
+    parser.add_argument("--publisher-url", default=walrus.PUBLISHER_URL)
+    parser.add_argument("--epochs", type=int, default=walrus.EPOCHS)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--retries", type=int, default=walrus.MAX_RETRIES)
+    parser.add_argument("--journal", help=f"progress journal (default: {JOURNAL_NAME} next to the trips)")
+    parser.add_argument("--no-index", action="store_true", help="upload even if the content is in the blob index")
+    args = parser.parse_args()
+
+    stats = publish(args.source, args.publisher_url, args.epochs, args.workers, args.retries, args.journal,
+                    index=None if args.no_index else BlobIndex())
+    print(stats.summary())
+    return 1 if stats.failed or stats.interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())